@@ -0,0 +1,322 @@
+from bisect import bisect_left, insort
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Container, Dict, Iterable, List, Optional, Tuple, Union
+from models import Factura
+
+
+class TotalesFacturas:
+    '''
+    Totales acumulados de un conjunto de facturas
+    '''
+
+    __slots__ = ('num_facturas', 'total', 'pagado', 'pendiente')
+
+    def __init__(self):
+        self.num_facturas = 0
+        self.total = 0.0
+        self.pagado = 0.0
+        self.pendiente = 0.0
+
+    def sumar_estado(self, monto: float, estado: str, signo: int = 1):
+        '''
+        Suma ( o resta con signo=-1 ) el monto en la columna de su estado
+        '''
+
+        if estado == "Pagada":
+            self.pagado += signo * monto
+        elif estado == "Pendiente":
+            self.pendiente += signo * monto
+
+    def sumar(self, factura: Factura, signo: int = 1):
+        '''
+        Añade ( o quita con signo=-1 ) una factura a los totales
+        '''
+
+        self.num_facturas += signo
+        self.total += signo * factura.monto
+        self.sumar_estado(factura.monto, factura.estado, signo)
+
+    def to_dict(self) -> dict:
+        return {
+            'num_facturas': self.num_facturas,
+            'total': self.total,
+            'pagado': self.pagado,
+            'pendiente': self.pendiente
+        }
+
+
+@lru_cache(maxsize=4096)
+def clave_mes(ordinal: int) -> str:
+    '''
+    Clave "aaaa-mm" del mes de una fecha ordinal
+    '''
+
+    fecha = date.fromordinal(ordinal)
+    return f"{fecha.year:04d}-{fecha.month:02d}"
+
+
+@lru_cache(maxsize=4096)
+def clave_trimestre(ordinal: int) -> str:
+    '''
+    Clave "aaaa-Tn" del trimestre de una fecha ordinal
+    '''
+
+    fecha = date.fromordinal(ordinal)
+    return f"{fecha.year:04d}-T{(fecha.month - 1) // 3 + 1}"
+
+
+#Funcion de clave de cada periodo de los informes
+CLAVES_PERIODO = {"mes": clave_mes, "trimestre": clave_trimestre}
+
+#Tramos de antiguedad de las facturas pendientes: (dias minimos, dias maximos o None, etiqueta)
+TRAMOS_ANTIGUEDAD = ((0, 30, "0-30 dias"), (31, 60, "31-60 dias"), (61, 90, "61-90 dias"),
+                     (91, None, "mas de 90 dias"))
+
+
+def agrupar_facturas(facturas: Iterable[Factura], por: Union[str, Callable[[Factura], str]] = "cliente"
+                     ) -> Dict[str, TotalesFacturas]:
+    '''
+    Totales de las facturas agrupados por cliente, estado, mes o trimestre
+
+    Args:
+    facturas : facturas a agrupar
+    por : "cliente", "estado", "mes" ( clave "aaaa-mm" ), "trimestre" ( clave "aaaa-Tn" ) o
+          una funcion factura -> clave
+
+    returns:
+    Diccionario clave -> TotalesFacturas
+    '''
+
+    if callable(por):
+        clave = por
+    elif por == "cliente":
+        clave = lambda factura: factura.id_cliente
+    elif por == "estado":
+        clave = lambda factura: factura.estado
+    elif por in CLAVES_PERIODO:
+        clave_periodo = CLAVES_PERIODO[por]
+        clave = lambda factura: clave_periodo(factura.fecha_emision_ordinal)
+    else:
+        raise ValueError(f"agrupacion no valida: {por}")
+
+    resultado: Dict[str, TotalesFacturas] = {}
+    for factura in facturas:
+        k = clave(factura)
+        totales = resultado.get(k)
+        if totales is None:
+            totales = resultado[k] = TotalesFacturas()
+        totales.sumar(factura)
+
+    return resultado
+
+
+def ingresos_por_periodo(facturas: Iterable[Factura], periodo: str = "mes") -> Dict[str, Dict[str, TotalesFacturas]]:
+    '''
+    Totales de las facturas por periodo y, dentro de cada periodo, por estado
+
+    Args:
+    facturas : facturas a agrupar ( si vienen en orden de fecha, los periodos quedan en orden )
+    periodo : "mes" o "trimestre"
+
+    returns:
+    Diccionario periodo -> {estado -> TotalesFacturas}
+    '''
+
+    clave_periodo = CLAVES_PERIODO.get(periodo)
+    if clave_periodo is None:
+        raise ValueError(f"periodo no valido: {periodo}")
+
+    resultado: Dict[str, Dict[str, TotalesFacturas]] = {}
+    for factura in facturas:
+        por_estado = resultado.get(clave_periodo(factura.fecha_emision_ordinal))
+        if por_estado is None:
+            por_estado = resultado[clave_periodo(factura.fecha_emision_ordinal)] = {}
+        totales = por_estado.get(factura.estado)
+        if totales is None:
+            totales = por_estado[factura.estado] = TotalesFacturas()
+        totales.sumar(factura)
+
+    return resultado
+
+
+#Metricas de TotalesFacturas por las que se pueden ordenar los clientes
+METRICAS_RANKING = ("total", "pagado", "pendiente", "num_facturas")
+
+
+class RankingClientes:
+    '''
+    Clientes ordenados de mayor a menor por cada metrica de sus totales
+
+    Cada metrica es una lista ordenada de (-valor, id_cliente); al cambiar
+    los totales de un cliente su entrada se mueve con busqueda binaria y el
+    top-N es un corte del principio de la lista, sin ordenar nada. A igual
+    valor va primero el ID menor
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el ranking vacio
+        '''
+
+        self._listas: Dict[str, List[Tuple[float, str]]] = {metrica: [] for metrica in METRICAS_RANKING}
+        self._claves: Dict[str, Tuple[float, ...]] = {}   # ID -> valores negados con los que esta en cada lista
+
+    @staticmethod
+    def _valores(totales: TotalesFacturas) -> Tuple[float, ...]:
+        return tuple(-getattr(totales, metrica) for metrica in METRICAS_RANKING)
+
+    def construir(self, por_cliente: Dict[str, TotalesFacturas]):
+        '''
+        Sustituye el contenido por los totales de todos los clientes ordenados de una vez
+        '''
+
+        self._claves = {id_cliente: self._valores(totales) for id_cliente, totales in por_cliente.items()}
+        for i, metrica in enumerate(METRICAS_RANKING):
+            self._listas[metrica] = sorted((valores[i], id_cliente) for id_cliente, valores in self._claves.items())
+
+    def actualizar(self, id_cliente: str, totales: TotalesFacturas):
+        '''
+        Recoloca al cliente en las metricas cuyo valor ha cambiado
+        '''
+
+        anteriores = self._claves.get(id_cliente)
+        nuevos = self._valores(totales)
+        if anteriores == nuevos:
+            return
+
+        for i, metrica in enumerate(METRICAS_RANKING):
+            if anteriores is not None:
+                if anteriores[i] == nuevos[i]:
+                    continue
+                lista = self._listas[metrica]
+                del lista[bisect_left(lista, (anteriores[i], id_cliente))]
+            insort(self._listas[metrica], (nuevos[i], id_cliente))
+
+        self._claves[id_cliente] = nuevos
+
+    def top(self, metrica: str, n: int, validos: Container[str] = None) -> List[Tuple[str, float]]:
+        '''
+        Los n clientes con mayor valor de la metrica
+
+        Args:
+        metrica : una de METRICAS_RANKING
+        n : numero de clientes
+        validos : si se indica, se saltan los IDs que no esten ( p.ej. clientes de facturas huerfanas )
+
+        returns:
+        Lista de (id_cliente, valor) de mayor a menor
+
+        Raises:
+        ValueError si la metrica no existe
+        '''
+
+        lista = self._listas.get(metrica)
+        if lista is None:
+            raise ValueError(f"metrica no valida: {metrica}")
+        if validos is None:
+            return [(id_cliente, -valor) for valor, id_cliente in lista[:n]]
+
+        resultado = []
+        for valor, id_cliente in lista:
+            if len(resultado) == n:
+                break
+            if id_cliente in validos:
+                resultado.append((id_cliente, -valor))
+        return resultado
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+
+class AgregadosFinancieros:
+    '''
+    Totales por cliente y del sistema mantenidos de forma incremental
+    '''
+
+    def __init__(self):
+        '''
+        Inicia los agregados vacios
+        '''
+
+        self.por_cliente: Dict[str, TotalesFacturas] = {}
+        self.sistema = TotalesFacturas()
+        self.ranking: Optional[RankingClientes] = None   # Se construye en la primera consulta
+
+    def _recolocar(self, id_cliente: str, totales: TotalesFacturas):
+        if self.ranking is not None:
+            self.ranking.actualizar(id_cliente, totales)
+
+    def agregar_factura(self, factura: Factura):
+        '''
+        Suma una factura nueva a su cliente y al sistema
+        '''
+
+        totales = self.por_cliente.get(factura.id_cliente)
+        if totales is None:
+            totales = self.por_cliente[factura.id_cliente] = TotalesFacturas()
+
+        totales.sumar(factura)
+        self.sistema.sumar(factura)
+        self._recolocar(factura.id_cliente, totales)
+
+    def quitar_factura(self, factura: Factura):
+        '''
+        Resta una factura de su cliente y del sistema ( antes de sustituirla )
+        '''
+
+        totales = self.por_cliente.get(factura.id_cliente)
+        if totales is not None:
+            totales.sumar(factura, -1)
+            self._recolocar(factura.id_cliente, totales)
+        self.sistema.sumar(factura, -1)
+
+    def cambiar_estado(self, factura: Factura, estado_anterior: str):
+        '''
+        Mueve el monto de la factura del estado anterior a su estado actual
+        '''
+
+        for totales in (self.por_cliente[factura.id_cliente], self.sistema):
+            totales.sumar_estado(factura.monto, estado_anterior, -1)
+            totales.sumar_estado(factura.monto, factura.estado)
+        self._recolocar(factura.id_cliente, self.por_cliente[factura.id_cliente])
+
+    def cargar_totales(self, por_cliente: Dict[str, TotalesFacturas], sistema: TotalesFacturas):
+        '''
+        Sustituye los agregados por totales ya calculados ( p.ej. sobre columnas )
+        '''
+
+        self.por_cliente = por_cliente
+        self.sistema = sistema
+        self.ranking = None
+
+    def cliente(self, id_cliente: str) -> TotalesFacturas:
+        '''
+        Devuelve los totales del cliente ( vacios si no tiene facturas )
+        '''
+
+        totales = self.por_cliente.get(id_cliente)
+        return totales if totales is not None else TotalesFacturas()
+
+    def top_clientes(self, metrica: str = "total", n: int = 10,
+                     validos: Container[str] = None) -> List[Tuple[str, float]]:
+        '''
+        Los n clientes con mayor valor de la metrica ( ver RankingClientes.top )
+
+        La primera consulta ordena una vez a todos los clientes; despues el
+        ranking se mantiene al dia con cada factura y cambio de estado
+        '''
+
+        if self.ranking is None:
+            self.ranking = RankingClientes()
+            self.ranking.construir(self.por_cliente)
+        return self.ranking.top(metrica, n, validos)
+
+    def limpiar(self):
+        '''
+        Vacia los agregados
+        '''
+
+        self.por_cliente.clear()
+        self.sistema = TotalesFacturas()
+        self.ranking = None
@@ -0,0 +1,601 @@
+import json
+import os
+from contextlib import nullcontext
+from typing import Callable, Dict, List, MutableMapping, Optional, Tuple
+from models import Cliente, Factura, numero_id
+from indices import IndiceEmail
+from diario import DiarioOperaciones
+from lector_json import cargar_registros
+from facturas_columnares import FacturasColumnares
+from bloqueo import BloqueoArchivo, firma_archivo, sincronizar_directorio
+from snapshot_binario import ErrorSnapshot, cargar_snapshot, comprobar_snapshot, guardar_snapshot
+from manifiesto import Manifiesto, NOMBRE_MANIFIESTO, VERSION_ESQUEMA
+
+
+class Almacenamiento:
+    '''
+    Interfaz comun de los backends de persistencia del CRM
+    '''
+
+    #True si los registros se leen bajo demanda en lugar de cargarse todos al inicio
+    perezoso = False
+
+    def cargar(self) -> Tuple[MutableMapping[str, Cliente], MutableMapping[str, Factura]]:
+        '''
+        Carga los datos guardados
+
+        returns:
+        Tupla (clientes, facturas) con mapeos ID -> objeto
+        '''
+        raise NotImplementedError
+
+    def contadores(self, clientes, facturas) -> Tuple[int, int]:
+        '''
+        Calcula los siguientes contadores de clientes y facturas
+
+        returns:
+        Tupla (contador_clientes, contador_facturas)
+        '''
+
+        contador_clientes = 1
+        contador_facturas = 1
+
+        if clientes:
+            contador_clientes = max([numero_id(id_u) for id_u in clientes.keys()]) + 1
+
+        if facturas:
+            contador_facturas = max([numero_id(nf) for nf in facturas.keys()]) + 1
+
+        return contador_clientes, contador_facturas
+
+    def crear_indice_email(self, clientes) -> IndiceEmail:
+        '''
+        Construye el indice de emails de los clientes
+        '''
+
+        indice = IndiceEmail()
+        for id_cliente, cliente in clientes.items():
+            indice.agregar(cliente.email, id_cliente)
+        return indice
+
+    def guardar_cliente(self, cliente: Cliente):
+        '''
+        Persiste un cliente nuevo o modificado
+        '''
+        raise NotImplementedError
+
+    def guardar_factura(self, factura: Factura):
+        '''
+        Persiste una factura nueva o modificada
+        '''
+        raise NotImplementedError
+
+    def guardar_lote(self, clientes: List[Cliente], facturas: List[Factura]):
+        '''
+        Persiste de una vez un lote de clientes y facturas nuevos o modificados
+        '''
+
+        for cliente in clientes:
+            self.guardar_cliente(cliente)
+        for factura in facturas:
+            self.guardar_factura(factura)
+
+    def marcar_modificados(self, clientes: List[Cliente], facturas: List[Factura]):
+        '''
+        Avisa de registros modificados en memoria que se van a guardar
+
+        Los backends que leen bajo demanda los mantienen en memoria hasta
+        que esten guardados; por defecto no hace nada
+        '''
+
+    def guardar_todo(self, clientes, facturas) -> bool:
+        '''
+        Guarda todos los datos de una vez
+
+        returns:
+        True si se guardo correctamente, False si no
+        '''
+        raise NotImplementedError
+
+    def compactar(self, clientes, facturas):
+        '''
+        Reorganiza el almacenamiento ( por defecto guarda todo )
+        '''
+        self.guardar_todo(clientes, facturas)
+
+    def bloquear(self, compartido: bool = False):
+        '''
+        Bloqueo entre procesos para una secuencia de lecturas o escrituras
+
+        Args:
+        compartido : True para leer, False para escribir
+
+        returns:
+        Gestor de contexto ( with almacenamiento.bloquear(): ... )
+        '''
+        return nullcontext()
+
+    def verificar_archivos(self) -> List[str]:
+        '''
+        Comprueba que los archivos guardados estan completos y sin cambios externos
+
+        returns:
+        Lista de problemas encontrados ( vacia si todo esta bien )
+        '''
+        return []
+
+    def refrescar(self) -> Optional[list]:
+        '''
+        Comprueba si otro proceso ha modificado los datos desde la ultima lectura
+
+        returns:
+        Lista de cambios (tipo, anterior, nuevo) ya aplicados sobre los datos
+        cargados ( vacia si no hay cambios ), o None si hay que volver a cargarlo todo
+        '''
+        return []
+
+    def cerrar(self):
+        '''
+        Libera los recursos del backend
+        '''
+        pass
+
+
+class AlmacenamientoJSON(Almacenamiento):
+    '''
+    Backend de archivos JSON ( snapshot ) mas diario de operaciones
+    '''
+
+    def __init__(self, archivo_clientes: str = "clientes.json", archivo_facturas: str = "facturas.json",
+                 archivo_diario: str = "diario.jsonl", limite_diario: int = 10000, fsync: bool = True,
+                 progreso: Callable = None, columnar: bool = False, archivo_binario: str = None,
+                 formato: str = "json"):
+        '''
+        Inicia el backend
+
+        Args:
+        archivo_clientes : snapshot de clientes
+        archivo_facturas : snapshot de facturas
+        archivo_diario : diario de operaciones
+        limite_diario : operaciones antes de compactar automaticamente ( 0 = nunca )
+        fsync : fuerza a disco cada operacion del diario
+        progreso : funcion (nombre, bytes_leidos, bytes_totales, registros) para informar de la carga
+        columnar : guarda las facturas en memoria por columnas ( FacturasColumnares )
+        archivo_binario : snapshot binario ( por defecto crm.snap junto a los JSON )
+        formato : formato de los snapshots que se escriben, "json" o "binario"
+        '''
+
+        if formato not in ("json", "binario"):
+            raise ValueError(f"formato de snapshot no valido: {formato}")
+
+        self.archivos_clientes = archivo_clientes
+        self.archivos_facturas = archivo_facturas
+        self.diario = DiarioOperaciones(archivo_diario, fsync=fsync)
+        self.limite_diario = limite_diario
+        self.progreso = progreso
+        self.columnar = columnar
+        self.errores_carga: List[Tuple[str, str]] = []
+        self._clientes: Dict[str, Cliente] = {}
+        self._facturas: MutableMapping[str, Factura] = {}
+        self._cargado = False   # Sin una carga completa no se compacta ( se sobrescribiria con datos a medias )
+
+        #Archivos auxiliares en el directorio de los datos
+        directorio = os.path.dirname(os.path.abspath(archivo_clientes))
+        self.directorio = directorio
+        self.archivo_marca = os.path.join(directorio, "snapshot.commit")
+        self.archivo_manifiesto = os.path.join(directorio, NOMBRE_MANIFIESTO)
+        self.bloqueo = BloqueoArchivo(os.path.join(directorio, "crm.lock"))
+        self._firma_snapshot = None
+
+        self.archivo_binario = archivo_binario or os.path.join(directorio, "crm.snap")
+        self.formato = formato
+        self._contadores: Tuple[int, int] = None   # Contadores leidos del snapshot binario o del manifiesto
+
+    def bloquear(self, compartido: bool = False):
+        return self.bloqueo(compartido)
+
+    def _firmas(self) -> tuple:
+        return (firma_archivo(self.archivos_clientes), firma_archivo(self.archivos_facturas),
+                firma_archivo(self.archivo_binario))
+
+    def _usar_binario(self) -> bool:
+        '''
+        True si hay snapshot binario y no es mas antiguo que los archivos JSON
+        '''
+
+        firma_binario = firma_archivo(self.archivo_binario)
+        if firma_binario is None:
+            return False
+
+        for ruta in (self.archivos_clientes, self.archivos_facturas):
+            firma = firma_archivo(ruta)
+            if firma is not None and firma[2] > firma_binario[2]:
+                return False
+        return True
+
+    def _temporales(self) -> List[Tuple[str, str]]:
+        return [(self.archivos_clientes + ".tmp", self.archivos_clientes),
+                (self.archivos_facturas + ".tmp", self.archivos_facturas),
+                (self.archivo_manifiesto + ".tmp", self.archivo_manifiesto)]
+
+    def _recuperar_snapshot(self):
+        '''
+        Termina o descarta un snapshot interrumpido por una caida
+
+        Si existe la marca de confirmacion los temporales ya estaban completos
+        y se terminan de renombrar; si no, se borran y queda el snapshot anterior
+        '''
+
+        if os.path.exists(self.archivo_marca):
+            for temporal, destino in self._temporales():
+                if os.path.exists(temporal):
+                    os.replace(temporal, destino)
+            sincronizar_directorio(self.directorio)
+            os.remove(self.archivo_marca)
+            print("Aviso: se ha completado un guardado interrumpido")
+        else:
+            for temporal, _ in self._temporales():
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+
+    def cargar(self):
+        '''
+        Carga los snapshots JSON y aplica el diario encima
+        '''
+
+        #Un guardado a medias se resuelve antes de leer nada
+        if os.path.exists(self.archivo_marca) or any(os.path.exists(t) for t, _ in self._temporales()):
+            with self.bloquear():
+                self._recuperar_snapshot()
+
+        self._cargado = False
+        with self.bloquear(compartido=True):
+            clientes, facturas = self._cargar()
+        self._cargado = True
+        return clientes, facturas
+
+    def _cargar(self):
+        clientes: Dict[str, Cliente] = {}
+        facturas: MutableMapping[str, Factura] = FacturasColumnares() if self.columnar else {}
+        self.errores_carga = []
+        self._firma_snapshot = self._firmas()
+        self._contadores = None
+        binario = False
+
+        #El snapshot binario se prefiere si esta al dia ( no hay que parsear JSON ni fechas )
+        if self._usar_binario():
+            try:
+                self._contadores = cargar_snapshot(self.archivo_binario, clientes, facturas)
+                binario = True
+            except (OSError, ErrorSnapshot) as e:
+                print(f"Aviso: no se pudo leer {self.archivo_binario} ( {e} ), se cargan los JSON")
+                self.errores_carga.append((None, f"snapshot binario: {e}"))
+                clientes.clear()
+                facturas = FacturasColumnares() if self.columnar else {}
+
+        if not binario:
+            manifiesto = self._leer_manifiesto()
+
+            #Carga los clientes registro a registro
+            if os.path.exists(self.archivos_clientes):
+                self.errores_carga += cargar_registros(self.archivos_clientes, Cliente.from_dict, clientes,
+                                                       "clientes", self.progreso)
+
+            #Carga facturas registro a registro
+            if os.path.exists(self.archivos_facturas):
+                self.errores_carga += cargar_registros(self.archivos_facturas, Factura.from_dict, facturas,
+                                                       "facturas", self.progreso)
+
+            #Con el manifiesto al dia los contadores no requieren recorrer todos los IDs
+            if manifiesto is not None:
+                self._contadores = self._contadores_manifiesto(manifiesto, clientes, facturas)
+
+        self._clientes = clientes
+        self._facturas = facturas
+
+        #Aplicamos las operaciones del diario sobre el snapshot
+        cambios = self._aplicar_diario(0)
+        if self._contadores is not None:
+            self._avanzar_contadores(cambios)
+
+        return clientes, facturas
+
+    def _leer_manifiesto(self) -> Optional[Manifiesto]:
+        '''
+        Lee el manifiesto del snapshot si existe y coincide con los archivos
+
+        Un manifiesto que no coincide ( archivos incompletos, cambiados a mano
+        o guardados por una version sin manifiesto ) se avisa y se ignora
+        '''
+
+        try:
+            manifiesto = Manifiesto.leer(self.archivo_manifiesto)
+        except (OSError, ValueError) as e:
+            self._ignorar_manifiesto(str(e))
+            return None
+
+        if manifiesto is None:
+            return None
+
+        if manifiesto.version_esquema > VERSION_ESQUEMA:
+            self._ignorar_manifiesto(f"version de esquema {manifiesto.version_esquema} no soportada")
+            return None
+
+        cambiados = manifiesto.archivos_cambiados(os.path.dirname(self.archivo_manifiesto))
+        if cambiados:
+            self._ignorar_manifiesto(f"{', '.join(cambiados)} no coincide ( archivo incompleto o "
+                                     f"modificado fuera del CRM )")
+            return None
+
+        return manifiesto
+
+    def _contadores_manifiesto(self, manifiesto: Manifiesto, clientes, facturas) -> Optional[Tuple[int, int]]:
+        '''
+        Contadores del manifiesto si el numero de registros cargados coincide
+        '''
+
+        if (len(clientes), len(facturas)) != (manifiesto.num_clientes, manifiesto.num_facturas):
+            self._ignorar_manifiesto("el numero de registros cargados no coincide")
+            return None
+        return manifiesto.contador_clientes, manifiesto.contador_facturas
+
+    def _ignorar_manifiesto(self, motivo: str):
+        print(f"Aviso: se ignora el manifiesto: {motivo}; los contadores se recalculan")
+        self.errores_carga.append((None, f"manifiesto: {motivo}"))
+
+    def _avanzar_contadores(self, cambios: list):
+        '''
+        Adelanta los contadores del snapshot binario o del manifiesto con los IDs añadidos por el diario
+        '''
+
+        contador_clientes, contador_facturas = self._contadores
+        for tipo, _, nuevo in cambios:
+            if tipo == "cliente":
+                contador_clientes = max(contador_clientes, numero_id(nuevo.id_cliente) + 1)
+            else:
+                contador_facturas = max(contador_facturas, numero_id(nuevo.numero_factura) + 1)
+        self._contadores = contador_clientes, contador_facturas
+
+    def contadores(self, clientes, facturas) -> Tuple[int, int]:
+        '''
+        Con snapshot binario los contadores vienen en su cabecera y con JSON en
+        el manifiesto ( sin recorrer los IDs )
+        '''
+
+        if self._contadores is not None:
+            return self._contadores
+        return super().contadores(clientes, facturas)
+
+    def _aplicar_diario(self, desde: int) -> list:
+        '''
+        Aplica las operaciones del diario a partir de una posicion
+
+        returns:
+        Lista de cambios (tipo, anterior, nuevo)
+        '''
+
+        cambios = []
+        for tipo, data in self.diario.leer(desde):
+            try:
+                cambio = self.aplicar_operacion(tipo, data)
+            except (KeyError, TypeError, ValueError) as e:
+                self.errores_carga.append((None, f"operacion {tipo} del diario invalida: {e}"))
+                print(f"Aviso: operacion {tipo} del diario invalida: {e}")
+                continue
+            if cambio is not None:
+                cambios.append((tipo,) + cambio)
+        return cambios
+
+    def aplicar_operacion(self, tipo: str, data: dict):
+        '''
+        Aplica una operacion del diario sobre los datos en memoria
+
+        Args:
+        tipo : "cliente" o "factura"
+        data : registro completo en formato diccionario
+
+        returns:
+        Tupla (anterior, nuevo) con el registro sustituido ( o None ) y el nuevo
+        '''
+
+        if tipo == "cliente":
+            cliente = Cliente.from_dict(data)
+            anterior = self._clientes.get(cliente.id_cliente)
+            self._clientes[cliente.id_cliente] = cliente
+            return anterior, cliente
+
+        elif tipo == "factura":
+            factura = Factura.from_dict(data)
+            anterior = self._facturas.get(factura.numero_factura)
+            self._facturas[factura.numero_factura] = factura
+            return anterior, factura
+
+        else:
+            print(f"Aviso: operacion desconocida en el diario: {tipo}")
+            return None
+
+    def refrescar(self) -> Optional[list]:
+        '''
+        Detecta cambios de otros procesos comparando la firma de los archivos
+
+        Si solo ha crecido el diario se aplican las operaciones nuevas; si
+        cambio el snapshot ( otro proceso compacto ) hay que recargar todo
+        '''
+
+        with self.bloquear(compartido=True):
+            if self._firmas() != self._firma_snapshot:
+                return None
+
+            firma_diario = firma_archivo(self.diario.ruta)
+            tam_diario = firma_diario[1] if firma_diario else 0
+            if tam_diario < self.diario.posicion:
+                return None
+            if tam_diario == self.diario.posicion:
+                return []
+
+            return self._aplicar_diario(self.diario.posicion)
+
+    def _diario_lleno(self, nuevas: int = 0) -> bool:
+        '''
+        True si toca compactar automaticamente: el diario llega al limite
+        con las operaciones nuevas y los datos en memoria se cargaron completos
+        '''
+
+        return bool(self.limite_diario) and self._cargado and len(self.diario) + nuevas >= self.limite_diario
+
+    def _registrar(self, tipo: str, data: dict):
+        '''
+        Guarda un cambio en el diario ( coste O(1) ) y compacta si crece demasiado
+        '''
+
+        with self.bloquear():
+            self.diario.registrar(tipo, data)
+
+            if self._diario_lleno():
+                self.compactar(self._clientes, self._facturas)
+
+    def guardar_cliente(self, cliente: Cliente):
+        self._registrar("cliente", cliente.to_dict())
+
+    def guardar_factura(self, factura: Factura):
+        self._registrar("factura", factura.to_dict())
+
+    def guardar_lote(self, clientes: List[Cliente], facturas: List[Factura]):
+        '''
+        Escribe el lote en el diario con una sola escritura, o directamente
+        un snapshot nuevo si el lote no cabe en el diario
+        '''
+
+        with self.bloquear():
+            if self._diario_lleno(len(clientes) + len(facturas)):
+                self.compactar(self._clientes, self._facturas)
+                return
+
+            operaciones = [("cliente", c.to_dict()) for c in clientes]
+            operaciones += [("factura", f.to_dict()) for f in facturas]
+            self.diario.registrar_lote(operaciones)
+
+    @staticmethod
+    def _escribir_temporal(ruta: str, datos: dict):
+        '''
+        Escribe un archivo JSON completo y lo fuerza a disco
+        '''
+
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def guardar_todo(self, clientes, facturas) -> bool:
+        '''
+        Guarda un snapshot completo en el formato configurado ( JSON o binario )
+        '''
+
+        return self.exportar_snapshot(self.formato, clientes, facturas)
+
+    def exportar_snapshot(self, formato: str, clientes, facturas) -> bool:
+        '''
+        Guarda un snapshot completo en el formato indicado
+
+        Args:
+        formato : "json" o "binario"
+
+        returns:
+        True si se guardo correctamente, False si no
+        '''
+
+        try:
+            with self.bloquear():
+                if formato == "binario":
+                    contador_clientes, contador_facturas = Almacenamiento.contadores(self, clientes, facturas)
+                    guardar_snapshot(self.archivo_binario, clientes, facturas, contador_clientes,
+                                     contador_facturas)
+                    sincronizar_directorio(self.directorio)
+                else:
+                    self._guardar_json(clientes, facturas)
+
+                self._firma_snapshot = self._firmas()
+
+            return True
+
+        except Exception as e:
+            print(f"Error al guardar los datos: {e}")
+            return False
+
+    def _guardar_json(self, clientes, facturas):
+        '''
+        Guardamos los archivos JSON completos ( snapshot ) de forma atomica
+
+        Ambos archivos se escriben en temporales; una marca de confirmacion
+        indica que estan completos y despues se renombran sobre los
+        originales. Tras una caida, cargar() termina o descarta el guardado,
+        asi clientes, facturas y manifiesto nunca quedan a medias ni desparejados
+        '''
+
+        (temporal_clientes, _), (temporal_facturas, _), (temporal_manifiesto, _) = self._temporales()
+
+        #Guardamos clientes
+        datos = {id_u: cliente.to_dict() for id_u, cliente in clientes.items()}
+        self._escribir_temporal(temporal_clientes, datos)
+
+        #Guardamos facturas
+        datos = {num_f: factura.to_dict() for num_f, factura in facturas.items()}
+        self._escribir_temporal(temporal_facturas, datos)
+
+        #Manifiesto con contadores, numero de registros y checksums de los temporales ya completos
+        manifiesto = Manifiesto(*Almacenamiento.contadores(self, clientes, facturas), len(clientes), len(facturas))
+        directorio_manifiesto = os.path.dirname(self.archivo_manifiesto)
+        for temporal, destino in ((temporal_clientes, self.archivos_clientes),
+                                  (temporal_facturas, self.archivos_facturas)):
+            manifiesto.describir_archivo(os.path.relpath(destino, directorio_manifiesto), temporal)
+        manifiesto.escribir(temporal_manifiesto)
+
+        #Confirmamos y renombramos
+        self._escribir_temporal(self.archivo_marca + ".tmp", {'confirmado': True})
+        os.replace(self.archivo_marca + ".tmp", self.archivo_marca)
+        sincronizar_directorio(self.directorio)
+
+        for temporal, destino in self._temporales():
+            os.replace(temporal, destino)
+        sincronizar_directorio(self.directorio)
+        os.remove(self.archivo_marca)
+
+    def verificar_archivos(self) -> List[str]:
+        '''
+        Comprueba el checksum del snapshot binario ( si es el que se carga ) y
+        el tamaño y checksum de los JSON contra su manifiesto
+        '''
+
+        problemas = []
+        binario = self._usar_binario()
+        if binario:
+            try:
+                comprobar_snapshot(self.archivo_binario)
+            except (OSError, ErrorSnapshot) as e:
+                problemas.append(f"{os.path.basename(self.archivo_binario)}: {e}")
+
+        try:
+            manifiesto = Manifiesto.leer(self.archivo_manifiesto)
+        except (OSError, ValueError) as e:
+            return problemas + [f"{NOMBRE_MANIFIESTO}: {e}"]
+
+        if manifiesto is None:
+            if not binario and any(os.path.exists(ruta) for ruta in (self.archivos_clientes, self.archivos_facturas)):
+                problemas.append("el snapshot JSON no tiene manifiesto ( se crea al guardarlo )")
+            return problemas
+
+        directorio = os.path.dirname(self.archivo_manifiesto)
+        return problemas + [f"{nombre} no coincide con el manifiesto"
+                            for nombre in manifiesto.archivos_corruptos(directorio)]
+
+    def compactar(self, clientes, facturas):
+        '''
+        Vuelca los datos en un snapshot nuevo y vacia el diario
+        '''
+
+        with self.bloquear():
+            if self.guardar_todo(clientes, facturas):
+                self.diario.truncar()
+
+    def cerrar(self):
+        self.diario.cerrar()
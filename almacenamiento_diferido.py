@@ -0,0 +1,199 @@
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from models import Cliente, Factura
+from almacenamiento import Almacenamiento
+
+#Espera maxima ( segundos ) entre reintentos de un volcado que falla
+ESPERA_MAXIMA = 30.0
+
+
+class AlmacenamientoDiferido(Almacenamiento):
+    '''
+    Envoltorio de escritura diferida ( write-behind ) sobre otro backend
+
+    guardar_cliente y guardar_factura solo marcan el registro como
+    pendiente y vuelven enseguida; un hilo en segundo plano escribe los
+    pendientes en un unico lote cada cierto intervalo o al llegar a un
+    numero de cambios. Varios cambios seguidos del mismo registro se
+    escriben una sola vez. cerrar(), compactar() y guardar_todo() vacian
+    antes los pendientes, y tambien se vacian al terminar el proceso
+
+    Los IDs nuevos no llegan a disco hasta el siguiente volcado, asi que
+    este modo es para un solo proceso escritor sobre los datos
+    '''
+
+    def __init__(self, interno: Almacenamiento, intervalo: float = 1.0, umbral: int = 500):
+        '''
+        Args:
+        interno : backend que hace las escrituras reales
+        intervalo : segundos maximos que un cambio puede esperar en memoria
+        umbral : numero de registros pendientes que fuerza un volcado inmediato
+        '''
+
+        self.interno = interno
+        self.intervalo = intervalo
+        self.umbral = max(1, umbral)
+        self.perezoso = interno.perezoso
+
+        self._clientes: Dict[str, Cliente] = {}
+        self._facturas: Dict[str, Factura] = {}
+        self._cerrojo = threading.RLock()       # Serializa volcados y escrituras del CRM
+        self._aviso = threading.Condition(threading.Lock())
+        self._parar = False
+        self.volcados = 0
+        self.ultimo_error: Optional[Exception] = None
+
+        self._hilo = threading.Thread(target=self._bucle, name="volcado-crm", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def __getattr__(self, nombre: str):
+        #El resto de atributos ( rutas, formato, errores de carga, ... ) son los del backend interno
+        if nombre == "interno":
+            raise AttributeError(nombre)
+        return getattr(self.interno, nombre)
+
+    @property
+    def pendientes(self) -> int:
+        return len(self._clientes) + len(self._facturas)
+
+    def _bucle(self):
+        '''
+        Hilo de volcado: espera al intervalo o a que se supere el umbral
+
+        Si un volcado falla ( disco lleno, sin permisos, ... ) se espera antes
+        de reintentar aunque se supere el umbral, el doble tras cada fallo
+        seguido hasta ESPERA_MAXIMA
+        '''
+
+        espera = 0.0
+        while True:
+            with self._aviso:
+                if espera:
+                    limite = time.monotonic() + espera
+                    while not self._parar and time.monotonic() < limite:
+                        self._aviso.wait(limite - time.monotonic())
+                elif not self._parar and self.pendientes < self.umbral:
+                    self._aviso.wait(self.intervalo)
+                if self._parar:
+                    return
+
+            if self.volcar():
+                espera = 0.0
+            else:
+                espera = min(espera * 2, ESPERA_MAXIMA) if espera else self.intervalo
+
+    def volcar(self) -> bool:
+        '''
+        Escribe ahora todos los registros pendientes en un solo lote
+
+        returns:
+        True si no queda nada pendiente, False si la escritura fallo
+        ( los registros se conservan para el siguiente intento )
+        '''
+
+        with self._cerrojo:
+            if not self.pendientes:
+                return True
+
+            clientes, self._clientes = self._clientes, {}
+            facturas, self._facturas = self._facturas, {}
+
+            try:
+                self.interno.guardar_lote(list(clientes.values()), list(facturas.values()))
+            except Exception as e:
+                #Los cambios hechos mientras tanto son mas recientes que los que fallaron
+                clientes.update(self._clientes)
+                facturas.update(self._facturas)
+                self._clientes, self._facturas = clientes, facturas
+                self.ultimo_error = e
+                print(f"Aviso: no se pudieron guardar {self.pendientes} cambios pendientes: {e}")
+                return False
+
+            self.volcados += 1
+            return True
+
+    def _marcar(self):
+        if self.pendientes >= self.umbral:
+            with self._aviso:
+                self._aviso.notify()
+
+    def cargar(self):
+        with self._cerrojo:
+            return self.interno.cargar()
+
+    def contadores(self, clientes, facturas):
+        return self.interno.contadores(clientes, facturas)
+
+    def crear_indice_email(self, clientes):
+        return self.interno.crear_indice_email(clientes)
+
+    def marcar_modificados(self, clientes: List[Cliente], facturas: List[Factura]):
+        self.interno.marcar_modificados(clientes, facturas)
+
+    def guardar_cliente(self, cliente: Cliente):
+        with self._cerrojo:
+            self.interno.marcar_modificados([cliente], [])
+            self._clientes[cliente.id_cliente] = cliente
+        self._marcar()
+
+    def guardar_factura(self, factura: Factura):
+        with self._cerrojo:
+            self.interno.marcar_modificados([], [factura])
+            self._facturas[factura.numero_factura] = factura
+        self._marcar()
+
+    def guardar_lote(self, clientes: List[Cliente], facturas: List[Factura]):
+        with self._cerrojo:
+            self.interno.marcar_modificados(clientes, facturas)
+            for cliente in clientes:
+                self._clientes[cliente.id_cliente] = cliente
+            for factura in facturas:
+                self._facturas[factura.numero_factura] = factura
+        self._marcar()
+
+    def guardar_todo(self, clientes, facturas) -> bool:
+        with self._cerrojo:
+            self.volcar()
+            return self.interno.guardar_todo(clientes, facturas)
+
+    def compactar(self, clientes, facturas):
+        with self._cerrojo:
+            self.volcar()
+            self.interno.compactar(clientes, facturas)
+
+    @contextmanager
+    def bloquear(self, compartido: bool = False):
+        #El bloqueo de archivo del backend no distingue hilos: primero el cerrojo del proceso
+        with self._cerrojo:
+            with self.interno.bloquear(compartido):
+                yield
+
+    def verificar_archivos(self):
+        with self._cerrojo:
+            self.volcar()
+            return self.interno.verificar_archivos()
+
+    def refrescar(self):
+        with self._cerrojo:
+            return self.interno.refrescar()
+
+    def cerrar(self):
+        '''
+        Detiene el hilo, vuelca los pendientes y cierra el backend interno
+        '''
+
+        if self._parar:
+            return
+
+        with self._aviso:
+            self._parar = True
+            self._aviso.notify()
+        self._hilo.join()
+
+        self.volcar()
+        self.interno.cerrar()
+        atexit.unregister(self.cerrar)
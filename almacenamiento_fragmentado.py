@@ -0,0 +1,287 @@
+import glob
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, MutableMapping, Set, Tuple
+from models import Cliente, Factura, EstadoFactura
+from almacenamiento import Almacenamiento, AlmacenamientoJSON
+from lector_json import cargar_registros
+from facturas_columnares import FacturasColumnares
+from bloqueo import firma_archivo, sincronizar_directorio
+from manifiesto import Manifiesto, NOMBRE_MANIFIESTO, VERSION_ESQUEMA
+
+
+_ESTADOS = tuple(EstadoFactura)
+_PATRON_FRAGMENTO = re.compile(r"clientes_(\d+)\.json$")
+
+
+def fragmento_de(id_cliente: str, num_fragmentos: int) -> int:
+    '''
+    Fragmento al que pertenecen un cliente y sus facturas ( hash estable del ID )
+    '''
+    return zlib.crc32(id_cliente.encode('utf-8')) % num_fragmentos
+
+
+def _leer_fragmento(ruta_clientes: str, ruta_facturas: str) -> Tuple[list, list, list]:
+    '''
+    Lee un fragmento ( se ejecuta en un proceso del pool )
+
+    Devuelve tuplas de valores en lugar de objetos: se envian al proceso
+    principal mas deprisa y alli se crean con desde_valores sin volver a
+    convertir fechas
+
+    returns:
+    Tupla (valores de clientes, valores de facturas, errores)
+    '''
+
+    clientes: Dict[str, Cliente] = {}
+    facturas: Dict[str, Factura] = {}
+    errores = []
+
+    if os.path.exists(ruta_clientes):
+        errores += cargar_registros(ruta_clientes, Cliente.from_dict, clientes, os.path.basename(ruta_clientes))
+    if os.path.exists(ruta_facturas):
+        errores += cargar_registros(ruta_facturas, Factura.from_dict, facturas, os.path.basename(ruta_facturas))
+
+    valores_clientes = [(c.id_cliente, c.nombre, c.apellidos, c.email, c.telefono, c.direccion,
+                         c.fecha_registro_ordinal) for c in clientes.values()]
+    valores_facturas = [(f.numero_factura, f.id_cliente, f.descripcion, f.monto, f.fecha_emision_ordinal,
+                         int(f.codigo_estado)) for f in facturas.values()]
+    return valores_clientes, valores_facturas, errores
+
+
+class AlmacenamientoFragmentado(AlmacenamientoJSON):
+    '''
+    Backend JSON repartido en fragmentos mas diario de operaciones
+
+    Cada cliente y sus facturas van al mismo fragmento segun el hash de su
+    ID ( fragmentos/clientes_NN.json y fragmentos/facturas_NN.json ). Los
+    fragmentos se leen en paralelo con un pool de procesos y al compactar
+    solo se reescriben los que tienen cambios. El manifiesto de los
+    fragmentos se guarda en el mismo directorio
+    '''
+
+    def __init__(self, archivo_clientes: str = "clientes.json", archivo_facturas: str = "facturas.json",
+                 archivo_diario: str = "diario.jsonl", directorio_fragmentos: str = None,
+                 num_fragmentos: int = 8, procesos: int = None, **opciones):
+        '''
+        Args:
+        archivo_clientes, archivo_facturas : snapshots sin fragmentar ( solo para migrarlos )
+        archivo_diario : diario de operaciones
+        directorio_fragmentos : directorio de los fragmentos ( por defecto fragmentos/ junto a los JSON )
+        num_fragmentos : numero de fragmentos con el que se guarda
+        procesos : procesos para la carga ( por defecto uno por CPU; 1 = sin pool )
+        opciones : resto de opciones de AlmacenamientoJSON ( limite_diario, fsync, progreso, columnar )
+        '''
+
+        if num_fragmentos < 1:
+            raise ValueError("hace falta al menos un fragmento")
+
+        super().__init__(archivo_clientes, archivo_facturas, archivo_diario, **opciones)
+        self.directorio_fragmentos = directorio_fragmentos or os.path.join(self.directorio, "fragmentos")
+        self.archivo_manifiesto = os.path.join(self.directorio_fragmentos, NOMBRE_MANIFIESTO)
+        self.num_fragmentos = num_fragmentos
+        self.procesos = procesos or os.cpu_count() or 1
+
+        self._sucios: Set[int] = set()         # Fragmentos con cambios desde el ultimo snapshot
+        self._fragmentos_cliente: Dict[str, int] = {}
+        self._todos_sucios = False              # Hay que reescribirlos todos ( migracion o cambio de N )
+
+    def _ruta_fragmento(self, tipo: str, numero: int) -> str:
+        return os.path.join(self.directorio_fragmentos, f"{tipo}_{numero:02d}.json")
+
+    def _fragmentos_existentes(self) -> List[int]:
+        numeros = []
+        for ruta in glob.glob(os.path.join(self.directorio_fragmentos, "clientes_*.json")):
+            coincidencia = _PATRON_FRAGMENTO.search(ruta)
+            if coincidencia:
+                numeros.append(int(coincidencia.group(1)))
+        return sorted(numeros)
+
+    def _fragmento(self, id_cliente: str) -> int:
+        numero = self._fragmentos_cliente.get(id_cliente)
+        if numero is None:
+            numero = self._fragmentos_cliente[id_cliente] = fragmento_de(id_cliente, self.num_fragmentos)
+        return numero
+
+    def _firmas(self) -> tuple:
+        return tuple(firma_archivo(self._ruta_fragmento(tipo, numero))
+                     for numero in self._fragmentos_existentes() for tipo in ("clientes", "facturas"))
+
+    def _temporales(self) -> List[Tuple[str, str]]:
+        temporales = []
+        for ruta in glob.glob(os.path.join(self.directorio_fragmentos, "*.json.tmp")):
+            temporales.append((ruta, ruta[:-len(".tmp")]))
+        return temporales
+
+    def _cargar(self):
+        clientes: Dict[str, Cliente] = {}
+        facturas: MutableMapping[str, Factura] = FacturasColumnares() if self.columnar else {}
+        self.errores_carga = []
+        self._firma_snapshot = self._firmas()
+        self._contadores = None
+        self._sucios = set()
+
+        existentes = self._fragmentos_existentes()
+        if not existentes:
+            #Datos sin fragmentar: se cargan como siempre y se reparten en la proxima compactacion
+            clientes, facturas = super()._cargar()
+            self._todos_sucios = bool(clientes)
+            return clientes, facturas
+
+        self._todos_sucios = len(existentes) != self.num_fragmentos or \
+            existentes[-1] >= self.num_fragmentos
+
+        manifiesto = self._leer_manifiesto()
+        rutas = [(self._ruta_fragmento("clientes", n), self._ruta_fragmento("facturas", n)) for n in existentes]
+        if self.procesos > 1 and len(rutas) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.procesos, len(rutas))) as pool:
+                resultados = list(pool.map(_leer_fragmento, *zip(*rutas)))
+        else:
+            resultados = [_leer_fragmento(*par) for par in rutas]
+
+        #Unimos los fragmentos en los mapeos del CRM
+        crear_cliente = Cliente.desde_valores
+        crear_factura = Factura.desde_valores
+        for valores_clientes, valores_facturas, errores in resultados:
+            for valores in valores_clientes:
+                clientes[valores[0]] = crear_cliente(*valores)
+            for numero, id_cliente, descripcion, monto, fecha, estado in valores_facturas:
+                facturas[numero] = crear_factura(numero, id_cliente, descripcion, monto, fecha, _ESTADOS[estado])
+            self.errores_carga += errores
+
+        #El manifiesto solo vale si describe exactamente los fragmentos leidos
+        if manifiesto is not None:
+            if set(manifiesto.archivos) == {os.path.basename(ruta) for par in rutas for ruta in par}:
+                self._contadores = self._contadores_manifiesto(manifiesto, clientes, facturas)
+            else:
+                self._ignorar_manifiesto("no describe los fragmentos existentes")
+
+        self._clientes = clientes
+        self._facturas = facturas
+        cambios = self._aplicar_diario(0)
+        if self._contadores is not None:
+            self._avanzar_contadores(cambios)
+
+        return clientes, facturas
+
+    def aplicar_operacion(self, tipo: str, data: dict):
+        cambio = super().aplicar_operacion(tipo, data)
+        if cambio is not None:
+            self._sucios.add(self._fragmento(cambio[1].id_cliente))
+        return cambio
+
+    def _registrar(self, tipo: str, data: dict):
+        self._sucios.add(self._fragmento(data['id_cliente']))
+        super()._registrar(tipo, data)
+
+    def guardar_lote(self, clientes: List[Cliente], facturas: List[Factura]):
+        for objeto in (*clientes, *facturas):
+            self._sucios.add(self._fragmento(objeto.id_cliente))
+        super().guardar_lote(clientes, facturas)
+
+    def exportar_snapshot(self, formato: str, clientes, facturas) -> bool:
+        '''
+        Guarda los fragmentos con cambios ( o todos, si cambio el reparto )
+
+        El formato binario no se fragmenta y se guarda como en el backend JSON
+        '''
+
+        if formato != "json":
+            return super().exportar_snapshot(formato, clientes, facturas)
+
+        try:
+            with self.bloquear():
+                self._guardar_fragmentos(clientes, facturas)
+                self._firma_snapshot = self._firmas()
+            return True
+
+        except Exception as e:
+            print(f"Error al guardar los datos: {e}")
+            return False
+
+    def _manifiesto_anterior(self, sucios: Set[int]) -> Manifiesto:
+        '''
+        Manifiesto a actualizar en un guardado que solo reescribe los fragmentos sucios
+
+        Si el anterior falta o no coincide con los fragmentos que no se van a
+        reescribir, se crea uno nuevo describiendo todos los existentes
+        '''
+
+        try:
+            manifiesto = Manifiesto.leer(self.archivo_manifiesto)
+        except (OSError, ValueError):
+            manifiesto = None
+
+        limpios = {os.path.basename(self._ruta_fragmento(tipo, numero))
+                   for numero in self._fragmentos_existentes() if numero not in sucios and numero < self.num_fragmentos
+                   for tipo in ("clientes", "facturas")}
+        if manifiesto is not None and not limpios - set(manifiesto.archivos) and \
+                not limpios & set(manifiesto.archivos_cambiados(self.directorio_fragmentos)):
+            return manifiesto
+
+        manifiesto = Manifiesto()
+        for nombre in limpios:
+            ruta = os.path.join(self.directorio_fragmentos, nombre)
+            if os.path.exists(ruta):
+                manifiesto.describir_archivo(nombre, ruta)
+        return manifiesto
+
+    def _guardar_fragmentos(self, clientes, facturas):
+        '''
+        Reescribe los fragmentos sucios: temporales primero y renombrado despues
+
+        Si se interrumpe, el diario aun no se ha vaciado y al cargar se
+        vuelven a aplicar sus operaciones sobre los fragmentos que quedaran
+        '''
+
+        todos = self._todos_sucios or clientes is not self._clientes or facturas is not self._facturas
+        sucios = set(range(self.num_fragmentos)) if todos else self._sucios
+        if not sucios:
+            return
+
+        datos_clientes = {numero: {} for numero in sucios}
+        datos_facturas = {numero: {} for numero in sucios}
+        for id_cliente, cliente in clientes.items():
+            numero = self._fragmento(id_cliente)
+            if numero in sucios:
+                datos_clientes[numero][id_cliente] = cliente.to_dict()
+        for numero_factura, factura in facturas.items():
+            numero = self._fragmento(factura.id_cliente)
+            if numero in sucios:
+                datos_facturas[numero][numero_factura] = factura.to_dict()
+
+        os.makedirs(self.directorio_fragmentos, exist_ok=True)
+        manifiesto = self._manifiesto_anterior(sucios)
+        renombrados = []
+        for numero in sorted(sucios):
+            for tipo, datos in (("clientes", datos_clientes[numero]), ("facturas", datos_facturas[numero])):
+                destino = self._ruta_fragmento(tipo, numero)
+                self._escribir_temporal(destino + ".tmp", datos)
+                manifiesto.describir_archivo(os.path.basename(destino), destino + ".tmp")
+                renombrados.append((destino + ".tmp", destino))
+
+        for temporal, destino in renombrados:
+            os.replace(temporal, destino)
+
+        #Fragmentos sobrantes de un reparto anterior con mas fragmentos
+        for numero in self._fragmentos_existentes():
+            if numero >= self.num_fragmentos:
+                for tipo in ("clientes", "facturas"):
+                    ruta = self._ruta_fragmento(tipo, numero)
+                    manifiesto.archivos.pop(os.path.basename(ruta), None)
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+
+        #El manifiesto va al final: si el guardado se interrumpe antes no coincidira con los fragmentos
+        manifiesto.contador_clientes, manifiesto.contador_facturas = \
+            Almacenamiento.contadores(self, clientes, facturas)
+        manifiesto.num_clientes, manifiesto.num_facturas = len(clientes), len(facturas)
+        manifiesto.version_esquema = VERSION_ESQUEMA
+        manifiesto.escribir(self.archivo_manifiesto + ".tmp")
+        os.replace(self.archivo_manifiesto + ".tmp", self.archivo_manifiesto)
+
+        sincronizar_directorio(self.directorio_fragmentos)
+        self._sucios = set()
+        self._todos_sucios = False
@@ -0,0 +1,303 @@
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, MutableMapping, Optional
+from models import Cliente, Factura
+from indices import IndiceEmail
+from almacenamiento import Almacenamiento, AlmacenamientoJSON
+from lector_json import cargar_registros
+from snapshot_binario import (ErrorSnapshot, SnapshotMapeado, TablaClaves, construir_indice,
+                              guardar_snapshot)
+
+
+class TablaMapeada(MutableMapping):
+    '''
+    Mapeo ID -> objeto que decodifica los registros del snapshot mapeado bajo demanda
+
+    Los objetos decodificados se guardan en una cache LRU acotada. Los
+    registros asignados o modificados despues del snapshot ( diario,
+    altas, cambios de estado ) se fijan aparte y no se expulsan nunca,
+    porque no estan en el archivo
+    '''
+
+    def __init__(self, claves: TablaClaves, decodificar: Callable, tam_cache: int = 1024):
+        '''
+        Args:
+        claves : tabla del indice con las claves del snapshot
+        decodificar : funcion posicion en el indice -> objeto
+        tam_cache : numero maximo de objetos decodificados en cache
+        '''
+
+        self.claves = claves
+        self.decodificar = decodificar
+        self.tam_cache = tam_cache
+        self._cache: OrderedDict = OrderedDict()
+        self._modificados: Dict[str, object] = {}
+        self._nuevos = 0   # Claves modificadas que no estan en el snapshot
+
+    def _cachear(self, clave: str, objeto):
+        self._cache[clave] = objeto
+        self._cache.move_to_end(clave)
+
+        if len(self._cache) > self.tam_cache:
+            self._cache.popitem(last=False)
+
+    def __getitem__(self, clave: str):
+        objeto = self._modificados.get(clave)
+        if objeto is not None:
+            return objeto
+
+        if clave in self._cache:
+            self._cache.move_to_end(clave)
+            return self._cache[clave]
+
+        i = self.claves.buscar(clave)
+        if i is None:
+            raise KeyError(clave)
+
+        objeto = self.decodificar(i)
+        self._cachear(clave, objeto)
+        return objeto
+
+    def __setitem__(self, clave: str, objeto):
+        if clave not in self._modificados and self.claves.buscar(clave) is None:
+            self._nuevos += 1
+        self._cache.pop(clave, None)
+        self._modificados[clave] = objeto
+
+    def fijar(self, clave: str):
+        '''
+        Mantiene en memoria el objeto de la clave porque se ha modificado en sitio
+        '''
+
+        if clave not in self._modificados and clave in self:
+            self._modificados[clave] = self[clave]
+            self._cache.pop(clave, None)
+
+    def __delitem__(self, clave: str):
+        raise TypeError("el snapshot mapeado no admite borrar registros")
+
+    def __contains__(self, clave) -> bool:
+        return clave in self._modificados or clave in self._cache or self.claves.buscar(clave) is not None
+
+    def __len__(self) -> int:
+        return len(self.claves) + self._nuevos
+
+    def __iter__(self) -> Iterator[str]:
+        #Primero el snapshot en orden de archivo y despues las altas posteriores
+        yield from self.claves
+        for clave in self._modificados:
+            if self.claves.buscar(clave) is None:
+                yield clave
+
+    def modificados(self) -> Iterator:
+        '''
+        Recorre los registros fijados en memoria ( diario, altas y cambios ) como (clave, objeto)
+        '''
+        return iter(self._modificados.items())
+
+    def _registros(self):
+        '''
+        Recorre todos los registros devolviendo (clave, objeto)
+
+        Al recorrerlo todo no se llena la cache: los objetos se crean y se descartan
+        '''
+
+        for i, clave in enumerate(self.claves):
+            objeto = self._modificados.get(clave)
+            if objeto is None:
+                objeto = self._cache.get(clave)
+            yield clave, objeto if objeto is not None else self.decodificar(i)
+        for clave, objeto in self._modificados.items():
+            if self.claves.buscar(clave) is None:
+                yield clave, objeto
+
+    def values(self):
+        return (objeto for _, objeto in self._registros())
+
+    def items(self):
+        return self._registros()
+
+
+class IndiceEmailMapeado(IndiceEmail):
+    '''
+    Indice de emails resuelto con la tabla de emails del indice del snapshot
+
+    Los emails añadidos despues del snapshot se guardan en memoria; los del
+    snapshot se comprueban contra el cliente actual por si cambio su email
+    '''
+
+    def __init__(self, emails: TablaClaves, ids_clientes: TablaClaves, clientes: TablaMapeada):
+        super().__init__()
+        self.emails = emails
+        self.ids_clientes = ids_clientes
+        self.clientes = clientes
+
+    def agregar(self, email: str, id_cliente: str):
+        actual = self.obtener(email)
+        if actual is not None and actual != id_cliente:
+            raise ValueError(f"el email {email} ya pertenece al cliente {actual}")
+        self._ids[self.normalizar(email)] = id_cliente
+
+    def obtener(self, email: str) -> Optional[str]:
+        clave = self.normalizar(email)
+        id_cliente = self._ids.get(clave)
+        if id_cliente is not None:
+            return id_cliente
+
+        i = self.emails.buscar(clave)
+        if i is None:
+            return None
+
+        id_cliente = self.ids_clientes.clave(self.emails.valor(i))
+        cliente = self.clientes.get(id_cliente)
+        if cliente is None or self.normalizar(cliente.email) != clave:
+            return None
+        return id_cliente
+
+    def limpiar(self):
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self.clientes)
+
+
+class AlmacenamientoMapeado(AlmacenamientoJSON):
+    '''
+    Backend de snapshot binario mapeado en memoria mas diario de operaciones
+
+    Al cargar solo se abren el snapshot y su indice de desplazamientos; los
+    clientes y facturas se decodifican cuando se consultan. Si el snapshot
+    binario no existe o es anterior a los JSON se genera una vez a partir de
+    ellos. Los snapshots nuevos se escriben siempre en binario
+    '''
+
+    perezoso = True
+
+    def __init__(self, archivo_clientes: str = "clientes.json", archivo_facturas: str = "facturas.json",
+                 archivo_diario: str = "diario.jsonl", archivo_binario: str = None, tam_cache: int = 1024,
+                 **opciones):
+        '''
+        Args:
+        archivo_clientes, archivo_facturas : snapshots JSON ( solo para generar el binario )
+        archivo_diario : diario de operaciones
+        archivo_binario : snapshot binario ( por defecto crm.snap junto a los JSON )
+        tam_cache : objetos de cada tabla que se mantienen en memoria
+        opciones : resto de opciones de AlmacenamientoJSON ( limite_diario, fsync, progreso )
+        '''
+
+        super().__init__(archivo_clientes, archivo_facturas, archivo_diario, archivo_binario=archivo_binario,
+                         formato="binario", **opciones)
+        self.tam_cache = tam_cache
+        self.mapa: Optional[SnapshotMapeado] = None
+
+    def _snapshot_preparado(self) -> bool:
+        '''
+        True si el snapshot binario esta al dia y su indice le corresponde
+        '''
+
+        if not self._usar_binario():
+            return False
+        try:
+            SnapshotMapeado(self.archivo_binario).cerrar()
+        except (OSError, ErrorSnapshot):
+            return False
+        return True
+
+    def _generar_snapshot(self):
+        '''
+        Regenera el indice, o el snapshot binario completo desde los JSON
+        '''
+
+        if self._usar_binario():
+            try:
+                construir_indice(self.archivo_binario)
+                return
+            except (OSError, ErrorSnapshot) as e:
+                print(f"Aviso: no se pudo leer {self.archivo_binario} ( {e} ), se genera desde los JSON")
+
+        clientes: Dict[str, Cliente] = {}
+        facturas: Dict[str, Factura] = {}
+        if os.path.exists(self.archivos_clientes):
+            self.errores_carga += cargar_registros(self.archivos_clientes, Cliente.from_dict, clientes,
+                                                   "clientes", self.progreso)
+        if os.path.exists(self.archivos_facturas):
+            self.errores_carga += cargar_registros(self.archivos_facturas, Factura.from_dict, facturas,
+                                                   "facturas", self.progreso)
+
+        guardar_snapshot(self.archivo_binario, clientes, facturas,
+                         *Almacenamiento.contadores(self, clientes, facturas))
+
+    def cargar(self):
+        '''
+        Mapea el snapshot binario ( generandolo si hace falta ) y aplica el diario encima
+        '''
+
+        self.errores_carga = []
+        if not self._snapshot_preparado():
+            with self.bloquear():
+                self._recuperar_snapshot()
+                if not self._snapshot_preparado():
+                    self._generar_snapshot()
+
+        return super().cargar()
+
+    def _cargar(self):
+        self._firma_snapshot = self._firmas()
+        self._abrir_mapa()
+
+        cambios = self._aplicar_diario(0)
+        self._avanzar_contadores(cambios)
+
+        return self._clientes, self._facturas
+
+    def _abrir_mapa(self):
+        '''
+        Mapea el snapshot actual y crea las tablas perezosas sobre el
+        '''
+
+        if self.mapa is not None:
+            self.mapa.cerrar()
+
+        self.mapa = SnapshotMapeado(self.archivo_binario)
+        self._contadores = self.mapa.contador_clientes, self.mapa.contador_facturas
+        self._clientes = TablaMapeada(self.mapa.clientes, self.mapa.cliente, self.tam_cache)
+        self._facturas = TablaMapeada(self.mapa.facturas, self.mapa.factura, self.tam_cache)
+
+    def crear_indice_email(self, clientes) -> IndiceEmail:
+        if isinstance(clientes, TablaMapeada) and self.mapa is not None:
+            indice = IndiceEmailMapeado(self.mapa.emails, self.mapa.clientes, clientes)
+            #Los emails de los clientes aplicados desde el diario no estan en la tabla del snapshot
+            for id_cliente, cliente in clientes.modificados():
+                indice.agregar(cliente.email, id_cliente)
+            return indice
+        return super().crear_indice_email(clientes)
+
+    def marcar_modificados(self, clientes: List[Cliente], facturas: List[Factura]):
+        '''
+        Fija en memoria los objetos modificados en sitio para que no salgan de la cache
+        '''
+
+        if not isinstance(self._clientes, TablaMapeada):
+            return
+        for cliente in clientes:
+            self._clientes.fijar(cliente.id_cliente)
+        for factura in facturas:
+            self._facturas.fijar(factura.numero_factura)
+
+    def guardar_cliente(self, cliente: Cliente):
+        self.marcar_modificados([cliente], [])
+        super().guardar_cliente(cliente)
+
+    def guardar_factura(self, factura: Factura):
+        self.marcar_modificados([], [factura])
+        super().guardar_factura(factura)
+
+    def guardar_lote(self, clientes: List[Cliente], facturas: List[Factura]):
+        self.marcar_modificados(clientes, facturas)
+        super().guardar_lote(clientes, facturas)
+
+    def cerrar(self):
+        super().cerrar()
+        if self.mapa is not None:
+            self.mapa.cerrar()
+            self.mapa = None
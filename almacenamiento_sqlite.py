@@ -0,0 +1,342 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Callable, Iterator, MutableMapping, Optional
+from models import Cliente, Factura, numero_id
+from indices import IndiceEmail
+from almacenamiento import Almacenamiento
+from bloqueo import BloqueoArchivo
+
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS clientes (
+    id_cliente TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    apellidos TEXT NOT NULL,
+    email TEXT NOT NULL,
+    email_normalizado TEXT NOT NULL UNIQUE,
+    telefono TEXT,
+    direccion TEXT,
+    fecha_registro TEXT
+);
+
+CREATE TABLE IF NOT EXISTS facturas (
+    numero_factura TEXT PRIMARY KEY,
+    id_cliente TEXT NOT NULL,
+    descripcion TEXT NOT NULL,
+    monto REAL NOT NULL,
+    fecha_emision TEXT,
+    estado TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_facturas_cliente ON facturas (id_cliente);
+
+CREATE TABLE IF NOT EXISTS metadatos (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO metadatos VALUES ('contador_clientes', 1);
+INSERT OR IGNORE INTO metadatos VALUES ('contador_facturas', 1);
+'''
+
+COLUMNAS_CLIENTE = "id_cliente, nombre, apellidos, email, telefono, direccion, fecha_registro"
+COLUMNAS_FACTURA = "numero_factura, id_cliente, descripcion, monto, fecha_emision, estado"
+
+
+class TablaSQLite(MutableMapping):
+    '''
+    Mapeo ID -> objeto que lee las filas bajo demanda
+
+    Guarda en una cache LRU acotada los ultimos objetos usados, asi el
+    consumo de memoria no depende del numero de registros. Asignar una
+    clave solo actualiza la cache: la escritura la hace el backend
+    '''
+
+    def __init__(self, conexion: sqlite3.Connection, tabla: str, clave: str, columnas: str,
+                 crear: Callable, tam_cache: int = 1024):
+        '''
+        Args:
+        conexion : conexion SQLite
+        tabla : nombre de la tabla
+        clave : columna clave primaria
+        columnas : columnas a leer en orden
+        crear : funcion fila -> objeto
+        tam_cache : numero maximo de objetos en cache
+        '''
+
+        self.conexion = conexion
+        self.tabla = tabla
+        self.clave = clave
+        self.columnas = columnas
+        self.crear = crear
+        self.tam_cache = tam_cache
+        self._cache: OrderedDict = OrderedDict()
+
+    def _cachear(self, clave: str, objeto):
+        '''
+        Añade un objeto a la cache expulsando el menos usado si esta llena
+        '''
+
+        self._cache[clave] = objeto
+        self._cache.move_to_end(clave)
+
+        if len(self._cache) > self.tam_cache:
+            self._cache.popitem(last=False)
+
+    def __getitem__(self, clave: str):
+        if clave in self._cache:
+            self._cache.move_to_end(clave)
+            return self._cache[clave]
+
+        fila = self.conexion.execute(
+            f"SELECT {self.columnas} FROM {self.tabla} WHERE {self.clave} = ?", (clave,)
+        ).fetchone()
+
+        if fila is None:
+            raise KeyError(clave)
+
+        objeto = self.crear(fila)
+        self._cachear(clave, objeto)
+        return objeto
+
+    def __setitem__(self, clave: str, objeto):
+        self._cachear(clave, objeto)
+
+    def __delitem__(self, clave: str):
+        self._cache.pop(clave, None)
+        with self.conexion:
+            cursor = self.conexion.execute(f"DELETE FROM {self.tabla} WHERE {self.clave} = ?", (clave,))
+        if cursor.rowcount == 0:
+            raise KeyError(clave)
+
+    def __contains__(self, clave) -> bool:
+        if clave in self._cache:
+            return True
+        fila = self.conexion.execute(
+            f"SELECT 1 FROM {self.tabla} WHERE {self.clave} = ?", (clave,)
+        ).fetchone()
+        return fila is not None
+
+    def __iter__(self) -> Iterator[str]:
+        cursor = self.conexion.execute(f"SELECT {self.clave} FROM {self.tabla} ORDER BY rowid")
+        for (clave,) in cursor:
+            yield clave
+
+    def __len__(self) -> int:
+        return self.conexion.execute(f"SELECT COUNT(*) FROM {self.tabla}").fetchone()[0]
+
+    def _filas(self):
+        '''
+        Recorre las filas en streaming devolviendo (clave, objeto)
+        '''
+
+        cursor = self.conexion.execute(f"SELECT {self.columnas} FROM {self.tabla} ORDER BY rowid")
+        for fila in cursor:
+            clave = fila[0]
+            objeto = self._cache.get(clave)
+            yield clave, objeto if objeto is not None else self.crear(fila)
+
+    def values(self):
+        return (objeto for _, objeto in self._filas())
+
+    def items(self):
+        return self._filas()
+
+
+class IndiceEmailSQLite(IndiceEmail):
+    '''
+    Indice de emails resuelto con el indice UNIQUE de la tabla clientes
+    '''
+
+    def __init__(self, conexion: sqlite3.Connection):
+        super().__init__()
+        self.conexion = conexion
+
+    def agregar(self, email: str, id_cliente: str):
+        actual = self.obtener(email)
+        if actual is not None and actual != id_cliente:
+            raise ValueError(f"el email {email} ya pertenece al cliente {actual}")
+
+    def eliminar(self, email: str, id_cliente: str = None):
+        #La fila se actualiza al guardar el cliente
+        pass
+
+    def obtener(self, email: str) -> Optional[str]:
+        fila = self.conexion.execute(
+            "SELECT id_cliente FROM clientes WHERE email_normalizado = ?", (self.normalizar(email),)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    def limpiar(self):
+        pass
+
+    def __len__(self) -> int:
+        return self.conexion.execute("SELECT COUNT(*) FROM clientes").fetchone()[0]
+
+
+class AlmacenamientoSQLite(Almacenamiento):
+    '''
+    Backend SQLite con tablas indexadas y lectura de filas bajo demanda
+    '''
+
+    perezoso = True
+
+    def __init__(self, ruta: str = "crm.db", tam_cache: int = 1024):
+        '''
+        Args:
+        ruta : archivo de la base de datos
+        tam_cache : objetos de cada tabla que se mantienen en memoria
+        '''
+
+        self.ruta = ruta
+        self.tam_cache = tam_cache
+        self.conexion = sqlite3.connect(ruta, timeout=30)
+        self.conexion.executescript(ESQUEMA)
+        self.bloqueo = BloqueoArchivo(ruta + ".lock")
+        self._version = self._version_datos()
+
+    def _version_datos(self) -> int:
+        #Cambia cuando otra conexion confirma una transaccion sobre la base de datos
+        return self.conexion.execute("PRAGMA data_version").fetchone()[0]
+
+    def bloquear(self, compartido: bool = False):
+        '''
+        SQLite ya serializa las transacciones; el bloqueo de archivo hace que
+        generar un ID y guardarlo sea atomico frente a otros procesos
+        '''
+        return self.bloqueo(compartido)
+
+    def refrescar(self):
+        '''
+        Si otro proceso ha escrito hay que recargar ( las tablas se leen bajo demanda )
+        '''
+
+        version = self._version_datos()
+        if version == self._version:
+            return []
+        self._version = version
+        return None
+
+    def _crear_cliente(self, fila) -> Cliente:
+        '''
+        Crea un cliente desde una fila de la tabla
+        '''
+
+        cliente = Cliente(fila[1], fila[2], fila[3], fila[4], fila[5])
+        cliente.id_cliente = fila[0]
+        cliente.fecha_registro = fila[6]
+        return cliente
+
+    def _crear_factura(self, fila) -> Factura:
+        '''
+        Crea una factura desde una fila de la tabla
+        '''
+
+        factura = Factura(fila[1], fila[2], fila[3])
+        factura.numero_factura = fila[0]
+        factura.fecha_emision = fila[4]
+        factura.estado = fila[5]
+        return factura
+
+    def cargar(self):
+        '''
+        Devuelve las tablas como mapeos perezosos ( no lee ninguna fila )
+        '''
+
+        clientes = TablaSQLite(self.conexion, "clientes", "id_cliente", COLUMNAS_CLIENTE,
+                               self._crear_cliente, self.tam_cache)
+        facturas = TablaSQLite(self.conexion, "facturas", "numero_factura", COLUMNAS_FACTURA,
+                               self._crear_factura, self.tam_cache)
+        return clientes, facturas
+
+    def contadores(self, clientes, facturas):
+        valores = dict(self.conexion.execute("SELECT clave, valor FROM metadatos"))
+        return valores['contador_clientes'], valores['contador_facturas']
+
+    def crear_indice_email(self, clientes) -> IndiceEmail:
+        return IndiceEmailSQLite(self.conexion)
+
+    @staticmethod
+    def _fila_cliente(cliente: Cliente) -> tuple:
+        return (cliente.id_cliente, cliente.nombre, cliente.apellidos, cliente.email,
+                IndiceEmail.normalizar(cliente.email), cliente.telefono, cliente.direccion,
+                cliente.fecha_registro)
+
+    @staticmethod
+    def _fila_factura(factura: Factura) -> tuple:
+        return (factura.numero_factura, factura.id_cliente, factura.descripcion, factura.monto,
+                factura.fecha_emision, factura.estado)
+
+    def _insertar_clientes(self, clientes):
+        '''
+        Inserta o reemplaza clientes y avanza su contador ( dentro de una transaccion )
+        '''
+
+        filas = [self._fila_cliente(c) for c in clientes]
+        self.conexion.executemany("INSERT OR REPLACE INTO clientes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+        if filas:
+            siguiente = max(numero_id(fila[0]) for fila in filas) + 1
+            self.conexion.execute(
+                "UPDATE metadatos SET valor = MAX(valor, ?) WHERE clave = 'contador_clientes'", (siguiente,)
+            )
+
+    def _insertar_facturas(self, facturas):
+        '''
+        Inserta o reemplaza facturas y avanza su contador ( dentro de una transaccion )
+        '''
+
+        filas = [self._fila_factura(f) for f in facturas]
+        self.conexion.executemany("INSERT OR REPLACE INTO facturas VALUES (?, ?, ?, ?, ?, ?)", filas)
+        if filas:
+            siguiente = max(numero_id(fila[0]) for fila in filas) + 1
+            self.conexion.execute(
+                "UPDATE metadatos SET valor = MAX(valor, ?) WHERE clave = 'contador_facturas'", (siguiente,)
+            )
+
+    def guardar_cliente(self, cliente: Cliente):
+        with self.conexion:
+            self._insertar_clientes([cliente])
+
+    def guardar_factura(self, factura: Factura):
+        with self.conexion:
+            self._insertar_facturas([factura])
+
+    def guardar_lote(self, clientes, facturas):
+        with self.conexion:
+            self._insertar_clientes(clientes)
+            self._insertar_facturas(facturas)
+
+    def guardar_todo(self, clientes, facturas) -> bool:
+        '''
+        Guarda todos los registros en una sola transaccion
+
+        Si se pasan las propias tablas del backend no hay nada que escribir
+        '''
+
+        if isinstance(clientes, TablaSQLite) and isinstance(facturas, TablaSQLite):
+            return True
+
+        try:
+            with self.conexion:
+                self._insertar_clientes(clientes.values())
+                self._insertar_facturas(facturas.values())
+            return True
+
+        except Exception as e:
+            print(f"Error al guardar los datos: {e}")
+            return False
+
+    def verificar_archivos(self):
+        '''
+        Comprobacion rapida de integridad de la base de datos ( PRAGMA quick_check )
+        '''
+
+        resultado = [fila[0] for fila in self.conexion.execute("PRAGMA quick_check")]
+        return [] if resultado == ["ok"] else resultado
+
+    def compactar(self, clientes, facturas):
+        self.guardar_todo(clientes, facturas)
+        self.conexion.execute("PRAGMA optimize")
+
+    def cerrar(self):
+        self.conexion.close()
@@ -0,0 +1,259 @@
+'''
+Pruebas de rendimiento de las operaciones principales del CRM
+
+Trabaja sobre una copia temporal del conjunto de datos ( ver generar_datos.py )
+sin pasar por el menu interactivo, e informa de percentiles de latencia y
+memoria maxima. Los resultados se guardan en JSON para compararlos entre
+versiones del codigo
+'''
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from crm_system import CRMSystem
+from almacenamiento import AlmacenamientoJSON
+
+
+def percentiles(tiempos: List[float]) -> Dict[str, float]:
+    '''
+    Resume una lista de tiempos en segundos
+
+    returns:
+    Diccionario con n, media, p50, p90, p99 y max en milisegundos
+    '''
+
+    ordenados = sorted(tiempos)
+    n = len(ordenados)
+
+    def percentil(p: int) -> float:
+        #Metodo del rango mas cercano
+        return ordenados[min(n - 1, max(0, -(-n * p // 100) - 1))] * 1000
+
+    return {
+        'n': n,
+        'media_ms': sum(ordenados) / n * 1000,
+        'p50_ms': percentil(50),
+        'p90_ms': percentil(90),
+        'p99_ms': percentil(99),
+        'max_ms': ordenados[-1] * 1000
+    }
+
+
+def medir(funcion: Callable, repeticiones: int) -> List[float]:
+    '''
+    Ejecuta la funcion varias veces y devuelve el tiempo de cada llamada
+    '''
+
+    tiempos = []
+    reloj = time.perf_counter
+    for _ in range(repeticiones):
+        inicio = reloj()
+        funcion()
+        tiempos.append(reloj() - inicio)
+    return tiempos
+
+
+def memoria_maxima_mb() -> Optional[float]:
+    '''
+    Memoria residente maxima del proceso ( solo en sistemas Unix )
+    '''
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux lo da en KiB y macOS en bytes
+    return maximo / (1024 * 1024) if sys.platform == "darwin" else maximo / 1024
+
+
+def commit_actual() -> Optional[str]:
+    '''
+    Commit de git del codigo medido, si esta disponible
+    '''
+
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+class Benchmark:
+    '''
+    Mide las operaciones del CRM sobre una copia del conjunto de datos
+    '''
+
+    def __init__(self, directorio: str, repeticiones: int = 3, muestras: int = 1000,
+                 columnar: bool = False, semilla: int = 1):
+        '''
+        Args:
+        directorio : directorio con clientes.json y facturas.json
+        repeticiones : veces que se repiten las operaciones lentas ( carga, guardado, resumen )
+        muestras : llamadas de las operaciones rapidas ( busquedas, altas )
+        columnar : carga las facturas por columnas
+        semilla : semilla para elegir las consultas
+        '''
+
+        self.directorio = directorio
+        self.repeticiones = repeticiones
+        self.muestras = muestras
+        self.columnar = columnar
+        self.aleatorio = random.Random(semilla)
+        self.resultados: Dict[str, Dict[str, float]] = {}
+        self._copia = None
+
+    def _crear_crm(self) -> CRMSystem:
+        almacenamiento = AlmacenamientoJSON(os.path.join(self._copia, "clientes.json"),
+                                            os.path.join(self._copia, "facturas.json"),
+                                            os.path.join(self._copia, "diario.jsonl"),
+                                            columnar=self.columnar)
+        return CRMSystem(almacenamiento)
+
+    def _anotar(self, nombre: str, tiempos: List[float]):
+        self.resultados[nombre] = percentiles(tiempos)
+        r = self.resultados[nombre]
+        print(f"{nombre:<22} n={r['n']:<6} media={r['media_ms']:10.3f} ms  p50={r['p50_ms']:10.3f}  "
+              f"p90={r['p90_ms']:10.3f}  p99={r['p99_ms']:10.3f}  max={r['max_ms']:10.3f}")
+
+    def ejecutar(self) -> dict:
+        '''
+        Ejecuta todas las mediciones
+
+        returns:
+        Resultados en formato diccionario ( ver guardar )
+        '''
+
+        self._copia = tempfile.mkdtemp(prefix="crm_benchmark_")
+        try:
+            for nombre in ("clientes.json", "facturas.json"):
+                origen = os.path.join(self.directorio, nombre)
+                if os.path.exists(origen):
+                    shutil.copy(origen, self._copia)
+
+            return self._medir_todo()
+        finally:
+            shutil.rmtree(self._copia, ignore_errors=True)
+
+    def _medir_todo(self) -> dict:
+        #Carga: tiempo sin trazar memoria y pico de memoria en una pasada aparte
+        self._anotar("cargar_datos", medir(self._crear_crm, self.repeticiones))
+
+        tracemalloc.start()
+        crm = self._crear_crm()
+        _, pico_carga = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        num_clientes, num_facturas = len(crm.clientes), len(crm.facturas)
+        ids = list(crm.clientes.keys())
+        if not ids:
+            raise ValueError(f"no hay clientes en {self.directorio}")
+
+        #Emails existentes y no existentes a partes iguales
+        emails = [crm.clientes[self.aleatorio.choice(ids)].email for _ in range(self.muestras // 2)]
+        emails += [f"nadie{i}@ejemplo.com" for i in range(self.muestras - len(emails))]
+        self.aleatorio.shuffle(emails)
+        consultas = iter(emails)
+        self._anotar("email_existe", medir(lambda: crm.email_existe(next(consultas)), len(emails)))
+
+        #Busqueda por nombre con prefijos, palabras completas y nombres completos
+        textos = []
+        for _ in range(self.muestras):
+            cliente = crm.clientes[self.aleatorio.choice(ids)]
+            textos.append(self.aleatorio.choice([cliente.nombre, cliente.apellidos.split()[0],
+                                                 cliente.nombre_completo(), cliente.nombre[:2],
+                                                 cliente.apellidos[:4]]))
+        consultas = iter(textos)
+        self._anotar("buscar_por_nombre", medir(lambda: crm.buscar_por_nombre(next(consultas), 20),
+                                                len(textos)))
+
+        #Altas de facturas ( con escritura en el diario )
+        destinos = iter([self.aleatorio.choice(ids) for _ in range(self.muestras)])
+        self._anotar("emitir_factura", medir(lambda: crm.emitir_factura(next(destinos), "Benchmark", "99.90"),
+                                             self.muestras))
+
+        #Resumen financiero completo ( la salida se descarta )
+        def resumen():
+            with redirect_stdout(io.StringIO()):
+                crm.resumen_financiero()
+        self._anotar("resumen_financiero", medir(resumen, self.repeticiones))
+        self._anotar("resumen_sistema", medir(crm.resumen_sistema, self.muestras))
+
+        #Guardado del snapshot completo
+        self._anotar("guardar_datos", medir(crm.guardar_datos, self.repeticiones))
+
+        crm.almacenamiento.cerrar()
+
+        return {
+            'fecha': datetime.now().isoformat(timespec="seconds"),
+            'commit': commit_actual(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'datos': {'directorio': self.directorio, 'clientes': num_clientes, 'facturas': num_facturas,
+                      'columnar': self.columnar},
+            'operaciones': self.resultados,
+            'memoria': {'pico_carga_mb': pico_carga / (1024 * 1024), 'rss_maximo_mb': memoria_maxima_mb()}
+        }
+
+
+def comparar(actual: dict, anterior: dict, umbral: float = 10.0):
+    '''
+    Muestra la variacion de la mediana de cada operacion frente a otro resultado
+
+    Args:
+    actual, anterior : resultados guardados por el benchmark
+    umbral : porcentaje de empeoramiento a partir del cual se marca la operacion
+    '''
+
+    print(f"\nComparacion con {anterior.get('commit') or 'resultado anterior'} ( p50 ):")
+    for nombre, medida in actual['operaciones'].items():
+        previa = anterior.get('operaciones', {}).get(nombre)
+        if not previa or not previa['p50_ms']:
+            continue
+        cambio = (medida['p50_ms'] - previa['p50_ms']) / previa['p50_ms'] * 100
+        aviso = "  <-- EMPEORA" if cambio > umbral else ""
+        print(f"{nombre:<22} {previa['p50_ms']:10.3f} -> {medida['p50_ms']:10.3f} ms  ({cambio:+.1f}%){aviso}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las operaciones del CRM")
+    parser.add_argument("--directorio", default="datos_prueba", help="directorio con el conjunto de datos")
+    parser.add_argument("--repeticiones", type=int, default=3, help="repeticiones de carga, guardado y resumen")
+    parser.add_argument("--muestras", type=int, default=1000, help="llamadas de busquedas y altas")
+    parser.add_argument("--columnar", action="store_true", help="carga las facturas por columnas")
+    parser.add_argument("--salida", default="resultados_benchmark.json", help="archivo JSON de resultados")
+    parser.add_argument("--comparar", help="resultados anteriores con los que comparar")
+    args = parser.parse_args()
+
+    resultados = Benchmark(args.directorio, args.repeticiones, args.muestras, args.columnar).ejecutar()
+
+    memoria = resultados['memoria']
+    print(f"Pico de memoria en la carga: {memoria['pico_carga_mb']:.1f} MB")
+    if memoria['rss_maximo_mb'] is not None:
+        print(f"Memoria residente maxima: {memoria['rss_maximo_mb']:.1f} MB")
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            comparar(resultados, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+
+class BloqueoArchivo:
+    '''
+    Bloqueo consultivo entre procesos sobre un archivo de bloqueo
+
+    Con fcntl.flock admite bloqueos compartidos ( lectores ) y exclusivos
+    ( escritores ); en Windows con msvcrt todos son exclusivos. Es reentrante
+    dentro del mismo proceso: solo el primer adquirir toca el archivo
+    '''
+
+    def __init__(self, ruta: str):
+        '''
+        Args:
+        ruta : archivo de bloqueo ( se crea si no existe )
+        '''
+
+        self.ruta = ruta
+        self._fd = None
+        self._nivel = 0
+        self._compartido = False
+
+    def adquirir(self, compartido: bool = False):
+        '''
+        Espera hasta obtener el bloqueo
+
+        Args:
+        compartido : True para lectura ( varios procesos a la vez ), False para escritura
+
+        Raises:
+        RuntimeError si se pide un bloqueo exclusivo teniendo ya uno compartido
+        '''
+
+        if self._nivel:
+            if self._compartido and not compartido:
+                raise RuntimeError("no se puede pasar de bloqueo compartido a exclusivo")
+            self._nivel += 1
+            return
+
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH if compartido else fcntl.LOCK_EX)
+            else:
+                #msvcrt.locking reintenta durante 10 segundos y luego falla: seguimos esperando
+                while True:
+                    try:
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        self._nivel = 1
+        self._compartido = compartido and fcntl is not None
+
+    def liberar(self):
+        '''
+        Libera el bloqueo ( solo al salir del ultimo adquirir anidado )
+        '''
+
+        if not self._nivel:
+            return
+
+        self._nivel -= 1
+        if self._nivel:
+            return
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._compartido = False
+
+    @contextmanager
+    def __call__(self, compartido: bool = False):
+        '''
+        Uso: with bloqueo(): ... / with bloqueo(compartido=True): ...
+        '''
+
+        self.adquirir(compartido)
+        try:
+            yield self
+        finally:
+            self.liberar()
+
+    @property
+    def adquirido(self) -> bool:
+        return self._nivel > 0
+
+
+def firma_archivo(ruta: str):
+    '''
+    Firma barata de un archivo para detectar cambios sin leerlo
+
+    returns:
+    Tupla (inodo, tamaño, mtime en ns) o None si no existe
+    '''
+
+    try:
+        info = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+def sincronizar_directorio(directorio: str):
+    '''
+    Fuerza a disco las entradas del directorio ( renombrados ), si el sistema lo permite
+    '''
+
+    try:
+        fd = os.open(directorio or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
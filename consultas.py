@@ -0,0 +1,703 @@
+import heapq
+from itertools import chain
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from models import Cliente, Factura, ESTADOS_FACTURA, EstadoFactura, clave_id, rango_ordinales
+from indices import IndiceDominios, normalizar_texto
+from agregados import TotalesFacturas, agrupar_facturas
+from errores import ErrorValidacion
+
+
+#Registros sobre los que se puede consultar
+ENTIDADES = ("facturas", "clientes")
+
+#Campos de texto de Cliente para CampoCliente y formas de compararlos
+CAMPOS_CLIENTE = ("id_cliente", "nombre", "apellidos", "nombre_completo", "email", "telefono", "direccion")
+MODOS_CAMPO = ("igual", "contiene", "empieza")
+
+#Agrupaciones de las consultas de facturas
+AGRUPACIONES = ("cliente", "estado", "mes", "trimestre", "dominio")
+
+
+def _describir_rango(campo: str, minimo, maximo) -> str:
+    if minimo is not None and maximo is not None:
+        return f"{campo} entre {minimo} y {maximo}"
+    if minimo is not None:
+        return f"{campo} >= {minimo}"
+    if maximo is not None:
+        return f"{campo} <= {maximo}"
+    return f"{campo} cualquiera"
+
+
+class Acceso:
+    '''
+    Forma de obtener los candidatos de una condicion a partir de un indice
+    '''
+
+    __slots__ = ('indice', 'estimado', 'obtener', 'exacto')
+
+    def __init__(self, indice: str, estimado: int, obtener: Callable[[], Iterable[str]], exacto: bool = True):
+        '''
+        Args:
+        indice : nombre del indice para explicar el plan
+        estimado : numero de candidatos ( exacto o cota superior )
+        obtener : funcion que devuelve las claves de los candidatos
+        exacto : True si todos los candidatos cumplen la condicion ( no hace falta volver a comprobarla )
+        '''
+
+        self.indice = indice
+        self.estimado = estimado
+        self.obtener = obtener
+        self.exacto = exacto
+
+
+class Predicado:
+    '''
+    Condicion de una consulta
+
+    Los predicados se combinan con & ( Y ), | ( O ) y ~ ( No ). Cada uno da
+    una funcion que comprueba un registro y, si algun indice resuelve la
+    condicion, un acceso con el numero estimado de candidatos para que el
+    planificador elija
+    '''
+
+    def entidades(self) -> Set[str]:
+        '''
+        Entidades cuyos campos usa la condicion ( "facturas" y/o "clientes" )
+        '''
+        raise NotImplementedError
+
+    def filtro(self, entidad: str, clientes) -> Callable[[object], bool]:
+        '''
+        Funcion registro -> bool que comprueba la condicion, preparada una vez por ejecucion
+
+        Args:
+        entidad : registros que se comprueban ( "facturas" o "clientes" )
+        clientes : clientes del CRM ( para las condiciones de cliente en consultas de facturas )
+        '''
+        raise NotImplementedError
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        '''
+        Acceso por indice a los registros de la entidad que pueden cumplir la condicion ( None = sin indice )
+        '''
+        return None
+
+    def describir(self) -> str:
+        raise NotImplementedError
+
+    def __and__(self, otro: 'Predicado') -> 'Predicado':
+        return Y(self, otro)
+
+    def __or__(self, otro: 'Predicado') -> 'Predicado':
+        return O(self, otro)
+
+    def __invert__(self) -> 'Predicado':
+        return No(self)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.describir()}>"
+
+
+class PredicadoFactura(Predicado):
+    '''
+    Condicion sobre los campos de una factura
+    '''
+
+    def entidades(self) -> Set[str]:
+        return {"facturas"}
+
+    def filtro(self, entidad: str, clientes) -> Callable[[Factura], bool]:
+        return self.cumple_factura
+
+    def cumple_factura(self, factura: Factura) -> bool:
+        raise NotImplementedError
+
+
+class PredicadoCliente(Predicado):
+    '''
+    Condicion sobre los campos de un cliente
+
+    En las consultas de facturas se comprueba sobre el cliente de cada
+    factura, y si un indice da los clientes candidatos sus facturas salen
+    del indice de facturas por cliente
+    '''
+
+    def entidades(self) -> Set[str]:
+        return {"clientes"}
+
+    def filtro(self, entidad: str, clientes) -> Callable[[object], bool]:
+        if entidad == "clientes":
+            return self.cumple_cliente
+
+        #En facturas se comprueba una vez por cliente; las facturas sin cliente no la cumplen
+        cumple_cliente = self.cumple_cliente
+        resultados: Dict[str, bool] = {}
+
+        def filtro(factura: Factura) -> bool:
+            resultado = resultados.get(factura.id_cliente)
+            if resultado is None:
+                cliente = clientes.get(factura.id_cliente)
+                resultado = resultados[factura.id_cliente] = cliente is not None and cumple_cliente(cliente)
+            return resultado
+
+        return filtro
+
+    def cumple_cliente(self, cliente: Cliente) -> bool:
+        raise NotImplementedError
+
+    def clientes_candidatos(self, crm) -> Optional[Tuple[str, Collection[str], bool]]:
+        '''
+        (nombre del indice, IDs de clientes candidatos, exacto) o None si no hay indice
+        '''
+        return None
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        candidatos = self.clientes_candidatos(crm)
+        if candidatos is None:
+            return None
+
+        indice, ids, exacto = candidatos
+        if entidad == "clientes":
+            return Acceso(indice, len(ids), lambda: ids, exacto)
+
+        por_cliente = crm.indice_facturas_cliente
+        return Acceso(f"{indice} + facturas por cliente", sum(por_cliente.contar(i) for i in ids),
+                      lambda: chain.from_iterable(por_cliente.numeros(i) for i in ids), exacto)
+
+
+class MontoEntre(PredicadoFactura):
+    '''
+    Facturas con el monto entre dos valores ( ambos incluidos, None = sin limite )
+    '''
+
+    def __init__(self, minimo: float = None, maximo: float = None):
+        self.minimo = self._monto(minimo)
+        self.maximo = self._monto(maximo)
+
+        if self.minimo is not None and self.maximo is not None and self.minimo > self.maximo:
+            raise ErrorValidacion("el monto minimo es mayor que el maximo")
+
+    @staticmethod
+    def _monto(valor) -> Optional[float]:
+        if valor is None:
+            return None
+        try:
+            return float(valor)
+        except (TypeError, ValueError):
+            raise ErrorValidacion(f"monto no valido: {valor}") from None
+
+    def cumple_factura(self, factura: Factura) -> bool:
+        return (self.minimo is None or factura.monto >= self.minimo) and \
+            (self.maximo is None or factura.monto <= self.maximo)
+
+    def describir(self) -> str:
+        return _describir_rango("monto", self.minimo, self.maximo)
+
+
+class EstadoEn(PredicadoFactura):
+    '''
+    Facturas en alguno de los estados indicados ( indice de estados )
+    '''
+
+    def __init__(self, *estados: str):
+        if not estados:
+            raise ErrorValidacion("indica al menos un estado")
+        for estado in estados:
+            if estado not in ESTADOS_FACTURA:
+                raise ErrorValidacion(f"estado no valido: {estado}")
+
+        self.estados = tuple(dict.fromkeys(estados))
+        self._codigos = frozenset(EstadoFactura.desde_texto(estado) for estado in self.estados)
+
+    def cumple_factura(self, factura: Factura) -> bool:
+        return factura.codigo_estado in self._codigos
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        indice = crm.indice_estados
+        return Acceso("estados", sum(indice.contar(estado) for estado in self.estados),
+                      lambda: chain.from_iterable(indice.numeros(estado) for estado in self.estados))
+
+    def describir(self) -> str:
+        return f"estado en ( {', '.join(self.estados)} )"
+
+
+class EmitidaEntre(PredicadoFactura):
+    '''
+    Facturas emitidas entre dos fechas "dd/mm/aaaa" ( ambas incluidas, vacias = sin limite )
+    '''
+
+    def __init__(self, desde: str = None, hasta: str = None):
+        self.desde = desde or None
+        self.hasta = hasta or None
+        self.inicio, self.fin = rango_ordinales(desde, hasta)
+
+    def cumple_factura(self, factura: Factura) -> bool:
+        return (self.inicio is None or factura.fecha_emision_ordinal >= self.inicio) and \
+            (self.fin is None or factura.fecha_emision_ordinal <= self.fin)
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        indice = crm.indice_fechas
+        return Acceso("fechas de emision", indice.contar_rango(self.inicio, self.fin),
+                      lambda: indice.rango(self.inicio, self.fin))
+
+    def describir(self) -> str:
+        return _describir_rango("emision", self.desde, self.hasta)
+
+
+class RegistradoEntre(PredicadoCliente):
+    '''
+    Clientes dados de alta entre dos fechas "dd/mm/aaaa" ( ambas incluidas, vacias = sin limite )
+    '''
+
+    def __init__(self, desde: str = None, hasta: str = None):
+        self.desde = desde or None
+        self.hasta = hasta or None
+        self.inicio, self.fin = rango_ordinales(desde, hasta)
+
+    def cumple_cliente(self, cliente: Cliente) -> bool:
+        return (self.inicio is None or cliente.fecha_registro_ordinal >= self.inicio) and \
+            (self.fin is None or cliente.fecha_registro_ordinal <= self.fin)
+
+    def describir(self) -> str:
+        return _describir_rango("registro", self.desde, self.hasta)
+
+
+class CampoCliente(PredicadoCliente):
+    '''
+    Comparacion de un campo de texto del cliente sin distinguir mayusculas ni acentos
+
+    Usa el indice de IDs ( igual en id_cliente ), el de emails ( igual en
+    email ) o el de nombres ( nombre, apellidos o nombre completo; este da
+    candidatos que despues se comprueban )
+    '''
+
+    def __init__(self, campo: str, valor: str, modo: str = "igual"):
+        '''
+        Args:
+        campo : uno de CAMPOS_CLIENTE
+        valor : texto a comparar
+        modo : "igual", "contiene" o "empieza"
+        '''
+
+        if campo not in CAMPOS_CLIENTE:
+            raise ErrorValidacion(f"campo de cliente no valido: {campo}")
+        if modo not in MODOS_CAMPO:
+            raise ErrorValidacion(f"modo de comparacion no valido: {modo}")
+
+        self.campo = campo
+        self.valor = str(valor).strip()
+        self.modo = modo
+        self._valor = normalizar_texto(self.valor)
+
+    def _texto(self, cliente: Cliente) -> str:
+        if self.campo == "nombre_completo":
+            return cliente.nombre_completo()
+        return getattr(cliente, self.campo)
+
+    def cumple_cliente(self, cliente: Cliente) -> bool:
+        texto = normalizar_texto(self._texto(cliente))
+        if self.modo == "igual":
+            return texto == self._valor
+        if self.modo == "empieza":
+            return texto.startswith(self._valor)
+        return self._valor in texto
+
+    def clientes_candidatos(self, crm) -> Optional[Tuple[str, Collection[str], bool]]:
+        if self.modo == "igual" and self.campo == "id_cliente":
+            id_cliente = self.valor.upper()
+            return "IDs de cliente", [id_cliente] if id_cliente in crm.clientes else [], False
+
+        if self.modo == "igual" and self.campo == "email":
+            id_cliente = crm.indice_email.obtener(self.valor)
+            return "emails", [] if id_cliente is None else [id_cliente], False
+
+        #El indice de nombres encuentra subcadenas de 3 o mas letras y, las mas
+        #cortas, solo al principio de palabra ( vale para igual y empieza )
+        if self.campo in ("nombre", "apellidos", "nombre_completo") and self._valor and \
+                (len(self._valor) >= 3 or self.modo != "contiene"):
+            return "nombres", crm.indice_nombres.buscar(self.valor), False
+
+        return None
+
+    def describir(self) -> str:
+        return f"{self.campo} {self.modo} '{self.valor}'"
+
+
+class DominioEmail(PredicadoCliente):
+    '''
+    Clientes cuyo email es de alguno de los dominios indicados ( indice de dominios )
+    '''
+
+    def __init__(self, *dominios: str):
+        self.dominios = tuple(dict.fromkeys(IndiceDominios.dominio(dominio) for dominio in dominios))
+        if not self.dominios or not all(self.dominios):
+            raise ErrorValidacion("indica al menos un dominio")
+
+    def cumple_cliente(self, cliente: Cliente) -> bool:
+        return IndiceDominios.dominio(cliente.email) in self.dominios
+
+    def clientes_candidatos(self, crm) -> Optional[Tuple[str, Collection[str], bool]]:
+        indice = crm.indice_dominios
+        if len(self.dominios) == 1:
+            return "dominios de email", indice.ids(self.dominios[0]), True
+        return "dominios de email", set().union(*(indice.ids(dominio) for dominio in self.dominios)), True
+
+    def describir(self) -> str:
+        return f"dominio en ( {', '.join(self.dominios)} )"
+
+
+class Y(Predicado):
+    '''
+    Se cumplen todas las condiciones
+    '''
+
+    def __init__(self, *predicados: Predicado):
+        self.predicados: List[Predicado] = []
+        for predicado in predicados:
+            if not isinstance(predicado, Predicado):
+                raise ErrorValidacion(f"condicion no valida: {predicado!r}")
+            self.predicados.extend(predicado.predicados if isinstance(predicado, Y) else [predicado])
+
+    def entidades(self) -> Set[str]:
+        return set().union(*(predicado.entidades() for predicado in self.predicados))
+
+    def filtro(self, entidad: str, clientes) -> Callable[[object], bool]:
+        #Primero las condiciones de factura, que no necesitan buscar el cliente
+        ordenados = sorted(self.predicados, key=lambda predicado: "clientes" in predicado.entidades())
+        filtros = [predicado.filtro(entidad, clientes) for predicado in ordenados]
+        if len(filtros) == 1:
+            return filtros[0]
+
+        def todos(registro) -> bool:
+            for filtro in filtros:
+                if not filtro(registro):
+                    return False
+            return True
+
+        return todos
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        #Dentro de un O: el acceso mas selectivo de sus condiciones; el resto se comprueba despues
+        accesos = [acceso for acceso in (p.acceso(crm, entidad) for p in self.predicados) if acceso is not None]
+        if not accesos:
+            return None
+        mejor = min(accesos, key=lambda acceso: acceso.estimado)
+        return Acceso(mejor.indice, mejor.estimado, mejor.obtener, exacto=False)
+
+    def describir(self) -> str:
+        return " Y ".join(f"( {p.describir()} )" if isinstance(p, O) else p.describir() for p in self.predicados)
+
+
+class O(Predicado):
+    '''
+    Se cumple alguna de las condiciones
+    '''
+
+    def __init__(self, *predicados: Predicado):
+        self.predicados: List[Predicado] = []
+        for predicado in predicados:
+            if not isinstance(predicado, Predicado):
+                raise ErrorValidacion(f"condicion no valida: {predicado!r}")
+            self.predicados.extend(predicado.predicados if isinstance(predicado, O) else [predicado])
+
+    def entidades(self) -> Set[str]:
+        return set().union(*(predicado.entidades() for predicado in self.predicados))
+
+    def filtro(self, entidad: str, clientes) -> Callable[[object], bool]:
+        filtros = [predicado.filtro(entidad, clientes) for predicado in self.predicados]
+
+        def alguno(registro) -> bool:
+            for filtro in filtros:
+                if filtro(registro):
+                    return True
+            return False
+
+        return alguno
+
+    def acceso(self, crm, entidad: str) -> Optional[Acceso]:
+        #Solo si todas las ramas tienen indice: la union de sus candidatos
+        accesos = []
+        for predicado in self.predicados:
+            acceso = predicado.acceso(crm, entidad)
+            if acceso is None:
+                return None
+            accesos.append(acceso)
+
+        return Acceso(" | ".join(acceso.indice for acceso in accesos), sum(acceso.estimado for acceso in accesos),
+                      lambda: set(chain.from_iterable(acceso.obtener() for acceso in accesos)),
+                      all(acceso.exacto for acceso in accesos))
+
+    def describir(self) -> str:
+        return " O ".join(f"( {p.describir()} )" if isinstance(p, Y) else p.describir() for p in self.predicados)
+
+
+class No(Predicado):
+    '''
+    No se cumple la condicion ( siempre se resuelve recorriendo )
+    '''
+
+    def __init__(self, predicado: Predicado):
+        if not isinstance(predicado, Predicado):
+            raise ErrorValidacion(f"condicion no valida: {predicado!r}")
+        self.predicado = predicado
+
+    def entidades(self) -> Set[str]:
+        return self.predicado.entidades()
+
+    def filtro(self, entidad: str, clientes) -> Callable[[object], bool]:
+        filtro = self.predicado.filtro(entidad, clientes)
+        return lambda registro: not filtro(registro)
+
+    def describir(self) -> str:
+        return f"NO ( {self.predicado.describir()} )"
+
+
+class Plan:
+    '''
+    Plan elegido para una consulta: acceso ( indice o recorrido ) y filtros
+    '''
+
+    def __init__(self, entidad: str, total: int, acceso: Optional[Acceso], condicion: Optional[Predicado],
+                 filtros: List[Predicado], descartados: List[Tuple[str, int]]):
+        '''
+        Args:
+        entidad : "facturas" o "clientes"
+        total : registros de la entidad ( coste del recorrido completo )
+        acceso : acceso por indice elegido ( None = recorrido completo )
+        condicion : condicion resuelta con el acceso
+        filtros : condiciones que se comprueban en cada candidato
+        descartados : (descripcion, estimado) de los accesos no elegidos
+        '''
+
+        self.entidad = entidad
+        self.total = total
+        self.acceso = acceso
+        self.condicion = condicion
+        self.filtros = filtros
+        self.descartados = descartados
+
+    @property
+    def estimado(self) -> int:
+        return self.total if self.acceso is None else self.acceso.estimado
+
+    def explicar(self) -> str:
+        '''
+        Texto del plan: acceso elegido, alternativas descartadas y filtros
+        '''
+
+        lineas = [f"Consulta de {self.entidad} ( {self.total} en total )"]
+        if self.acceso is None:
+            lineas.append(f"  Acceso: recorrido completo ~ {self.total} {self.entidad}")
+        else:
+            lineas.append(f"  Acceso: indice de {self.acceso.indice} [ {self.condicion.describir()} ] "
+                          f"~ {self.acceso.estimado} {self.entidad}")
+
+        for descripcion, estimado in self.descartados:
+            lineas.append(f"  Descartado: {descripcion} ~ {estimado} {self.entidad}")
+
+        if self.filtros:
+            lineas.append(f"  Filtro: {Y(*self.filtros).describir()}")
+        else:
+            lineas.append("  Filtro: ninguno ( el indice es exacto )" if self.acceso else "  Filtro: ninguno")
+        return "\n".join(lineas)
+
+    def __str__(self) -> str:
+        return self.explicar()
+
+
+class Consulta:
+    '''
+    Consulta sobre las facturas o los clientes del CRM
+
+    Las condiciones se combinan en Y y la consulta se ejecuta al pedir sus
+    resultados. El planificador estima los candidatos de cada indice que
+    resuelve alguna condicion ( estados, fechas, dominios, emails, nombres
+    ), elige el mas selectivo o el recorrido completo si ninguno lo mejora,
+    y comprueba el resto de condiciones solo sobre los candidatos
+
+    Ejemplo: crm.consultar(EstadoEn("Pendiente"), MontoEntre(minimo=1000), DominioEmail("empresa.es"))
+    '''
+
+    def __init__(self, crm, entidad: str = "facturas", predicados: Iterable[Predicado] = ()):
+        '''
+        Args:
+        crm : sistema CRM sobre el que se consulta
+        entidad : "facturas" o "clientes"
+        predicados : condiciones que deben cumplirse todas
+
+        Raises:
+        ErrorValidacion si la entidad o alguna condicion no son validas
+        '''
+
+        if entidad not in ENTIDADES:
+            raise ErrorValidacion(f"entidad no valida: {entidad}")
+
+        self.crm = crm
+        self.entidad = entidad
+        self.condiciones = Y(*predicados).predicados
+
+        if entidad == "clientes" and any("facturas" in p.entidades() for p in self.condiciones):
+            raise ErrorValidacion("las consultas de clientes solo admiten condiciones de cliente")
+
+    def donde(self, *predicados: Predicado) -> 'Consulta':
+        '''
+        Consulta nueva con mas condiciones ( la actual no cambia )
+        '''
+        return Consulta(self.crm, self.entidad, self.condiciones + list(predicados))
+
+    def _coleccion(self):
+        return self.crm.facturas if self.entidad == "facturas" else self.crm.clientes
+
+    def planificar(self) -> Plan:
+        '''
+        Elige el acceso con menos candidatos estimados ( o el recorrido completo )
+        '''
+
+        self.crm.asegurar_indices()
+        total = len(self._coleccion())
+
+        alternativas = []
+        for posicion, condicion in enumerate(self.condiciones):
+            acceso = condicion.acceso(self.crm, self.entidad)
+            if acceso is not None:
+                alternativas.append((acceso.estimado, posicion, condicion, acceso))
+        alternativas.sort(key=lambda alternativa: alternativa[:2])
+
+        if not alternativas or alternativas[0][0] >= total:
+            descartados = [(f"indice de {acceso.indice} [ {condicion.describir()} ]", estimado)
+                           for estimado, _, condicion, acceso in alternativas]
+            return Plan(self.entidad, total, None, None, list(self.condiciones), descartados)
+
+        _, _, elegida, acceso = alternativas[0]
+        descartados = [(f"indice de {otro.indice} [ {condicion.describir()} ]", estimado)
+                       for estimado, _, condicion, otro in alternativas[1:]]
+        descartados.append(("recorrido completo", total))
+        filtros = [condicion for condicion in self.condiciones if condicion is not elegida or not acceso.exacto]
+        return Plan(self.entidad, total, acceso, elegida, filtros, descartados)
+
+    def explicar(self) -> str:
+        return self.planificar().explicar()
+
+    def __iter__(self) -> Iterator:
+        '''
+        Recorre los registros que cumplen la consulta en el orden del acceso elegido
+        '''
+
+        plan = self.planificar()
+        coleccion = self._coleccion()
+
+        if plan.acceso is None:
+            registros = coleccion.values()
+        else:
+            #Las claves del indice sin registro ( ver CRMSystem.verificar ) se saltan
+            registros = filter(None, map(coleccion.get, plan.acceso.obtener()))
+
+        if not plan.filtros:
+            return iter(registros)
+        return filter(Y(*plan.filtros).filtro(self.entidad, self.crm.clientes), registros)
+
+    def _clave(self, registro) -> tuple:
+        return clave_id(registro.numero_factura if self.entidad == "facturas" else registro.id_cliente)
+
+    def resultados(self, limite: int = None) -> List:
+        '''
+        Registros que cumplen la consulta ordenados por numero de factura o ID de cliente
+
+        Args:
+        limite : numero maximo de resultados ( los de numero mas bajo )
+        '''
+
+        if limite:
+            return heapq.nsmallest(limite, self, key=self._clave)
+        return sorted(self, key=self._clave)
+
+    def contar(self) -> int:
+        return sum(1 for _ in self)
+
+    def agrupar(self, por: str = "cliente") -> Dict[str, TotalesFacturas]:
+        '''
+        Totales de las facturas de la consulta agrupados por cliente, estado,
+        mes, trimestre o dominio del email del cliente
+
+        Raises:
+        ErrorValidacion si la consulta no es de facturas o la agrupacion no es valida
+        '''
+
+        if self.entidad != "facturas":
+            raise ErrorValidacion("solo se pueden agrupar consultas de facturas")
+        if por not in AGRUPACIONES:
+            raise ErrorValidacion(f"agrupacion no valida: {por}")
+
+        if por == "dominio":
+            clientes = self.crm.clientes
+            dominios: Dict[str, str] = {}
+
+            def dominio(factura: Factura) -> str:
+                resultado = dominios.get(factura.id_cliente)
+                if resultado is None:
+                    cliente = clientes.get(factura.id_cliente)
+                    resultado = dominios[factura.id_cliente] = \
+                        "(sin cliente)" if cliente is None else IndiceDominios.dominio(cliente.email)
+                return resultado
+
+            return agrupar_facturas(self, dominio)
+
+        return agrupar_facturas(self, por)
+
+
+def _valores(valor, nombre_filtro: str) -> List[str]:
+    '''
+    Acepta un texto o una lista de textos ( filtros estado y dominio )
+
+    Raises:
+    ErrorValidacion si el valor no es ni texto ni lista de textos
+    '''
+
+    if isinstance(valor, str):
+        return [valor]
+    if isinstance(valor, (list, tuple)) and all(isinstance(elemento, str) for elemento in valor):
+        return list(valor)
+    raise ErrorValidacion(f"{nombre_filtro} no valido: {valor!r}")
+
+
+#Filtros simples ( CLI y JSON-RPC ) -> predicado
+FILTROS = {
+    'monto_min': lambda valor: MontoEntre(minimo=valor),
+    'monto_max': lambda valor: MontoEntre(maximo=valor),
+    'estado': lambda valor: EstadoEn(*_valores(valor, "estado")),
+    'desde': lambda valor: EmitidaEntre(desde=valor),
+    'hasta': lambda valor: EmitidaEntre(hasta=valor),
+    'registrado_desde': lambda valor: RegistradoEntre(desde=valor),
+    'registrado_hasta': lambda valor: RegistradoEntre(hasta=valor),
+    'dominio': lambda valor: DominioEmail(*_valores(valor, "dominio")),
+    'id_cliente': lambda valor: CampoCliente("id_cliente", valor),
+    'email': lambda valor: CampoCliente("email", valor),
+    'nombre': lambda valor: CampoCliente("nombre_completo", valor, "contiene"),
+}
+
+
+def predicados_desde_filtros(filtros: dict) -> List[Predicado]:
+    '''
+    Convierte filtros simples ( p.ej. {"estado": "Pendiente", "monto_min": 1000} ) en predicados
+
+    Los limites de un mismo rango se unen en una sola condicion; los filtros
+    con valor None o vacio se ignoran
+
+    Raises:
+    ErrorValidacion si algun filtro no existe o su valor no es valido
+    '''
+
+    filtros = {clave: valor for clave, valor in filtros.items() if valor is not None and valor != ""}
+    desconocidos = set(filtros) - set(FILTROS)
+    if desconocidos:
+        raise ErrorValidacion(f"filtros no validos: {', '.join(sorted(desconocidos))}")
+
+    predicados = []
+    rangos = (('monto_min', 'monto_max', MontoEntre), ('desde', 'hasta', EmitidaEntre),
+              ('registrado_desde', 'registrado_hasta', RegistradoEntre))
+    for inicio, fin, clase in rangos:
+        if inicio in filtros and fin in filtros:
+            predicados.append(clase(filtros.pop(inicio), filtros.pop(fin)))
+
+    predicados.extend(FILTROS[clave](valor) for clave, valor in filtros.items())
+    return predicados
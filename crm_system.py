@@ -1,103 +1,352 @@
-import json
-import os
-from typing import Dict
-from models import Cliente, Factura
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional, Tuple
+from models import (Cliente, Factura, ESTADOS_FACTURA, EstadoFactura, PREFIJO_CLIENTE, PREFIJO_FACTURA, clave_id,
+                    formatear_id, numero_id, ordinal_consulta, rango_ordinales)
 from validators import Validador
+from indices import IndiceDominios, IndiceEmail, IndiceEstados, IndiceFacturasCliente, IndiceFechas, IndiceNombres
+from agregados import (AgregadosFinancieros, TotalesFacturas, METRICAS_RANKING, TRAMOS_ANTIGUEDAD,
+                       agrupar_facturas, ingresos_por_periodo)
+from facturas_columnares import FacturasColumnares
+from consultas import Consulta, Predicado, predicados_desde_filtros
+from almacenamiento import Almacenamiento, AlmacenamientoJSON
+from paginador import Paginador
+from errores import ErrorNoEncontrado, ErrorValidacion
+from metricas import Metricas
+
+
+#Operaciones que se miden cuando las metricas estan activas
+OPERACIONES_MEDIDAS = ("cargar_datos", "guardar_datos", "compactar", "sincronizar", "reconstruir_indices",
+                       "email_existe", "buscar_por_email", "buscar_por_nombre", "obtener_cliente",
+                       "alta_cliente", "emitir_factura", "actualizar_estado_factura", "actualizar_email_cliente",
+                       "facturas_de_cliente", "resumen_cliente", "resumen_sistema", "agrupar_facturas",
+                       "facturas_entre", "ingresos_por_periodo", "antiguedad_pendientes", "top_clientes",
+                       "facturas_por_estado", "verificar")
+OPERACIONES_MENU = ("registrar_cliente", "buscar_cliente", "crear_factura", "mostrar_todos_clientes",
+                    "mostrar_facturas_cliente", "resumen_financiero", "cambiar_estado_factura", "mostrar_informes")
+OPERACIONES_ALMACENAMIENTO = ("cargar", "refrescar", "guardar_cliente", "guardar_factura", "guardar_lote",
+                              "guardar_todo", "compactar")
 
 class CRMSystem:
     '''
     Sistema principal de gestion de clientes
     '''
     
-    def __init__(self):
+    def __init__(self, almacenamiento: Almacenamiento = None, metricas: Metricas = None):
         '''
         Inicia el sistema
+        
+        Args:
+        almacenamiento : backend de persistencia ( por defecto archivos JSON )
+        metricas : registro de metricas ( por defecto desactivado )
         '''
         
-        self.clientes: Dict[str, Cliente] = {}
-        self.facturas: Dict[str, Factura] = {}
+        self.almacenamiento = almacenamiento if almacenamiento else AlmacenamientoJSON()
+        self.clientes: MutableMapping[str, Cliente] = {}
+        self.facturas: MutableMapping[str, Factura] = {}
         self.contador_clientes = 1
         self.contador_facturas = 1
-        self.archivos_clientes = "clientes.json"
-        self.archivos_facturas = "facturas.json"
+        self.indice_email = IndiceEmail()
+        self.indice_nombres = IndiceNombres()
+        self.indice_dominios = IndiceDominios()
+        self.indice_fechas = IndiceFechas()
+        self.indice_estados = IndiceEstados()
+        self.indice_facturas_cliente = IndiceFacturasCliente()
+        self.agregados = AgregadosFinancieros()
+        self._indices_pendientes = False   # Con backends perezosos se construyen al primer uso
+        self.error_carga: Optional[str] = None   # Si la ultima carga fallo no se compacta ni se guarda todo
+        self.paginador = Paginador(tam_pagina=20)
+        self.metricas = metricas if metricas else Metricas()
+        self.instrumentar()
         self.cargar_datos()
         
     
+    def instrumentar(self):
+        '''
+        Envuelve las operaciones de esta instancia y de su almacenamiento para
+        medirlas ( sin efecto si las metricas estan desactivadas )
+        '''
+        
+        self.metricas.instrumentar(self, OPERACIONES_MEDIDAS)
+        self.metricas.instrumentar(self, OPERACIONES_MENU, prefijo="menu.")
+        self.metricas.instrumentar(self.almacenamiento, OPERACIONES_ALMACENAMIENTO, prefijo="almacenamiento.")
+        
+    
     def cargar_datos(self):
         '''
-        Carga los datos de los json si existen
+        Carga los datos desde el backend de persistencia
         '''
         
+        self.error_carga = None
+        
         try: 
             
-            #Carga los clientes
-            if os.path.exists(self.archivos_clientes):
-                with open(self.archivos_clientes, 'r' , encoding='utf-8') as f:
-                    datos = json.load(f)
-                    for id_cliente , data in datos.items():
-                        self.clientes[id_cliente] = Cliente.from_dict(data)
-                        
-                        
-                    #Actualiza el contador   
-                    if self.clientes:
-                        max_num = max([int(id_u[3:]) for id_u in self.clientes.keys()])
-                        self.contador_clientes = max_num + 1
-                    
-                    
-            #Carga facturas
-            
-            if os.path.exists(self.archovos_facturas):
-                with open(self.archivos_facturas, 'r', encoding='utf-8') as f: 
-                    datos = json.load(f)
-                    for num_factura, data in datos.items():
-                        self.facturas[num_factura] = Factura.from_dict(data)
-                     
-                    #Actualizamos contador    
-                    if self.facturas:
-                        max_num = max([int(nf[3:]) for nf in self.facturas.keys()])
-                        self.contador_facturas = max_num + 1 
+            #Carga clientes y facturas
+            self.clientes, self.facturas = self.almacenamiento.cargar()
+                
+            #Actualiza los contadores
+            self.contador_clientes, self.contador_facturas = self.almacenamiento.contadores(
+                self.clientes, self.facturas)
+                
+            #Construimos el indice de emails
+            self.reconstruir_indice_email()
+            
+            #Construimos los indices en memoria ( o los dejamos para el primer uso )
+            if self.almacenamiento.perezoso:
+                self._indices_pendientes = True
+            else:
+                self.reconstruir_indices()
                         
         
         except Exception as e:
+            self.error_carga = str(e)
             print(f"Error al cargar datos: {e}")
             
     
+    def sincronizar(self) -> bool:
+        '''
+        Incorpora los cambios guardados por otros procesos sobre los mismos datos
+        
+        La comprobacion es barata ( firma de los archivos ); si solo se
+        añadieron operaciones se aplican una a una sobre los indices y si
+        no se recarga todo
+        
+        returns:
+        True si habia cambios
+        '''
+        
+        cambios = self.almacenamiento.refrescar()
+        
+        if cambios is None:
+            self.cargar_datos()
+            return True
+        
+        for tipo, anterior, nuevo in cambios:
+            if tipo == "cliente":
+                if anterior is not None:
+                    self.indice_email.eliminar(anterior.email, anterior.id_cliente)
+                    if not self._indices_pendientes:
+                        self.indice_nombres.eliminar(anterior.id_cliente)
+                        self.indice_dominios.eliminar(anterior.email, anterior.id_cliente)
+                self._indexar_cliente(nuevo)
+                self.contador_clientes = max(self.contador_clientes, numero_id(nuevo.id_cliente) + 1)
+            else:
+                if anterior is not None and not self._indices_pendientes:
+                    self.agregados.quitar_factura(anterior)
+                    self.indice_fechas.eliminar(anterior.fecha_emision_ordinal, anterior.numero_factura)
+                    self.indice_estados.eliminar(anterior.estado, anterior.numero_factura)
+                    self.indice_facturas_cliente.eliminar(anterior.id_cliente, anterior.numero_factura)
+                self._indexar_factura(nuevo)
+                self.contador_facturas = max(self.contador_facturas, numero_id(nuevo.numero_factura) + 1)
+        
+        return bool(cambios)
+    
+    @contextmanager
+    def _escritura(self):
+        '''
+        Bloquea el almacenamiento para escribir y trae antes los cambios de
+        otros procesos, asi los IDs generados y las validaciones ven los datos al dia
+        '''
+        
+        with self.almacenamiento.bloquear():
+            self.sincronizar()
+            yield
     
-    def guardar_datos(self):
+    def guardar_cliente(self, cliente: Cliente):
         '''
-        Guardamos los archivos JSON
+        Persiste un cliente nuevo o modificado
         '''
         
-        try: 
-            #Guardamos clientes
-            with open(self.archivos_clientes , 'w' , encoding='utf-8') as f:
-                datos = {id_u: cliente.to_dict() for id_u, cliente in self.clientes.items()}
-                json.dump(datos, f, indent=2, ensure_ascii=False)
-                
-            #Guardamos facturas
-            with open(self.archivos_facturas, 'w' , encoding='utf-8') as f:
-                datos = {num_f: factura.to_dict() for num_f, factura in self.facturas.items()}
-                json.dump(datos, f, indent=2, ensure_ascii=False)
-                
+        try:
+            self.almacenamiento.guardar_cliente(cliente)
         except Exception as e:
             print(f"Error al guardar los datos: {e}")
+            
     
+    def guardar_factura(self, factura: Factura):
+        '''
+        Persiste una factura nueva o modificada
+        '''
+        
+        try:
+            self.almacenamiento.guardar_factura(factura)
+        except Exception as e:
+            print(f"Error al guardar los datos: {e}")
+            
+    
+    def _datos_incompletos(self) -> bool:
+        '''
+        True ( y avisa ) si la ultima carga fallo: los datos en memoria estan
+        a medias y guardarlos enteros sobrescribiria los archivos buenos
+        '''
+        
+        if self.error_carga is None:
+            return False
+        print(f"Aviso: la carga de datos fallo ( {self.error_carga} ), no se sobrescriben los archivos")
+        return True
+    
+    def compactar(self):
+        '''
+        Compacta el almacenamiento ( en JSON: snapshot nuevo y diario vacio )
+        
+        No hace nada si la carga de datos fallo
+        '''
+        
+        if self._datos_incompletos():
+            return
+        
+        with self._escritura():
+            self.almacenamiento.compactar(self.clientes, self.facturas)
+    
+    
+    def cerrar(self):
+        '''
+        Guarda todo ( cambios pendientes y snapshot nuevo ) y cierra el almacenamiento
+        '''
+        
+        self.compactar()
+        self.almacenamiento.cerrar()
+    
+    
+    def guardar_datos(self) -> bool:
+        '''
+        Guarda todos los datos de una vez
+        
+        returns:
+        True si se guardo correctamente, False si no ( o si la carga de datos fallo )
+        '''
+        
+        if self._datos_incompletos():
+            return False
+        
+        with self._escritura():
+            return self.almacenamiento.guardar_todo(self.clientes, self.facturas)
+    
+    
+    def actualizar_estado_factura(self, numero_factura: str, estado: str):
+        '''
+        Cambia el estado de una factura manteniendo los agregados al dia
+        
+        Args:
+        numero_factura : numero de la factura
+        estado : nuevo estado ( Pendiente, Pagada o Cancelada )
+        
+        Raises:
+        ErrorNoEncontrado si la factura no existe
+        ErrorValidacion si el estado no es valido
+        '''
+        
+        if estado not in ESTADOS_FACTURA:
+            raise ErrorValidacion(f"estado no valido: {estado}")
+        
+        with self._escritura():
+            if numero_factura not in self.facturas:
+                raise ErrorNoEncontrado(f"factura {numero_factura} no encontrada")
+            
+            self.asegurar_indices()
+            factura = self.facturas[numero_factura]
+            estado_anterior = factura.estado
+            
+            if estado == estado_anterior:
+                return
+            
+            factura.estado = estado
+            self.facturas[numero_factura] = factura
+            self.agregados.cambiar_estado(factura, estado_anterior)
+            self.indice_estados.mover(numero_factura, estado_anterior, estado)
+            self.guardar_factura(factura)
+        
     
     def generar_id_cliente(self) -> str:
         '''
-        Genera la ID del cliente
+        Genera la ID del cliente ( salta IDs ya usados por si el contador venia atrasado )
         '''
-        id_cliente = f"USR{self.contador_clientes:03d}"
-        self.contador_clientes += 1
-        return id_cliente
+        while True:
+            id_cliente = formatear_id(PREFIJO_CLIENTE, self.contador_clientes)
+            self.contador_clientes += 1
+            if id_cliente not in self.clientes:
+                return id_cliente
     
     def generar_numero_factura(self) -> str:
         '''
-        Genera el nº de factura
+        Genera el nº de factura ( salta numeros ya usados por si el contador venia atrasado )
         '''
-        num_factura = f"FAC{self.contador_facturas:03d}"
-        self.contador_facturas += 1
-        return num_factura
+        while True:
+            num_factura = formatear_id(PREFIJO_FACTURA, self.contador_facturas)
+            self.contador_facturas += 1
+            if num_factura not in self.facturas:
+                return num_factura
+    
+    def reconstruir_indice_email(self):
+        '''
+        Reconstruye el indice de emails a partir de los clientes cargados
+        '''
+        
+        self.indice_email = self.almacenamiento.crear_indice_email(self.clientes)
+    
+    def reconstruir_indices(self):
+        '''
+        Reconstruye los indices en memoria con una pasada por clientes y facturas
+        '''
+        
+        self.indice_nombres.limpiar()
+        self.indice_dominios.limpiar()
+        for id_cliente, cliente in self.clientes.items():
+            self.indice_nombres.agregar(id_cliente, cliente.nombre, cliente.apellidos)
+            self.indice_dominios.agregar(cliente.email, id_cliente)
+            
+        self.agregados.limpiar()
+        if isinstance(self.facturas, FacturasColumnares):
+            #Con columnas los totales salen de pasadas por lotes sin crear objetos
+            self.agregados.cargar_totales(self.facturas.agrupar("cliente"), self.facturas.totales())
+            self.indice_fechas.construir(self.facturas.fechas_emision())
+            self.indice_estados.construir(self.facturas.estados_factura())
+            self.indice_facturas_cliente.construir(self.facturas.clientes_factura())
+        else:
+            fechas = []
+            estados = []
+            clientes = []
+            for numero_factura, factura in self.facturas.items():
+                self.agregados.agregar_factura(factura)
+                fechas.append((factura.fecha_emision_ordinal, numero_factura))
+                estados.append((factura.estado, numero_factura))
+                clientes.append((factura.id_cliente, numero_factura))
+            self.indice_fechas.construir(fechas)
+            self.indice_estados.construir(estados)
+            self.indice_facturas_cliente.construir(clientes)
+            
+        self._indices_pendientes = False
+            
+    def asegurar_indices(self):
+        '''
+        Construye los indices si todavia no se han construido
+        '''
+        
+        if self._indices_pendientes:
+            self.reconstruir_indices()
+            
+    def _indexar_cliente(self, cliente: Cliente):
+        '''
+        Añade un cliente nuevo a los indices en memoria
+        '''
+        
+        self.indice_email.agregar(cliente.email, cliente.id_cliente)
+        
+        #Si aun no se construyeron, el cliente entrara al construirlos
+        if not self._indices_pendientes:
+            self.indice_nombres.agregar(cliente.id_cliente, cliente.nombre, cliente.apellidos)
+            self.indice_dominios.agregar(cliente.email, cliente.id_cliente)
+            
+    def _indexar_factura(self, factura: Factura):
+        '''
+        Añade una factura nueva a los indices y agregados en memoria
+        '''
+        
+        if not self._indices_pendientes:
+            self.agregados.agregar_factura(factura)
+            self.indice_fechas.agregar(factura.fecha_emision_ordinal, factura.numero_factura)
+            self.indice_estados.agregar(factura.estado, factura.numero_factura)
+            self.indice_facturas_cliente.agregar(factura.id_cliente, factura.numero_factura)
     
     def email_existe(self, email: str, excluir_id: str = None) -> bool:
         '''
@@ -111,10 +360,456 @@ class CRMSystem:
         true si el email existe, false si no
         '''
         
-        for id_cliente , cliente in self.clientes.items():
-            if id_cliente != excluir_id and cliente.email.lower() == email.lower():
-                return True
-            return False
+        return self.indice_email.existe(email, excluir_id)
+    
+    def buscar_por_email(self, email: str) -> Optional[Cliente]:
+        '''
+        Busca un cliente por email usando el indice
+        
+        returns:
+        El cliente encontrado o None
+        '''
+        
+        id_cliente = self.indice_email.obtener(email)
+        if id_cliente is None:
+            return None
+        return self.clientes.get(id_cliente)
+    
+    def buscar_por_nombre(self, texto: str, limite: int = None) -> List[Cliente]:
+        '''
+        Busca clientes por nombre, apellidos o nombre completo usando el indice
+        
+        Args:
+        texto : texto a buscar ( sin distinguir mayusculas ni acentos )
+        limite : numero maximo de resultados
+        
+        returns:
+        Lista de clientes ordenada por calidad de la coincidencia
+        '''
+        
+        self.asegurar_indices()
+        return [self.clientes[id_cliente] for id_cliente in self.indice_nombres.buscar(texto, limite)]
+    
+    def agrupar_facturas(self, por: str = "cliente") -> Dict[str, TotalesFacturas]:
+        '''
+        Totales de facturas agrupados por "cliente", "estado", "mes" o "trimestre"
+        
+        Con el almacen columnar se calcula sobre las columnas
+        '''
+        
+        if isinstance(self.facturas, FacturasColumnares):
+            return self.facturas.agrupar(por)
+        return agrupar_facturas(self.facturas.values(), por)
+    
+    def _rango_fechas(self, desde: Optional[str], hasta: Optional[str]) -> List[str]:
+        '''
+        Numeros de factura emitidos entre dos fechas usando el indice de fechas
+        '''
+        
+        inicio, fin = rango_ordinales(desde, hasta)
+        
+        self.asegurar_indices()
+        return self.indice_fechas.rango(inicio, fin)
+    
+    def facturas_entre(self, desde: str = None, hasta: str = None) -> List[Factura]:
+        '''
+        Facturas emitidas entre dos fechas ( incluidas ), en orden de fecha
+        
+        Args:
+        desde, hasta : fechas "dd/mm/aaaa" ( vacias = sin limite )
+        
+        Raises:
+        ErrorValidacion si alguna fecha no es valida
+        '''
+        
+        return [self.facturas[numero] for numero in self._rango_fechas(desde, hasta)]
+    
+    def ingresos_por_periodo(self, periodo: str = "mes", desde: str = None,
+                             hasta: str = None) -> Dict[str, Dict[str, TotalesFacturas]]:
+        '''
+        Ingresos por mes o trimestre desglosados por estado
+        
+        Args:
+        periodo : "mes" o "trimestre"
+        desde, hasta : fechas "dd/mm/aaaa" para acotar el informe ( vacias = sin limite )
+        
+        returns:
+        Diccionario periodo -> {estado -> TotalesFacturas}, en orden cronologico
+        
+        Raises:
+        ErrorValidacion si el periodo o las fechas no son validos
+        '''
+        
+        if periodo not in ("mes", "trimestre"):
+            raise ErrorValidacion(f"periodo no valido: {periodo}")
+        
+        numeros = self._rango_fechas(desde, hasta)
+        return ingresos_por_periodo((self.facturas[numero] for numero in numeros), periodo)
+    
+    def antiguedad_pendientes(self, fecha: str = None) -> Dict[str, TotalesFacturas]:
+        '''
+        Facturas pendientes agrupadas por dias desde su emision ( 0-30, 31-60, 61-90, mas de 90 )
+        
+        Args:
+        fecha : fecha de referencia "dd/mm/aaaa" ( por defecto hoy )
+        
+        returns:
+        Diccionario tramo -> TotalesFacturas
+        '''
+        
+        referencia = ordinal_consulta(fecha, "fecha")
+        if referencia is None:
+            referencia = date.today().toordinal()
+        
+        self.asegurar_indices()
+        resultado: Dict[str, TotalesFacturas] = {}
+        
+        for minimo, maximo, etiqueta in TRAMOS_ANTIGUEDAD:
+            #Cada tramo es un rango de fechas de emision; las fechas futuras cuentan en el primero
+            desde = None if maximo is None else referencia - maximo
+            hasta = None if minimo == 0 else referencia - minimo
+            
+            totales = resultado[etiqueta] = TotalesFacturas()
+            for numero in self.indice_fechas.rango(desde, hasta):
+                factura = self.facturas[numero]
+                if factura.codigo_estado == EstadoFactura.PENDIENTE:
+                    totales.sumar(factura)
+        
+        return resultado
+    
+    def facturas_por_estado(self, estado: str = "Pendiente", orden: str = "fecha",
+                            dias_minimos: int = 0) -> List[Factura]:
+        '''
+        Cola de trabajo: facturas de un estado usando el indice de estados
+        
+        El coste es proporcional al numero de facturas del estado, no al total
+        
+        Args:
+        estado : Pendiente, Pagada o Cancelada
+        orden : "fecha" ( mas antiguas primero y, a igual fecha, mayor monto ) o
+                "monto" ( mayor monto primero y, a igual monto, mas antiguas )
+        dias_minimos : solo facturas emitidas hace al menos tantos dias ( p.ej. vencidas )
+        
+        Raises:
+        ErrorValidacion si el estado, el orden o los dias no son validos
+        '''
+        
+        if estado not in ESTADOS_FACTURA:
+            raise ErrorValidacion(f"estado no valido: {estado}")
+        if orden not in ("fecha", "monto"):
+            raise ErrorValidacion(f"orden no valido: {orden}")
+        try:
+            dias_minimos = int(dias_minimos or 0)
+        except (TypeError, ValueError):
+            raise ErrorValidacion(f"numero de dias no valido: {dias_minimos}") from None
+        
+        self.asegurar_indices()
+        facturas = [self.facturas[numero] for numero in self.indice_estados.numeros(estado)]
+        
+        if dias_minimos > 0:
+            limite = date.today().toordinal() - dias_minimos
+            facturas = [factura for factura in facturas if factura.fecha_emision_ordinal <= limite]
+        
+        if orden == "fecha":
+            facturas.sort(key=lambda f: (f.fecha_emision_ordinal, -f.monto, f.numero_factura))
+        else:
+            facturas.sort(key=lambda f: (-f.monto, f.fecha_emision_ordinal, f.numero_factura))
+        return facturas
+    
+    def consultar(self, *predicados: Predicado, entidad: str = "facturas") -> Consulta:
+        '''
+        Consulta con condiciones combinables sobre facturas o clientes ( ver consultas.py )
+        
+        La consulta se ejecuta al pedir sus resultados, con el indice mas
+        selectivo que resuelva alguna condicion; explicar() muestra el plan
+        
+        Args:
+        predicados : condiciones que deben cumplirse todas ( MontoEntre, EstadoEn,
+                     EmitidaEntre, CampoCliente, DominioEmail... combinables con & | ~ )
+        entidad : "facturas" o "clientes"
+        
+        Raises:
+        ErrorValidacion si la entidad o alguna condicion no son validas
+        '''
+        
+        return Consulta(self, entidad, predicados)
+    
+    def verificar(self, reparar: bool = False) -> Dict[str, List[str]]:
+        '''
+        Comprueba la relacion cliente -> facturas con operaciones de conjuntos
+        
+        Compara los pares (cliente, factura) del indice con los que salen de
+        las propias facturas y busca facturas cuyo cliente no existe
+        
+        Args:
+        reparar : reconstruye el indice y reescribe el snapshot y su manifiesto ( sin
+                  las listas de facturas que guardaban los clientes en versiones antiguas );
+                  las facturas huerfanas solo se informan, no se borran
+        
+        returns:
+        Diccionario con las listas ordenadas de problemas encontrados:
+        facturas_huerfanas ( su cliente no existe ), referencias_colgantes
+        ( entradas del indice sin factura o con otro cliente ) y
+        facturas_sin_indexar ( facturas que faltan en el indice ) y
+        archivos_incorrectos ( archivos que no coinciden con su manifiesto o checksum )
+        '''
+        
+        self.asegurar_indices()
+        
+        if isinstance(self.facturas, FacturasColumnares):
+            esperados = set(self.facturas.clientes_factura())
+        else:
+            esperados = {(factura.id_cliente, numero) for numero, factura in self.facturas.items()}
+        
+        indice = self.indice_facturas_cliente
+        actuales = {(id_cliente, numero) for id_cliente in indice.clientes() for numero in indice.numeros(id_cliente)}
+        
+        sin_cliente = {id_cliente for id_cliente, _ in esperados} - set(self.clientes)
+        informe = {
+            'facturas_huerfanas': sorted((numero for id_cliente, numero in esperados if id_cliente in sin_cliente),
+                                         key=clave_id),
+            'referencias_colgantes': [f"{id_cliente}:{numero}" for id_cliente, numero in
+                                      sorted(actuales - esperados, key=lambda par: (clave_id(par[0]), clave_id(par[1])))],
+            'facturas_sin_indexar': sorted((numero for _, numero in esperados - actuales), key=clave_id),
+            'archivos_incorrectos': self.almacenamiento.verificar_archivos()
+        }
+        
+        if reparar:
+            self.reconstruir_indices()
+            self.compactar()
+        
+        return informe
+    
+    @staticmethod
+    def _obligatorio(valor: str, nombre_campo: str) -> str:
+        '''
+        Devuelve el valor sin espacios o lanza ErrorValidacion si esta vacio
+        '''
+        
+        if valor is None or not str(valor).strip():
+            raise ErrorValidacion(f"{nombre_campo} no puede estar vacio")
+        return str(valor).strip()
+    
+    def obtener_cliente(self, id_cliente: str) -> Cliente:
+        '''
+        Devuelve el cliente con ese ID
+        
+        Raises:
+        ErrorNoEncontrado si no existe
+        '''
+        
+        id_cliente = (id_cliente or "").strip().upper()
+        if id_cliente not in self.clientes:
+            raise ErrorNoEncontrado(f"cliente {id_cliente} no encontrado")
+        return self.clientes[id_cliente]
+    
+    def alta_cliente(self, nombre: str, apellidos: str, email: str, telefono: str = "",
+                     direccion: str = "") -> Cliente:
+        '''
+        Registra un cliente nuevo
+        
+        Args:
+        nombre, apellidos, email : datos obligatorios
+        telefono, direccion : datos opcionales
+        
+        returns:
+        El cliente creado con su ID asignado
+        
+        Raises:
+        ErrorValidacion si algun dato no es valido o el email ya existe
+        '''
+        
+        nombre = self._obligatorio(nombre, "nombre")
+        apellidos = self._obligatorio(apellidos, "apellidos")
+        email = self._obligatorio(email, "email")
+        
+        if not Validador.validar_email(email):
+            raise ErrorValidacion("email no valido")
+        
+        cliente = Cliente(nombre, apellidos, email, (telefono or "").strip(), (direccion or "").strip())
+        
+        with self._escritura():
+            if self.email_existe(email):
+                raise ErrorValidacion("el email ya existe")
+            
+            cliente.id_cliente = self.generar_id_cliente()
+            
+            self.clientes[cliente.id_cliente] = cliente
+            self._indexar_cliente(cliente)
+            self.guardar_cliente(cliente)
+        
+        return cliente
+    
+    def emitir_factura(self, id_cliente: str, descripcion: str, monto, estado: str = "Pendiente") -> Factura:
+        '''
+        Crea una factura para un cliente
+        
+        Args:
+        id_cliente : ID del cliente
+        descripcion : descripcion del servicio o producto
+        monto : importe positivo ( numero o texto )
+        estado : Pendiente, Pagada o Cancelada
+        
+        returns:
+        La factura creada con su numero asignado
+        
+        Raises:
+        ErrorNoEncontrado si el cliente no existe
+        ErrorValidacion si algun dato no es valido
+        '''
+        
+        descripcion = self._obligatorio(descripcion, "descripcion")
+        
+        es_valido, monto = Validador.validar_monto(str(monto))
+        if not es_valido:
+            raise ErrorValidacion("monto no valido ( numero positivo )")
+        
+        if estado not in ESTADOS_FACTURA:
+            raise ErrorValidacion(f"estado no valido: {estado}")
+        
+        with self._escritura():
+            cliente = self.obtener_cliente(id_cliente)
+            
+            factura = Factura(cliente.id_cliente, descripcion, monto)
+            factura.estado = estado
+            factura.numero_factura = self.generar_numero_factura()
+            
+            self.facturas[factura.numero_factura] = factura
+            self._indexar_factura(factura)
+            self.guardar_factura(factura)
+        
+        return factura
+    
+    def alta_lote(self, clientes: List[Cliente] = (), facturas: List[Factura] = ()) -> List[Cliente]:
+        '''
+        Da de alta de una vez clientes y facturas ya validados ( importacion masiva )
+        
+        Con el almacenamiento bloqueado se asignan los IDs, se añaden a los
+        indices y se guarda todo con una sola escritura ( guardar_lote )
+        
+        Args:
+        clientes : clientes nuevos ( sin ID )
+        facturas : facturas nuevas de clientes existentes ( sin numero )
+        
+        returns:
+        Clientes descartados porque su email se dio de alta mientras tanto ( otra sesion )
+        '''
+        
+        nuevos = []
+        descartados = []
+        
+        with self._escritura():
+            for cliente in clientes:
+                if self.email_existe(cliente.email):
+                    descartados.append(cliente)
+                    continue
+                
+                cliente.id_cliente = self.generar_id_cliente()
+                self.clientes[cliente.id_cliente] = cliente
+                self._indexar_cliente(cliente)
+                nuevos.append(cliente)
+            
+            for factura in facturas:
+                factura.numero_factura = self.generar_numero_factura()
+                self.facturas[factura.numero_factura] = factura
+                self._indexar_factura(factura)
+            
+            self.almacenamiento.guardar_lote(nuevos, list(facturas))
+        
+        return descartados
+    
+    def facturas_de_cliente(self, id_cliente: str) -> List[Factura]:
+        '''
+        Devuelve las facturas de un cliente en orden de alta
+        
+        Raises:
+        ErrorNoEncontrado si el cliente no existe
+        '''
+        
+        cliente = self.obtener_cliente(id_cliente)
+        self.asegurar_indices()
+        return [self.facturas[num] for num in self.indice_facturas_cliente.numeros(cliente.id_cliente)]
+    
+    def resumen_cliente(self, id_cliente: str) -> TotalesFacturas:
+        '''
+        Totales acumulados de las facturas de un cliente
+        
+        Raises:
+        ErrorNoEncontrado si el cliente no existe
+        '''
+        
+        cliente = self.obtener_cliente(id_cliente)
+        self.asegurar_indices()
+        return self.agregados.cliente(cliente.id_cliente)
+    
+    def resumen_sistema(self) -> dict:
+        '''
+        Totales generales del sistema
+        '''
+        
+        self.asegurar_indices()
+        resumen = self.agregados.sistema.to_dict()
+        resumen['num_clientes'] = len(self.clientes)
+        return resumen
+    
+    def top_clientes(self, metrica: str = "total", n: int = 10) -> List[Tuple[Cliente, TotalesFacturas]]:
+        '''
+        Los n clientes con mas facturado, pagado, pendiente o numero de facturas
+        
+        Args:
+        metrica : "total", "pagado", "pendiente" o "num_facturas"
+        n : numero de clientes del ranking
+        
+        returns:
+        Lista de (cliente, totales) de mayor a menor
+        
+        Raises:
+        ErrorValidacion si la metrica o n no son validos
+        '''
+        
+        if metrica not in METRICAS_RANKING:
+            raise ErrorValidacion(f"metrica no valida: {metrica}")
+        try:
+            n = int(n)
+        except (TypeError, ValueError):
+            raise ErrorValidacion(f"numero de clientes no valido: {n}") from None
+        if n < 1:
+            raise ErrorValidacion("el numero de clientes debe ser mayor que 0")
+        
+        self.asegurar_indices()
+        #Las facturas huerfanas ( ver verificar ) tienen totales pero no cliente: se saltan
+        return [(self.clientes[id_cliente], self.agregados.cliente(id_cliente))
+                for id_cliente, _ in self.agregados.top_clientes(metrica, n, self.clientes)]
+    
+    def actualizar_email_cliente(self, id_cliente: str, email: str):
+        '''
+        Cambia el email de un cliente manteniendo el indice actualizado
+        
+        Args:
+        id_cliente : ID del cliente a modificar
+        email : nuevo email
+        
+        Raises:
+        ErrorNoEncontrado si el cliente no existe
+        ErrorValidacion si el email no es valido o ya pertenece a otro cliente
+        '''
+        
+        if not Validador.validar_email(email):
+            raise ErrorValidacion("email no valido")
+        
+        with self._escritura():
+            cliente = self.obtener_cliente(id_cliente)
+            
+            if self.email_existe(email, excluir_id=id_cliente):
+                raise ErrorValidacion(f"el email {email} ya existe")
+            
+            self.indice_email.eliminar(cliente.email, id_cliente)
+            if not self._indices_pendientes:
+                self.indice_dominios.eliminar(cliente.email, id_cliente)
+                self.indice_dominios.agregar(email, id_cliente)
+            cliente.email = email
+            self.indice_email.agregar(email, id_cliente)
+            self.guardar_cliente(cliente)
         
     
     def registrar_cliente(self):
@@ -162,19 +857,12 @@ class CRMSystem:
             telefono = input("Ingrese telefono(opcional): ").strip()
             direccion = input("Ingrese direccion(opcional): ").strip()
             
-            #Creamos cliente 
-            
-            cliente = Cliente(nombre,apellidos,email,telefono,direccion)
-            id_cliente = self.generar_id_cliente()
-            cliente.id_cliente = id_cliente 
-            
-            #Guardamos cliente
+            #Creamos y guardamos el cliente
             
-            self.clientes[id_cliente] = cliente
-            self.guardar_datos()
+            cliente = self.alta_cliente(nombre, apellidos, email, telefono, direccion)
             
             print("\nCliente registrado correctamente")
-            print(f"ID asignado:{id_cliente}")
+            print(f"ID asignado:{cliente.id_cliente}")
             print(f"Fecha de registro:{cliente.fecha_registro}")
             
         except KeyboardInterrupt:
@@ -209,12 +897,7 @@ class CRMSystem:
                 
             if metodo == "1":
                 email = input("Ingresa email: ").strip()
-                cliente_encontrado = None 
-                
-                for cliente in self.clientes.values():
-                    if cliente.email.lower() == email.lower():
-                        cliente_encontrado = cliente
-                        break
+                cliente_encontrado = self.buscar_por_email(email)
                     
                 if cliente_encontrado:
                     print("\n --- USUARIO ENCONTRADO ---")
@@ -224,16 +907,8 @@ class CRMSystem:
                     print("Cliente no encontrado")
                     
             elif metodo == "2":
-                nombre = input("Ingresa nombre: ").strip().lower()
-                clientes_encontrados = []
-                
-                
-                for cliente in self.clientes.values():
-                    if (nombre in cliente.nombre.lower() or
-                        nombre in cliente.apellidos.lower() or
-                        nombre in cliente.nombre_completo().lower()):
-                       
-                       clientes_encontrados.append(cliente)
+                nombre = input("Ingresa nombre: ").strip()
+                clientes_encontrados = self.buscar_por_nombre(nombre)
                 
                 if clientes_encontrados:
                     print(f"\n --- USARIOS ENCONTRADOS ({len(clientes_encontrados)}) ---")
@@ -270,12 +945,7 @@ class CRMSystem:
             
             #Buscamos cliente por email
             
-            cliente_encontrado = None
-            
-            for cliente in self.clientes.values():
-                if cliente.email.lower() == email.lower():
-                    cliente_encontrado = cliente
-                    break
+            cliente_encontrado = self.buscar_por_email(email)
         
             if not cliente_encontrado:
                 print("Cliente no encontrado")
@@ -324,21 +994,12 @@ class CRMSystem:
                     print("Opcion invalida, introduce 1 , 2 o 3 ")
                     
                     
-            #Creamos factura
-            
-            factura = Factura(cliente_encontrado.id_cliente,descripcion,monto)
-            factura.estado = estado
-            numero_factura = self.generar_numero_factura()
-            factura.numero_factura = numero_factura
-            
-            #Guardamos factura
+            #Creamos y guardamos la factura
             
-            self.facturas[numero_factura] = factura
-            cliente_encontrado.facturas.append(numero_factura)
-            self.guardar_datos()
+            factura = self.emitir_factura(cliente_encontrado.id_cliente, descripcion, monto, estado)
             
             print("\nFactura creada correctamente")
-            print(f"Numero de factura: {numero_factura}")
+            print(f"Numero de factura: {factura.numero_factura}")
             print(f"Fecha emision: {factura.fecha_emision}")
             print(f"Cliente: {cliente_encontrado.nombre_completo()}")
             print(f"Descripcion: {descripcion}")
@@ -362,20 +1023,47 @@ class CRMSystem:
             print("No hay clientes registrados")
             return
         
-        contador = 1 
-        
-        for cliente in self.clientes.values():
-            print(f"\nCliente #{contador}:")
-            print(f"ID: {cliente.id_cliente}")
-            print(f"Nombre: {cliente.nombre_completo()}")
-            print(f"Email: {cliente.email}")
-            print(f"Telefono: {cliente.telefono}")
-            print(f"Fecha de registro: {cliente.fecha_registro}")
-            contador +=1
+        self.paginador.mostrar(self.formatear_clientes(), len(self.clientes))
             
         print(f"\nTotal de clientes registrados: {len(self.clientes)}")
         
     
+    def formatear_clientes(self, clientes: Iterable[Cliente] = None) -> Iterator[str]:
+        '''
+        Genera el bloque de texto de cada cliente para los listados ( por defecto todos )
+        '''
+        
+        for contador, cliente in enumerate(self.clientes.values() if clientes is None else clientes, 1):
+            yield (f"\nCliente #{contador}:\n"
+                   f"ID: {cliente.id_cliente}\n"
+                   f"Nombre: {cliente.nombre_completo()}\n"
+                   f"Email: {cliente.email}\n"
+                   f"Telefono: {cliente.telefono}\n"
+                   f"Fecha de registro: {cliente.fecha_registro}\n")
+            
+    def formatear_facturas(self, cliente: Cliente) -> Iterator[str]:
+        '''
+        Genera el bloque de texto de cada factura del cliente
+        '''
+        
+        for factura in self.facturas_de_cliente(cliente.id_cliente):
+            yield (f"\nFactura #{factura.numero_factura}\n"
+                   f"Fecha: {factura.fecha_emision}\n"
+                   f"Descripcion: {factura.descripcion}\n"
+                   f"Monto: {factura.monto:.2f} €\n"
+                   f"Estado: {factura.estado}\n")
+        
+    
+    def formatear_cola(self, facturas: List[Factura]) -> Iterator[str]:
+        '''
+        Genera una linea por factura de una cola de trabajo ( facturas_por_estado )
+        '''
+        
+        hoy = date.today().toordinal()
+        for factura in facturas:
+            yield (f"{factura.fecha_emision}  #{factura.numero_factura}  {factura.id_cliente:<11}"
+                   f"{factura.monto:>12.2f} €  {factura.estado:<10}{hoy - factura.fecha_emision_ordinal:>6} dias\n")
+    
     def mostrar_facturas_cliente(self):
         '''
         Opcion 5: Mostrar factura de 1 cliente
@@ -392,8 +1080,8 @@ class CRMSystem:
             #Mostramos lista de clientes
             
             print("\nClientes disponibles:")
-            for cliente in self.clientes.values():
-                print(f"ID: {cliente.id_cliente} - {cliente.nombre_completo()}")
+            self.paginador.mostrar((f"ID: {cliente.id_cliente} - {cliente.nombre_completo()}\n"
+                                    for cliente in self.clientes.values()), len(self.clientes))
                 
 
             #Solicitamos ID del cliente
@@ -407,29 +1095,23 @@ class CRMSystem:
             cliente = self.clientes[id_cliente]
             print(f"\n ===== FACTURAS DE  {cliente.nombre_completo().upper()} =====")
             
-            if not cliente.facturas:
+            self.asegurar_indices()
+            num_facturas = self.indice_facturas_cliente.contar(id_cliente)
+            if not num_facturas:
                 print("Este cliente no tiene facturas")
                 return
             
             #Mostramos facturas
             
-            total_facturas = 0
-            total_monto = 0 
-            
-            for numero_factura in cliente.facturas:
-                if numero_factura in self.facturas:
-                    factura = self.facturas[numero_factura]
-                    print(f"\nFactura #{numero_factura}")
-                    print(f"Fecha: {factura.fecha_emision}")
-                    print(f"Descripcion: {factura.descripcion}")
-                    print(f"Monto: {factura.monto:.2f} €")
-                    print(f"Estado: {factura.estado}")
-                    total_facturas += 1
-                    total_monto += factura.monto
+            self.paginador.mostrar(self.formatear_facturas(cliente), num_facturas)
+                    
+            #Totales acumulados del cliente
+            
+            totales = self.resumen_cliente(id_cliente)
                     
             print(f"\nResumen:")
-            print(f"Total facturas: {total_facturas}")
-            print(f"Monto total: {total_monto:.2f} €")
+            print(f"Total facturas: {totales.num_facturas}")
+            print(f"Monto total: {totales.total:.2f} €")
             
         except KeyboardInterrupt:
             print("\nOperacion cancelada")
@@ -447,58 +1129,196 @@ class CRMSystem:
             print("No hay clientes registrados")
             return
 
-        total_clientes = 0 
-        total_facturas_sistema = 0
-        ingresos_totales = 0 
-        ingresos_recibidos = 0
-        ingresos_pendientes = 0
-        
         for cliente in self.clientes.values():
-            total_facturas_cliente = len(cliente.facturas)
-            monto_total_cliente = 0
-            facturas_pagadas_cliente = 0
-            facturas_pendientes_cliente = 0
-            
-            #Calculamos totales por cliente
-            
-            for numero_factura in cliente.facturas:
-                if numero_factura in self.facturas:
-                    factura = self.facturas[numero_factura]
-                    monto_total_cliente += factura.monto
-                    
-                    if factura.estado == "Pagada":
-                        facturas_pagadas_cliente += factura.monto
-                    
-                    elif factura.estado == "Pendiente":
-                        facturas_pendientes_cliente += factura.monto
-            
+            totales = self.resumen_cliente(cliente.id_cliente)
             
             #Mostramos informacion del cliente
             
             print(f"\nCliente:  {cliente.nombre_completo()} ({cliente.email})")
-            print(f"- TOTAL FACTURAS: {total_facturas_cliente}")
-            print(f"- Monto total: {monto_total_cliente:.2f}€")
-            print(f"- Facturas pagadas: {facturas_pagadas_cliente:.2f}")
-            print(f"- Facturas pendientes: {facturas_pendientes_cliente:.2f}")
+            print(f"- TOTAL FACTURAS: {totales.num_facturas}")
+            print(f"- Monto total: {totales.total:.2f}€")
+            print(f"- Facturas pagadas: {totales.pagado:.2f}")
+            print(f"- Facturas pendientes: {totales.pendiente:.2f}")
+            
+        
+        #Mostrar resumen general ( totales acumulados del sistema )
+        
+        sistema = self.resumen_sistema()
+        print(f"\n --- RESUMEN GENERAL --- ")
+        print(f"Total clientes: {sistema['num_clientes']}")
+        print(f"Total facturas emitidas: {sistema['num_facturas']}")
+        print(f"Ingresos totales: {sistema['total']:.2f} €")
+        print(f"Ingresos pendientes: {sistema['pendiente']:.2f} €")
+        print(f"Ingresos recibidos: {sistema['pagado']:.2f} €")
+        
+    def cambiar_estado_factura(self):
+        '''
+        Opcion 7: Cambiar el estado de una factura
+        '''
+        
+        print("\n ===== CAMBIAR ESTADO DE FACTURA =====")
+        
+        if not self.facturas:
+            print("No hay facturas registradas")
+            return
+        
+        try:
+            numero_factura = input("Introduce el numero de factura: ").strip().upper()
+            
+            if numero_factura not in self.facturas:
+                print("Factura no encontrada")
+                return
             
-            #Acumulamos totales del sistema
+            factura = self.facturas[numero_factura]
+            print(f"Estado actual: {factura.estado}")
             
-            total_clientes += 1
-            total_facturas_sistema += total_facturas_cliente
-            ingresos_totales += monto_total_cliente
-            ingresos_recibidos += facturas_pagadas_cliente
-            ingresos_pendientes += facturas_pendientes_cliente
+            for num, estado in enumerate(ESTADOS_FACTURA, 1):
+                print(f"{num}. {estado}")
+                
+            while True:
+                estado_opcion = input("Nuevo estado: ").strip()
+                if estado_opcion in ("1", "2", "3"):
+                    estado = ESTADOS_FACTURA[int(estado_opcion) - 1]
+                    break
+                print("Opcion invalida, introduce 1 , 2 o 3 ")
+                
+            self.actualizar_estado_factura(numero_factura, estado)
+            print(f"\nFactura {numero_factura} actualizada: {estado}")
             
+        except KeyboardInterrupt:
+            print("\nOperacion cancelada")
+        except Exception as e:
+            print(f"Error al cambiar el estado: {e}")
+        
+    
+    def mostrar_informes(self):
+        '''
+        Opcion 8: Informes ( facturas de un periodo, ingresos, antiguedad de pendientes, mejores clientes,
+        colas por estado y consultas con filtros )
+        '''
         
-        #Mostrar resumen general
+        print("\n ===== INFORMES =====")
         
-        print(f"\n --- RESUMEN GENERAL --- ")
-        print(f"Total clientes: {total_clientes}")
-        print(f"Total facturas emitidas: {total_facturas_sistema}")
-        print(f"Ingresos totales: {ingresos_totales:.2f} €")
-        print(f"Ingresos pendientes: {ingresos_pendientes:.2f} €")
-        print(f"Ingresos recibidos: {ingresos_recibidos:.2f} €")
+        if not self.facturas:
+            print("No hay facturas registradas")
+            return
+        
+        print("1. Facturas entre dos fechas")
+        print("2. Ingresos mensuales por estado")
+        print("3. Ingresos trimestrales por estado")
+        print("4. Antiguedad de facturas pendientes")
+        print("5. Mejores clientes")
+        print("6. Facturas por estado ( cola de trabajo )")
+        print("7. Consulta de facturas con filtros")
+        
+        try:
+            opcion = input("Selecciona un informe: ").strip()
+        
+            if opcion in ("1", "2", "3"):
+                print("Fechas en formato dd/mm/aaaa ( Enter para no limitar )")
+                desde = input("Desde: ").strip()
+                hasta = input("Hasta: ").strip()
+        
+            if opcion == "1":
+                numeros = self._rango_fechas(desde, hasta)
+                print(f"\n{len(numeros)} facturas encontradas")
+                self.paginador.mostrar((f"{factura.fecha_emision}  #{factura.numero_factura}  "
+                                        f"{factura.id_cliente}  {factura.monto:>10.2f} €  {factura.estado}\n"
+                                        for factura in map(self.facturas.__getitem__, numeros)), len(numeros))
+        
+            elif opcion in ("2", "3"):
+                periodo = "mes" if opcion == "2" else "trimestre"
+                informe = self.ingresos_por_periodo(periodo, desde, hasta)
+        
+                if not informe:
+                    print("No hay facturas en esas fechas")
+                    return
+        
+                print(f"\n{'Periodo':<10}" + "".join(f"{estado:>14}" for estado in ESTADOS_FACTURA) + f"{'Total':>14}")
+                for clave, por_estado in informe.items():
+                    importes = [por_estado[estado].total if estado in por_estado else 0.0 for estado in ESTADOS_FACTURA]
+                    print(f"{clave:<10}" + "".join(f"{importe:>14.2f}" for importe in importes) + f"{sum(importes):>14.2f}")
+        
+            elif opcion == "4":
+                print(f"\n{'Antiguedad':<16}{'Facturas':>10}{'Pendiente':>16}")
+                for tramo, totales in self.antiguedad_pendientes().items():
+                    print(f"{tramo:<16}{totales.num_facturas:>10}{totales.pendiente:>14.2f} €")
+        
+            elif opcion == "5":
+                print("Ordenar por: 1. Total facturado  2. Pagado  3. Pendiente  4. Numero de facturas")
+                metrica = {"1": "total", "2": "pagado", "3": "pendiente", "4": "num_facturas"}.get(input("Metrica: ").strip())
+                if metrica is None:
+                    print("Metrica no valida")
+                    return
+                n = input("Numero de clientes ( Enter = 10 ): ").strip() or 10
         
+                print(f"\n{'#':>4}  {'ID':<11}{'Cliente':<30}{'Facturas':>10}{'Total':>14}{'Pagado':>14}{'Pendiente':>14}")
+                for posicion, (cliente, totales) in enumerate(self.top_clientes(metrica, n), 1):
+                    nombre = f"{cliente.nombre} {cliente.apellidos}"[:29]
+                    print(f"{posicion:>4}  {cliente.id_cliente:<11}{nombre:<30}{totales.num_facturas:>10}"
+                          f"{totales.total:>14.2f}{totales.pagado:>14.2f}{totales.pendiente:>14.2f}")
+        
+            elif opcion == "6":
+                estado = input("Estado ( Enter = Pendiente ): ").strip().capitalize() or "Pendiente"
+                orden = "monto" if input("Ordenar por 1. Fecha  2. Monto: ").strip() == "2" else "fecha"
+                dias = input("Antiguedad minima en dias ( Enter = todas ): ").strip() or 0
+                facturas = self.facturas_por_estado(estado, orden, dias)
+                print(f"\n{len(facturas)} facturas en estado {estado}")
+                self.paginador.mostrar(self.formatear_cola(facturas), len(facturas))
+        
+            elif opcion == "7":
+                print("Deja en blanco los filtros que no quieras usar ( fechas en formato dd/mm/aaaa )")
+                filtros = {
+                    'estado': input("Estado: ").strip().capitalize(),
+                    'monto_min': input("Monto minimo: ").strip(),
+                    'monto_max': input("Monto maximo: ").strip(),
+                    'desde': input("Emitidas desde: ").strip(),
+                    'hasta': input("Emitidas hasta: ").strip(),
+                    'dominio': input("Dominio del email del cliente ( p.ej. empresa.es ): ").strip(),
+                    'nombre': input("Nombre del cliente contiene: ").strip()
+                }
+                consulta = self.consultar(*predicados_desde_filtros(filtros))
+                print(f"\n{consulta.explicar()}")
+                facturas = consulta.resultados()
+                print(f"\n{len(facturas)} facturas encontradas")
+                self.paginador.mostrar(self.formatear_cola(facturas), len(facturas))
+        
+            else:
+                print("Opcion no valida")
+        
+        except KeyboardInterrupt:
+            print("\nOperacion cancelada")
+        except ErrorValidacion as e:
+            print(f"Error: {e}")
+
+
+    def mostrar_metricas(self):
+        '''
+        Opcion oculta ( m ): metricas de rendimiento y captura de perfiles
+        '''
+        
+        print("\n ===== METRICAS =====")
+        
+        if not self.metricas.activo:
+            activar = input("Las metricas estan desactivadas. ¿Activarlas ahora? (s/n): ").strip().lower()
+            if activar != "s":
+                return
+            self.metricas.activo = True
+            self.instrumentar()
+        
+        print(self.metricas.tabla())
+        
+        print("Operaciones: " + ", ".join(OPERACIONES_MEDIDAS + tuple("menu." + op for op in OPERACIONES_MENU)))
+        operacion = input("Operacion a perfilar en su proxima llamada ( Enter para ninguna, 'r' reinicia ): ").strip()
+        
+        if operacion == "r":
+            self.metricas.limpiar()
+            print("Metricas reiniciadas")
+        elif operacion:
+            self.metricas.perfilar(operacion)
+            print(f"La proxima llamada a {operacion} se guardara en {self.metricas.archivo_perfil}")
+        
+    
     def mostrar_detalle_cliente(self, cliente: Cliente):
         '''
         Funcion auxiliar para mostrar informacion detallada de un cliente
@@ -526,7 +1346,9 @@ class CRMSystem:
         print("4. Mostrar todos los clientes")
         print("5. Mostrar facturas de un cliente")
         print("6. Resumen financiero por cliente")
-        print("7. Salir")
+        print("7. Cambiar estado de factura")
+        print("8. Informes")
+        print("9. Salir")
         print("=" * 30)
         
     def ejecutar(self):
@@ -544,6 +1366,9 @@ class CRMSystem:
                 self.mostrar_menu()
                 opcion = input("Selecciona una opción: ").strip()
                 
+                #Traemos lo que hayan guardado otras sesiones ( solo si cambio algo )
+                self.sincronizar()
+                
                 if opcion == "1":
                     self.registrar_cliente()
                     
@@ -563,17 +1388,27 @@ class CRMSystem:
                     self.resumen_financiero()
                     
                 elif opcion == "7":
+                    self.cambiar_estado_factura()
+                    
+                elif opcion.lower() == "m":
+                    self.mostrar_metricas()
+                    
+                elif opcion == "8":
+                    self.mostrar_informes()
+                    
+                elif opcion == "9":
+                    self.cerrar()
                     print("\n GRACIAS POR USAS EL SISTEMA")
                     print("DATOS GUARDADOS CORRECTAMENTE")
                     break
                 else:
-                    print("Opcion no valida. Introduce una opcion del 1 al 7 ")
+                    print("Opcion no valida. Introduce una opcion del 1 al 9 ")
                     
                 input("\nPresiona Enter para continuar...")
                 
             except KeyboardInterrupt:
                 print("\n\n SALIENDO DEL SISTEMA...")
-                self.guardar_datos
+                self.cerrar()
                 break
         
             except Exception as e :
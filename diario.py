@@ -0,0 +1,169 @@
+import json
+import os
+from typing import Iterable, Iterator, Tuple
+
+
+class DiarioOperaciones:
+    '''
+    Diario de operaciones de solo escritura al final ( append-only )
+
+    Cada operacion se guarda como una linea JSON, de modo que el coste de
+    registrar un cambio depende del tamaño del cambio y no de la base de datos
+    '''
+
+    def __init__(self, ruta: str, fsync: bool = True):
+        '''
+        Inicia el diario
+
+        Args:
+        ruta : ruta del archivo del diario
+        fsync : si es True se fuerza la escritura a disco tras cada operacion
+        '''
+
+        self.ruta = ruta
+        self.fsync = fsync
+        self.entradas = 0
+        self.posicion = 0      # Bytes del archivo ya leidos o escritos por este proceso
+        self._archivo = None
+
+    def _abrir(self):
+        '''
+        Abre el archivo en modo añadir si no esta abierto
+        '''
+
+        if self._archivo is None:
+            self._archivo = open(self.ruta, 'a+b')
+        return self._archivo
+
+    def _escribir(self, texto: str):
+        '''
+        Añade texto al final del archivo
+
+        Si el archivo termina en una linea incompleta ( otro proceso se cayo
+        a mitad de escritura ) se cierra primero con un salto de linea para
+        no pegar la operacion nueva a la incompleta
+        '''
+
+        archivo = self._abrir()
+        archivo.seek(0, os.SEEK_END)
+        if archivo.tell() > 0:
+            archivo.seek(-1, os.SEEK_END)
+            if archivo.read(1) != b"\n":
+                texto = "\n" + texto
+
+        archivo.write(texto.encode('utf-8'))
+        archivo.flush()
+
+        if self.fsync:
+            os.fsync(archivo.fileno())
+
+        self.posicion = archivo.tell()
+
+    def registrar(self, tipo: str, datos: dict):
+        '''
+        Añade una operacion al final del diario
+
+        Args:
+        tipo : tipo de operacion ( "cliente" o "factura" )
+        datos : registro completo en formato diccionario
+        '''
+
+        linea = json.dumps({'op': tipo, 'datos': datos}, ensure_ascii=False)
+        self._escribir(linea + "\n")
+        self.entradas += 1
+
+    def registrar_lote(self, operaciones: Iterable[Tuple[str, dict]]):
+        '''
+        Añade varias operaciones con una sola escritura ( y un solo fsync )
+
+        Args:
+        operaciones : tuplas (tipo, datos)
+        '''
+
+        lineas = [json.dumps({'op': tipo, 'datos': datos}, ensure_ascii=False) + "\n"
+                  for tipo, datos in operaciones]
+        if not lineas:
+            return
+
+        self._escribir("".join(lineas))
+        self.entradas += len(lineas)
+
+    def sincronizar(self):
+        '''
+        Fuerza a disco las operaciones pendientes ( util con fsync=False )
+        '''
+
+        if self._archivo is not None:
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+
+    def leer(self, desde: int = 0) -> Iterator[Tuple[str, dict]]:
+        '''
+        Recorre las operaciones guardadas en orden
+
+        Una ultima linea sin salto de linea ( caida durante la escritura ) no
+        se lee ni se cuenta en la posicion; una linea corrupta o que no es una
+        operacion se descarta
+
+        Args:
+        desde : posicion en bytes desde la que leer ( 0 = todo el diario )
+
+        returns:
+        Iterador de tuplas (tipo, datos)
+        '''
+
+        if not desde:
+            self.entradas = 0
+        self.posicion = desde
+
+        if not os.path.exists(self.ruta):
+            return
+
+        with open(self.ruta, 'rb') as f:
+            f.seek(desde)
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    break
+
+                self.posicion += len(linea)
+                if not linea.strip():
+                    continue
+
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    print(f"Aviso: linea del diario incompleta ( byte {self.posicion - len(linea)} ), se descarta")
+                    continue
+
+                #JSON valido pero sin la forma {"op": ..., "datos": {...}} ( editado a mano o de otro programa )
+                if not isinstance(entrada, dict) or not isinstance(entrada.get('op'), str) \
+                        or not isinstance(entrada.get('datos'), dict):
+                    print(f"Aviso: linea del diario no valida ( byte {self.posicion - len(linea)} ), se descarta")
+                    continue
+
+                self.entradas += 1
+                yield entrada['op'], entrada['datos']
+
+    def truncar(self):
+        '''
+        Vacia el diario ( tras compactarlo en un snapshot )
+        '''
+
+        self.cerrar()
+        with open(self.ruta, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.entradas = 0
+        self.posicion = 0
+
+    def cerrar(self):
+        '''
+        Cierra el archivo del diario
+        '''
+
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def __len__(self) -> int:
+        return self.entradas
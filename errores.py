@@ -0,0 +1,19 @@
+class ErrorCRM(Exception):
+    '''
+    Error base de las operaciones del CRM
+    '''
+
+
+class ErrorValidacion(ErrorCRM, ValueError):
+    '''
+    Datos de entrada no validos ( campo vacio, email repetido, monto negativo... )
+    '''
+
+
+class ErrorNoEncontrado(ErrorCRM, KeyError):
+    '''
+    El cliente o la factura solicitados no existen
+    '''
+
+    def __str__(self) -> str:
+        return str(self.args[0]) if self.args else ""
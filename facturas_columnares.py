@@ -0,0 +1,187 @@
+from array import array
+from itertools import compress
+from typing import Dict, Iterator, List, MutableMapping
+from models import Factura, EstadoFactura, ESTADOS_FACTURA
+from agregados import CLAVES_PERIODO, TotalesFacturas
+
+
+#Codigo de fila borrada en la columna de estados
+_BORRADA = -1
+
+#Tablas de traduccion codigo de estado -> 1/0 para filtrar columnas con compress
+_MASCARA_PAGADA = bytes(1 if i == EstadoFactura.PAGADA else 0 for i in range(256))
+_MASCARA_PENDIENTE = bytes(1 if i == EstadoFactura.PENDIENTE else 0 for i in range(256))
+_MASCARA_VIVA = bytes(0 if i == _BORRADA % 256 else 1 for i in range(256))
+
+_PAGADA = int(EstadoFactura.PAGADA)
+_PENDIENTE = int(EstadoFactura.PENDIENTE)
+
+
+class FacturasColumnares(MutableMapping):
+    '''
+    Almacen de facturas por columnas ( array ) con la interfaz de un dict
+
+    Cada factura ocupa una fila en columnas paralelas de cliente, monto,
+    estado y fecha, en lugar de un objeto Factura por factura. Al acceder a
+    una factura se crea un objeto nuevo: para modificarla hay que volver a
+    asignarla ( facturas[numero] = factura )
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el almacen vacio
+        '''
+
+        self.numeros: List[str] = []
+        self.descripciones: List[str] = []
+        self.clientes = array('l')     # Indice en self.ids_cliente
+        self.montos = array('d')
+        self.estados = array('b')      # Codigo EstadoFactura, -1 si la fila esta borrada
+        self.fechas = array('l')       # Ordinal de la fecha de emision
+        self.ids_cliente: List[str] = []
+        self._indice_cliente: Dict[str, int] = {}
+        self._filas: Dict[str, int] = {}
+
+    def _codigo_cliente(self, id_cliente: str) -> int:
+        '''
+        Devuelve el indice del cliente en la columna, creandolo si hace falta
+        '''
+
+        codigo = self._indice_cliente.get(id_cliente)
+        if codigo is None:
+            codigo = self._indice_cliente[id_cliente] = len(self.ids_cliente)
+            self.ids_cliente.append(id_cliente)
+        return codigo
+
+    def __getitem__(self, numero_factura: str) -> Factura:
+        fila = self._filas[numero_factura]
+
+        factura = Factura(self.ids_cliente[self.clientes[fila]], self.descripciones[fila], self.montos[fila])
+        factura.numero_factura = numero_factura
+        factura.fecha_emision_ordinal = self.fechas[fila]
+        factura.codigo_estado = EstadoFactura(self.estados[fila])
+        return factura
+
+    def __setitem__(self, numero_factura: str, factura: Factura):
+        fila = self._filas.get(numero_factura)
+        codigo = self._codigo_cliente(factura.id_cliente)
+
+        if fila is None:
+            self._filas[numero_factura] = len(self.numeros)
+            self.numeros.append(numero_factura)
+            self.descripciones.append(factura.descripcion)
+            self.clientes.append(codigo)
+            self.montos.append(factura.monto)
+            self.estados.append(factura.codigo_estado)
+            self.fechas.append(factura.fecha_emision_ordinal)
+        else:
+            self.descripciones[fila] = factura.descripcion
+            self.clientes[fila] = codigo
+            self.montos[fila] = factura.monto
+            self.estados[fila] = factura.codigo_estado
+            self.fechas[fila] = factura.fecha_emision_ordinal
+
+    def __delitem__(self, numero_factura: str):
+        fila = self._filas.pop(numero_factura)
+        self.estados[fila] = _BORRADA
+        self.montos[fila] = 0.0
+        self.descripciones[fila] = ""
+
+    def __contains__(self, numero_factura) -> bool:
+        return numero_factura in self._filas
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._filas)
+
+    def __len__(self) -> int:
+        return len(self._filas)
+
+    def _mascara(self, tabla: bytes) -> bytes:
+        '''
+        Mascara 1/0 por fila segun el codigo de estado
+        '''
+        return self.estados.tobytes().translate(tabla)
+
+    def totales(self) -> TotalesFacturas:
+        '''
+        Totales de todas las facturas calculados sobre las columnas
+        '''
+
+        totales = TotalesFacturas()
+        totales.num_facturas = len(self._filas)
+        totales.total = sum(self.montos, 0.0)    # Las filas borradas tienen monto 0
+        totales.pagado = sum(compress(self.montos, self._mascara(_MASCARA_PAGADA)), 0.0)
+        totales.pendiente = sum(compress(self.montos, self._mascara(_MASCARA_PENDIENTE)), 0.0)
+        return totales
+
+    def fechas_emision(self) -> Iterator[tuple]:
+        '''
+        Pares (ordinal de emision, numero de factura) de las filas vivas, sin crear facturas
+        '''
+        return compress(zip(self.fechas, self.numeros), self._mascara(_MASCARA_VIVA))
+
+    def clientes_factura(self) -> Iterator[tuple]:
+        '''
+        Pares (id de cliente, numero de factura) de las filas vivas, sin crear facturas
+        '''
+        ids = self.ids_cliente
+        return ((ids[codigo], numero)
+                for codigo, numero in compress(zip(self.clientes, self.numeros), self._mascara(_MASCARA_VIVA)))
+
+    def estados_factura(self) -> Iterator[tuple]:
+        '''
+        Pares (estado, numero de factura) de las filas vivas, sin crear facturas
+        '''
+        return ((ESTADOS_FACTURA[codigo], numero)
+                for codigo, numero in compress(zip(self.estados, self.numeros), self._mascara(_MASCARA_VIVA)))
+
+    def agrupar(self, por: str = "cliente") -> Dict[str, TotalesFacturas]:
+        '''
+        Totales agrupados recorriendo solo las columnas necesarias
+
+        Args:
+        por : "cliente", "estado", "mes" ( clave "aaaa-mm" ) o "trimestre" ( clave "aaaa-Tn" )
+
+        returns:
+        Diccionario clave -> TotalesFacturas
+        '''
+
+        if por == "cliente":
+            claves = self.clientes
+            nombre_clave = self.ids_cliente.__getitem__
+        elif por == "estado":
+            claves = self.estados
+            nombre_clave = ESTADOS_FACTURA.__getitem__
+        elif por in CLAVES_PERIODO:
+            claves = self.fechas
+            nombre_clave = CLAVES_PERIODO[por]
+        else:
+            raise ValueError(f"agrupacion no valida: {por}")
+
+        #Acumulamos por codigo en listas y solo al final traducimos a claves
+        grupos: Dict[int, list] = {}
+        viva = self._mascara(_MASCARA_VIVA)
+
+        for codigo, monto, estado in compress(zip(claves, self.montos, self.estados), viva):
+            acumulado = grupos.get(codigo)
+            if acumulado is None:
+                acumulado = grupos[codigo] = [0, 0.0, 0.0, 0.0]
+            acumulado[0] += 1
+            acumulado[1] += monto
+            if estado == _PAGADA:
+                acumulado[2] += monto
+            elif estado == _PENDIENTE:
+                acumulado[3] += monto
+
+        resultado: Dict[str, TotalesFacturas] = {}
+        for codigo, (num, total, pagado, pendiente) in grupos.items():
+            clave = nombre_clave(codigo)
+            totales = resultado.get(clave)
+            if totales is None:
+                totales = resultado[clave] = TotalesFacturas()
+            totales.num_facturas += num
+            totales.total += total
+            totales.pagado += pagado
+            totales.pendiente += pendiente
+
+        return resultado
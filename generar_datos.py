@@ -0,0 +1,163 @@
+'''
+Generador de datos sinteticos para pruebas de rendimiento
+
+Escribe clientes.json, facturas.json y su manifiesto con el mismo formato que el sistema,
+registro a registro, de modo que se pueden generar millones de facturas sin
+tenerlas en memoria
+'''
+
+import argparse
+import json
+import os
+import random
+from array import array
+from datetime import date, timedelta
+from itertools import accumulate
+from models import ESTADOS_FACTURA, FORMATO_FECHA, PREFIJO_CLIENTE, PREFIJO_FACTURA, formatear_id
+from manifiesto import Manifiesto, NOMBRE_MANIFIESTO
+
+
+NOMBRES = ["Ana", "Antonio", "Carmen", "José", "María", "Manuel", "Lucía", "Javier", "Laura", "David",
+           "Isabel", "Francisco", "Pilar", "Sergio", "Elena", "Álvaro", "Sofía", "Jorge", "Marta", "Raúl",
+           "Nuria", "Iñigo", "Paula", "Rubén", "Cristina", "Óscar", "Beatriz", "Andrés", "Rocío", "Tomás"]
+
+APELLIDOS = ["García", "Fernández", "González", "Rodríguez", "López", "Martínez", "Sánchez", "Pérez",
+             "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez",
+             "Romero", "Alonso", "Gutiérrez", "Navarro", "Torres", "Domínguez", "Vázquez", "Ramos",
+             "Gil", "Ramírez", "Serrano", "Blanco", "Molina", "Castro", "Ortega", "Rubio", "Núñez"]
+
+DOMINIOS = ["gmail.com", "hotmail.com", "yahoo.es", "outlook.com", "empresa.es", "correo.com"]
+
+CALLES = ["Calle Mayor", "Avenida de la Constitución", "Calle Real", "Plaza de España", "Calle Nueva",
+          "Paseo del Prado", "Calle del Sol", "Avenida de América"]
+
+SERVICIOS = ["Consultoría", "Mantenimiento", "Licencia anual", "Soporte técnico", "Formación",
+             "Desarrollo a medida", "Auditoría", "Hosting", "Diseño web", "Migración de datos"]
+
+#Proporcion aproximada de cada estado ( Pendiente, Pagada, Cancelada )
+PESOS_ESTADOS = [0.3, 0.6, 0.1]
+
+
+def _sin_acentos(texto: str) -> str:
+    return texto.lower().translate(str.maketrans("áéíóúñü", "aeiounu"))
+
+
+def escribir_objeto(ruta: str, registros):
+    '''
+    Escribe un objeto JSON {clave: registro} a partir de un iterador de pares
+    sin construirlo en memoria
+
+    returns:
+    Numero de registros escritos
+    '''
+
+    escritos = 0
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write("{")
+        for clave, registro in registros:
+            f.write(",\n" if escritos else "\n")
+            f.write(json.dumps(clave, ensure_ascii=False))
+            f.write(": ")
+            f.write(json.dumps(registro, ensure_ascii=False))
+            escritos += 1
+        f.write("\n}\n")
+    return escritos
+
+
+def generar(directorio: str, num_clientes: int, num_facturas: int, semilla: int = 42, anios: int = 3):
+    '''
+    Genera un conjunto de datos en el directorio indicado
+
+    Las facturas se reparten entre clientes de forma desigual ( pocos
+    clientes con muchas facturas ), con fechas de los ultimos años
+
+    Args:
+    directorio : directorio de destino ( se crea si no existe )
+    num_clientes : numero de clientes
+    num_facturas : numero de facturas
+    semilla : semilla aleatoria ( mismos parametros, mismos datos )
+    anios : años hacia atras en los que se reparten las fechas
+    '''
+
+    if num_clientes < 1 and num_facturas:
+        raise ValueError("hace falta al menos un cliente para generar facturas")
+
+    os.makedirs(directorio, exist_ok=True)
+    aleatorio = random.Random(semilla)
+    hoy = date.today()
+    inicio = hoy - timedelta(days=365 * anios)
+    dias = (hoy - inicio).days
+
+    #Repartimos las facturas entre clientes con una distribucion de Pareto,
+    #por bloques para no tener millones de asignaciones en memoria
+    pesos = list(accumulate(aleatorio.paretovariate(1.2) for _ in range(num_clientes)))
+    por_cliente = array('l', bytes(8 * num_clientes)) if num_clientes else array('l')
+    pendientes = num_facturas
+    while pendientes:
+        bloque = min(pendientes, 100000)
+        for cliente in aleatorio.choices(range(num_clientes), cum_weights=pesos, k=bloque):
+            por_cliente[cliente] += 1
+        pendientes -= bloque
+    del pesos
+
+    #Cada cliente recibe un tramo consecutivo de numeros de factura
+    primera = array('l', accumulate(por_cliente, initial=1))
+
+    altas = [inicio + timedelta(days=aleatorio.randrange(dias)) for _ in range(num_clientes)]
+
+    def clientes():
+        for i in range(num_clientes):
+            nombre = aleatorio.choice(NOMBRES)
+            apellidos = f"{aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}"
+            usuario = f"{_sin_acentos(nombre)}.{_sin_acentos(apellidos.split()[0])}{i + 1}"
+            id_cliente = formatear_id(PREFIJO_CLIENTE, i + 1)
+            yield id_cliente, {
+                'id_cliente': id_cliente,
+                'nombre': nombre,
+                'apellidos': apellidos,
+                'email': f"{usuario}@{aleatorio.choice(DOMINIOS)}",
+                'telefono': f"6{aleatorio.randrange(10 ** 8):08d}",
+                'direccion': f"{aleatorio.choice(CALLES)} {aleatorio.randrange(1, 200)}",
+                'fecha_registro': altas[i].strftime(FORMATO_FECHA)
+            }
+
+    def facturas():
+        for cliente in range(num_clientes):
+            for n in range(primera[cliente], primera[cliente + 1]):
+                dias_desde_alta = (hoy - altas[cliente]).days
+                emision = altas[cliente] + timedelta(days=aleatorio.randrange(dias_desde_alta + 1))
+                numero_factura = formatear_id(PREFIJO_FACTURA, n)
+                yield numero_factura, {
+                    'numero_factura': numero_factura,
+                    'id_cliente': formatear_id(PREFIJO_CLIENTE, cliente + 1),
+                    'descripcion': aleatorio.choice(SERVICIOS),
+                    'monto': round(aleatorio.lognormvariate(5.5, 1.0), 2),
+                    'fecha_emision': emision.strftime(FORMATO_FECHA) +
+                                     f" {aleatorio.randrange(8, 20):02d}:{aleatorio.randrange(60):02d}",
+                    'estado': aleatorio.choices(ESTADOS_FACTURA, weights=PESOS_ESTADOS)[0]
+                }
+
+    escribir_objeto(os.path.join(directorio, "clientes.json"), clientes())
+    escribir_objeto(os.path.join(directorio, "facturas.json"), facturas())
+
+    #Manifiesto para que el CRM arranque sin recorrer los IDs
+    manifiesto = Manifiesto(num_clientes + 1, num_facturas + 1, num_clientes, num_facturas)
+    for nombre in ("clientes.json", "facturas.json"):
+        manifiesto.describir_archivo(nombre, os.path.join(directorio, nombre))
+    manifiesto.escribir(os.path.join(directorio, NOMBRE_MANIFIESTO))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sinteticos para el CRM")
+    parser.add_argument("--clientes", type=int, default=1000, help="numero de clientes")
+    parser.add_argument("--facturas", type=int, default=10000, help="numero de facturas ( p.ej. 10000 a 5000000 )")
+    parser.add_argument("--directorio", default="datos_prueba", help="directorio de destino")
+    parser.add_argument("--semilla", type=int, default=42, help="semilla aleatoria")
+    args = parser.parse_args()
+
+    generar(args.directorio, args.clientes, args.facturas, args.semilla)
+    print(f"Generados {args.clientes} clientes y {args.facturas} facturas en {args.directorio}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import csv
+import json
+from typing import Iterator, List, Optional, Set, Tuple
+from models import Cliente, Factura
+from validators import Validador
+
+
+class ResultadoImportacion:
+    '''
+    Resumen de una importacion masiva
+    '''
+
+    def __init__(self):
+        self.aceptados = 0
+        self.rechazados = 0
+        self.archivo_errores: Optional[str] = None
+
+    def __str__(self) -> str:
+        texto = f"Registros importados: {self.aceptados} - Rechazados: {self.rechazados}"
+        if self.archivo_errores:
+            texto += f" ( ver {self.archivo_errores} )"
+        return texto
+
+
+def leer_registros(ruta: str) -> Iterator[Tuple[int, dict]]:
+    '''
+    Lee un archivo CSV ( con cabecera ) o JSONL registro a registro
+
+    returns:
+    Iterador de tuplas (numero de linea, registro)
+    '''
+
+    if ruta.lower().endswith(".csv"):
+        #utf-8-sig descarta el BOM que añade Excel al exportar "CSV UTF-8"
+        with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+            lector = csv.DictReader(f)
+            for registro in lector:
+                yield lector.line_num, registro
+        return
+
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for num_linea, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError as e:
+                registro = {'_error': f"JSON invalido: {e}", '_linea': linea.rstrip("\n")}
+            if not isinstance(registro, dict):
+                registro = {'_error': "la linea no es un objeto JSON", '_linea': linea.rstrip("\n")}
+            yield num_linea, registro
+
+
+class ImportadorMasivo:
+    '''
+    Importa clientes y facturas en bloque validando por lotes y guardando una sola vez
+    '''
+
+    def __init__(self, crm, archivo_errores: str = "errores_importacion.csv", tam_lote: int = 1000):
+        '''
+        Args:
+        crm : instancia de CRMSystem donde se importan los datos
+        archivo_errores : CSV donde se escriben las filas rechazadas
+        tam_lote : registros validados en cada lote
+        '''
+
+        self.crm = crm
+        self.archivo_errores = archivo_errores
+        self.tam_lote = tam_lote
+        self._errores = None
+        self._escritor = None
+        self._emails_nuevos: Set[str] = set()     # Emails normalizados aceptados en la importacion
+
+    def _rechazar(self, resultado: ResultadoImportacion, num_linea: int, motivo: str, registro: dict):
+        '''
+        Anota una fila rechazada en el archivo de errores ( se crea al primer error )
+        '''
+
+        if self._escritor is None:
+            self._errores = open(self.archivo_errores, 'w', encoding='utf-8', newline='')
+            self._escritor = csv.writer(self._errores)
+            self._escritor.writerow(["linea", "motivo", "registro"])
+            resultado.archivo_errores = self.archivo_errores
+
+        self._escritor.writerow([num_linea, motivo, json.dumps(registro, ensure_ascii=False)])
+        resultado.rechazados += 1
+
+    def _cerrar_errores(self):
+        if self._errores is not None:
+            self._errores.close()
+            self._errores = None
+            self._escritor = None
+
+    def _lotes(self, ruta: str) -> Iterator[List[Tuple[int, dict]]]:
+        '''
+        Agrupa los registros del archivo en lotes de tam_lote
+        '''
+
+        lote = []
+        for entrada in leer_registros(ruta):
+            lote.append(entrada)
+            if len(lote) >= self.tam_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    def importar_clientes(self, ruta: str) -> ResultadoImportacion:
+        '''
+        Importa clientes desde CSV o JSONL
+
+        Columnas: nombre, apellidos, email, telefono, direccion, fecha_registro ( opcional )
+        '''
+
+        resultado = ResultadoImportacion()
+        nuevos: List[Tuple[int, dict, Cliente]] = []
+
+        try:
+            #Validamos contra los datos al dia; alta_lote repite la comprobacion de emails con el bloqueo
+            self.crm.sincronizar()
+            for lote in self._lotes(ruta):
+                #Validamos el lote entero ( formato y duplicados en una pasada )
+                validacion = Validador.validar_lote_clientes([registro for _, registro in lote],
+                                                             self.crm.email_existe, self._emails_nuevos)
+                validos = dict(validacion.validos)
+
+                for posicion, (num_linea, registro) in enumerate(lote):
+                    if '_error' in registro:
+                        self._rechazar(resultado, num_linea, registro['_error'], registro)
+                        continue
+
+                    if posicion in validacion.errores:
+                        self._rechazar(resultado, num_linea, validacion.motivo(posicion), registro)
+                        continue
+
+                    datos = validos[posicion]
+                    cliente = Cliente(datos["nombre"], datos["apellidos"], datos["email"],
+                                      datos["telefono"], datos["direccion"])
+                    if datos["fecha_registro"] is not None:
+                        cliente.fecha_registro_ordinal = datos["fecha_registro"]
+
+                    nuevos.append((num_linea, registro, cliente))
+
+            #Añadimos todo al sistema y guardamos una sola vez
+            descartados = set(self.crm.alta_lote([cliente for _, _, cliente in nuevos]))
+            for num_linea, registro, cliente in nuevos:
+                if cliente in descartados:
+                    self._rechazar(resultado, num_linea, "email: el email ya existe", registro)
+            resultado.aceptados = len(nuevos) - len(descartados)
+
+        finally:
+            self._cerrar_errores()
+            self._emails_nuevos.clear()
+
+        return resultado
+
+    def _buscar_cliente(self, registro: dict) -> Optional[Cliente]:
+        '''
+        Localiza el cliente de una factura por id_cliente o por email
+        '''
+
+        id_cliente = str(registro.get("id_cliente") or "").strip().upper()
+        if id_cliente:
+            return self.crm.clientes.get(id_cliente)
+
+        email = str(registro.get("email") or "").strip()
+        if email:
+            return self.crm.buscar_por_email(email)
+
+        return None
+
+    def importar_facturas(self, ruta: str) -> ResultadoImportacion:
+        '''
+        Importa facturas desde CSV o JSONL
+
+        Columnas: id_cliente o email, descripcion, monto, estado ( por defecto Pendiente ),
+        fecha_emision ( opcional )
+        '''
+
+        resultado = ResultadoImportacion()
+        nuevas: List[Factura] = []
+
+        try:
+            #Traemos los clientes que hayan dado de alta otras sesiones
+            self.crm.sincronizar()
+            for lote in self._lotes(ruta):
+                validacion = Validador.validar_lote_facturas([registro for _, registro in lote])
+                validos = dict(validacion.validos)
+
+                for posicion, (num_linea, registro) in enumerate(lote):
+                    if '_error' in registro:
+                        self._rechazar(resultado, num_linea, registro['_error'], registro)
+                        continue
+
+                    cliente = self._buscar_cliente(registro)
+                    if cliente is None:
+                        self._rechazar(resultado, num_linea, "cliente no encontrado", registro)
+                        continue
+
+                    if posicion in validacion.errores:
+                        self._rechazar(resultado, num_linea, validacion.motivo(posicion), registro)
+                        continue
+
+                    datos = validos[posicion]
+                    factura = Factura(cliente.id_cliente, datos["descripcion"], datos["monto"])
+                    factura.estado = datos["estado"]
+                    if datos["fecha_emision"] is not None:
+                        factura.fecha_emision_ordinal = datos["fecha_emision"]
+
+                    nuevas.append(factura)
+
+            #Añadimos todo al sistema y guardamos una sola vez ( los numeros se asignan con el bloqueo )
+            self.crm.alta_lote(facturas=nuevas)
+            resultado.aceptados = len(nuevas)
+
+        finally:
+            self._cerrar_errores()
+
+        return resultado
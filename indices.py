@@ -0,0 +1,548 @@
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class IndiceEmail:
+    '''
+    Indice hash unico de emails normalizados -> ID de cliente
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self._ids: Dict[str, str] = {}
+
+    @staticmethod
+    def normalizar(email: str) -> str:
+        '''
+        Normaliza el email para usarlo como clave del indice
+        '''
+        return email.strip().lower()
+
+    def agregar(self, email: str, id_cliente: str):
+        '''
+        Añade un email al indice
+
+        Args:
+        email : email del cliente
+        id_cliente : ID del cliente al que pertenece
+
+        Raises:
+        ValueError si el email ya pertenece a otro cliente
+        '''
+
+        clave = self.normalizar(email)
+        actual = self._ids.get(clave)
+
+        if actual is not None and actual != id_cliente:
+            raise ValueError(f"el email {email} ya pertenece al cliente {actual}")
+
+        self._ids[clave] = id_cliente
+
+    def eliminar(self, email: str, id_cliente: str = None):
+        '''
+        Quita un email del indice
+
+        Args:
+        email : email a quitar
+        id_cliente : si se indica, solo se quita si pertenece a ese cliente
+        '''
+
+        clave = self.normalizar(email)
+
+        if id_cliente is None or self._ids.get(clave) == id_cliente:
+            self._ids.pop(clave, None)
+
+    def obtener(self, email: str) -> Optional[str]:
+        '''
+        Devuelve el ID del cliente con ese email o None
+        '''
+        return self._ids.get(self.normalizar(email))
+
+    def existe(self, email: str, excluir_id: str = None) -> bool:
+        '''
+        Verifica si el email esta registrado
+
+        Args:
+        email : email a revisar
+        excluir_id : id de usuario a excluir de la verificacion
+
+        returns:
+        True si el email pertenece a otro cliente, False si no
+        '''
+
+        actual = self.obtener(email)
+        return actual is not None and actual != excluir_id
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class IndiceDominios:
+    '''
+    Indice dominio del email -> IDs de los clientes con ese dominio
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self._ids: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def dominio(email: str) -> str:
+        '''
+        Dominio normalizado de un email ( tambien acepta el dominio solo, con o sin @ )
+        '''
+        return email.rsplit("@", 1)[-1].strip().lower()
+
+    def agregar(self, email: str, id_cliente: str):
+        '''
+        Añade el cliente al conjunto del dominio de su email
+        '''
+
+        ids = self._ids.get(self.dominio(email))
+        if ids is None:
+            ids = self._ids[self.dominio(email)] = set()
+        ids.add(id_cliente)
+
+    def eliminar(self, email: str, id_cliente: str):
+        '''
+        Quita el cliente del conjunto del dominio de su email
+        '''
+
+        clave = self.dominio(email)
+        ids = self._ids.get(clave)
+        if ids is not None:
+            ids.discard(id_cliente)
+            if not ids:
+                del self._ids[clave]
+
+    def ids(self, dominio: str) -> Set[str]:
+        '''
+        IDs de los clientes del dominio ( conjunto del indice, no modificar )
+        '''
+        return self._ids.get(self.dominio(dominio), set())
+
+    def contar(self, dominio: str) -> int:
+        return len(self._ids.get(self.dominio(dominio), ()))
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._ids.values())
+
+
+def normalizar_texto(texto: str) -> str:
+    '''
+    Pasa el texto a minusculas, quita los acentos y colapsa los espacios
+    '''
+
+    descompuesto = unicodedata.normalize('NFKD', texto.casefold())
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.split())
+
+
+class IndiceNombres:
+    '''
+    Indice invertido de trigramas sobre el nombre completo normalizado
+
+    Las busquedas de 3 o mas caracteres encuentran cualquier subcadena
+    intersectando las listas de trigramas ( empezando por la mas corta );
+    las mas cortas buscan por prefijo de palabra
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self._textos: Dict[str, Tuple[str, int]] = {}   # ID -> (nombre completo normalizado, longitud del nombre)
+        self._trigramas: Dict[str, Set[str]] = {}
+        self._prefijos: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _trigramas_de(texto: str) -> Set[str]:
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    @staticmethod
+    def _prefijos_de(texto: str) -> Set[str]:
+        prefijos = set()
+        for palabra in texto.split():
+            prefijos.add(palabra[:1])
+            prefijos.add(palabra[:2])
+        return prefijos
+
+    def agregar(self, id_cliente: str, nombre: str, apellidos: str):
+        '''
+        Añade ( o reemplaza ) un cliente en el indice
+
+        Args:
+        id_cliente : ID del cliente
+        nombre : nombre del cliente
+        apellidos : apellidos del cliente
+        '''
+
+        if id_cliente in self._textos:
+            self.eliminar(id_cliente)
+
+        nombre_n = normalizar_texto(nombre)
+        completo = normalizar_texto(f"{nombre} {apellidos}")
+        self._textos[id_cliente] = (completo, len(nombre_n))
+
+        for trigrama in self._trigramas_de(completo):
+            self._trigramas.setdefault(trigrama, set()).add(id_cliente)
+
+        for prefijo in self._prefijos_de(completo):
+            self._prefijos.setdefault(prefijo, set()).add(id_cliente)
+
+    def eliminar(self, id_cliente: str):
+        '''
+        Quita un cliente del indice
+        '''
+
+        datos = self._textos.pop(id_cliente, None)
+        if datos is None:
+            return
+
+        completo = datos[0]
+        for tabla, claves in ((self._trigramas, self._trigramas_de(completo)),
+                              (self._prefijos, self._prefijos_de(completo))):
+            for clave in claves:
+                ids = tabla.get(clave)
+                if ids is not None:
+                    ids.discard(id_cliente)
+                    if not ids:
+                        del tabla[clave]
+
+    def _candidatos(self, consulta: str) -> Set[str]:
+        '''
+        Intersecta las listas de la consulta empezando por la mas pequeña
+        '''
+
+        if len(consulta) < 3:
+            return set(self._prefijos.get(consulta, ()))
+
+        listas = []
+        for trigrama in self._trigramas_de(consulta):
+            ids = self._trigramas.get(trigrama)
+            if not ids:
+                return set()
+            listas.append(ids)
+
+        listas.sort(key=len)
+        candidatos = set(listas[0])
+        for ids in listas[1:]:
+            candidatos &= ids
+            if not candidatos:
+                break
+        return candidatos
+
+    def _puntuacion(self, consulta: str, id_cliente: str) -> Optional[int]:
+        '''
+        Calidad de la coincidencia ( menor es mejor ) o None si no coincide
+
+        0 = nombre, apellidos o nombre completo exactos
+        1 = el nombre completo empieza por la consulta
+        2 = alguna palabra empieza por la consulta
+        3 = la consulta aparece en mitad de una palabra
+        '''
+
+        completo, largo_nombre = self._textos[id_cliente]
+        posicion = completo.find(consulta)
+
+        if posicion < 0:
+            return None
+
+        if consulta in (completo, completo[:largo_nombre], completo[largo_nombre + 1:]):
+            return 0
+        if posicion == 0:
+            return 1
+        if completo[posicion - 1] == " " or f" {consulta}" in completo:
+            return 2
+        return 3
+
+    def buscar(self, texto: str, limite: int = None) -> List[str]:
+        '''
+        Busca clientes cuyo nombre, apellidos o nombre completo contengan el texto
+
+        Args:
+        texto : texto a buscar ( sin distinguir mayusculas ni acentos )
+        limite : numero maximo de resultados
+
+        returns:
+        Lista de IDs ordenada por calidad de la coincidencia
+        '''
+
+        consulta = normalizar_texto(texto)
+        if not consulta:
+            return []
+
+        resultados = []
+        for id_cliente in self._candidatos(consulta):
+            puntuacion = self._puntuacion(consulta, id_cliente)
+            if puntuacion is not None:
+                resultados.append((puntuacion, len(self._textos[id_cliente][0]), id_cliente))
+
+        resultados.sort()
+        ids = [id_cliente for _, _, id_cliente in resultados]
+        return ids[:limite] if limite else ids
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+
+        self._textos.clear()
+        self._trigramas.clear()
+        self._prefijos.clear()
+
+    def __len__(self) -> int:
+        return len(self._textos)
+
+
+class IndiceFechas:
+    '''
+    Indice ordenado fecha de emision ( ordinal ) -> numero de factura
+
+    Dos columnas paralelas ordenadas por fecha; los rangos se resuelven con
+    busqueda binaria. Las facturas nuevas suelen ser las mas recientes, asi
+    que insertarlas casi siempre es añadir al final
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self.fechas = array('l')
+        self.numeros: List[str] = []
+
+    def construir(self, pares: Iterable[Tuple[int, str]]):
+        '''
+        Sustituye el contenido por los pares (ordinal, numero_factura) ordenados de una vez
+        '''
+
+        ordenados = sorted(pares)
+        self.fechas = array('l', [fecha for fecha, _ in ordenados])
+        self.numeros = [numero for _, numero in ordenados]
+
+    def agregar(self, fecha: int, numero_factura: str):
+        '''
+        Añade una factura manteniendo el orden
+        '''
+
+        if not self.fechas or fecha >= self.fechas[-1]:
+            self.fechas.append(fecha)
+            self.numeros.append(numero_factura)
+            return
+
+        posicion = bisect_right(self.fechas, fecha)
+        self.fechas.insert(posicion, fecha)
+        self.numeros.insert(posicion, numero_factura)
+
+    def eliminar(self, fecha: int, numero_factura: str):
+        '''
+        Quita una factura ( se busca solo entre las de su misma fecha )
+        '''
+
+        inicio = bisect_left(self.fechas, fecha)
+        fin = bisect_right(self.fechas, fecha, inicio)
+        for posicion in range(inicio, fin):
+            if self.numeros[posicion] == numero_factura:
+                del self.fechas[posicion]
+                del self.numeros[posicion]
+                return
+
+    def rango(self, desde: Optional[int] = None, hasta: Optional[int] = None) -> List[str]:
+        '''
+        Numeros de las facturas emitidas entre dos fechas ( ambas incluidas ), en orden de fecha
+
+        Args:
+        desde, hasta : ordinales de los extremos ( None = sin limite )
+        '''
+
+        inicio = 0 if desde is None else bisect_left(self.fechas, desde)
+        fin = len(self.fechas) if hasta is None else bisect_right(self.fechas, hasta)
+        return self.numeros[inicio:fin]
+
+    def contar_rango(self, desde: Optional[int] = None, hasta: Optional[int] = None) -> int:
+        '''
+        Numero de facturas emitidas entre dos fechas ( sin copiar sus numeros )
+        '''
+
+        inicio = 0 if desde is None else bisect_left(self.fechas, desde)
+        fin = len(self.fechas) if hasta is None else bisect_right(self.fechas, hasta)
+        return max(0, fin - inicio)
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+
+        self.fechas = array('l')
+        self.numeros = []
+
+    def __len__(self) -> int:
+        return len(self.numeros)
+
+
+class IndiceEstados:
+    '''
+    Indice estado -> conjunto de numeros de factura
+
+    Permite obtener las facturas de un estado ( p.ej. las pendientes ) con
+    un coste proporcional a cuantas hay, sin recorrer todas las facturas
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self._numeros: Dict[str, Set[str]] = {}
+
+    def construir(self, pares: Iterable[Tuple[str, str]]):
+        '''
+        Sustituye el contenido por los pares (estado, numero_factura)
+        '''
+
+        self._numeros = {}
+        for estado, numero_factura in pares:
+            self.agregar(estado, numero_factura)
+
+    def agregar(self, estado: str, numero_factura: str):
+        '''
+        Añade una factura al conjunto de su estado
+        '''
+
+        numeros = self._numeros.get(estado)
+        if numeros is None:
+            numeros = self._numeros[estado] = set()
+        numeros.add(numero_factura)
+
+    def eliminar(self, estado: str, numero_factura: str):
+        '''
+        Quita una factura del conjunto de su estado
+        '''
+
+        numeros = self._numeros.get(estado)
+        if numeros is not None:
+            numeros.discard(numero_factura)
+
+    def mover(self, numero_factura: str, anterior: str, nuevo: str):
+        '''
+        Pasa una factura del estado anterior al nuevo
+        '''
+
+        self.eliminar(anterior, numero_factura)
+        self.agregar(nuevo, numero_factura)
+
+    def numeros(self, estado: str) -> Set[str]:
+        '''
+        Numeros de las facturas en ese estado ( conjunto del indice, no modificar )
+        '''
+        return self._numeros.get(estado, set())
+
+    def contar(self, estado: str) -> int:
+        return len(self._numeros.get(estado, ()))
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+        self._numeros.clear()
+
+    def __len__(self) -> int:
+        return sum(len(numeros) for numeros in self._numeros.values())
+
+
+class IndiceFacturasCliente:
+    '''
+    Indice ID de cliente -> numeros de sus facturas, en orden de alta
+
+    Es la unica fuente de la relacion cliente -> facturas: se construye
+    con una pasada por las facturas ( Factura.id_cliente ) y no se guarda
+    '''
+
+    def __init__(self):
+        '''
+        Inicia el indice vacio
+        '''
+
+        self._numeros: Dict[str, List[str]] = {}
+
+    def construir(self, pares: Iterable[Tuple[str, str]]):
+        '''
+        Sustituye el contenido por los pares (id_cliente, numero_factura)
+        '''
+
+        self._numeros = {}
+        for id_cliente, numero_factura in pares:
+            self.agregar(id_cliente, numero_factura)
+
+    def agregar(self, id_cliente: str, numero_factura: str):
+        '''
+        Añade una factura al final de las de su cliente
+        '''
+
+        numeros = self._numeros.get(id_cliente)
+        if numeros is None:
+            numeros = self._numeros[id_cliente] = []
+        numeros.append(numero_factura)
+
+    def eliminar(self, id_cliente: str, numero_factura: str):
+        '''
+        Quita una factura de las de su cliente
+        '''
+
+        numeros = self._numeros.get(id_cliente)
+        if numeros is not None and numero_factura in numeros:
+            numeros.remove(numero_factura)
+            if not numeros:
+                del self._numeros[id_cliente]
+
+    def numeros(self, id_cliente: str) -> List[str]:
+        '''
+        Numeros de las facturas del cliente ( lista del indice, no modificar )
+        '''
+        return self._numeros.get(id_cliente, [])
+
+    def contar(self, id_cliente: str) -> int:
+        return len(self._numeros.get(id_cliente, ()))
+
+    def clientes(self) -> Set[str]:
+        '''
+        IDs de todos los clientes referenciados por alguna factura
+        '''
+        return set(self._numeros)
+
+    def todas(self) -> Set[str]:
+        '''
+        Numeros de todas las facturas del indice
+        '''
+        return {numero for numeros in self._numeros.values() for numero in numeros}
+
+    def limpiar(self):
+        '''
+        Vacia el indice
+        '''
+        self._numeros.clear()
+
+    def __len__(self) -> int:
+        return sum(len(numeros) for numeros in self._numeros.values())
@@ -0,0 +1,231 @@
+import codecs
+import json
+import os
+import re
+import sys
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+
+_ESPACIOS = re.compile(r'[ \t\n\r]*')
+
+
+class ErrorFormatoJSON(ValueError):
+    '''
+    Error de sintaxis en el archivo que impide seguir leyendo
+    '''
+
+    def __init__(self, mensaje: str, posicion: int):
+        super().__init__(f"{mensaje} (byte {posicion} aprox.)")
+        self.posicion = posicion
+
+
+class LectorObjetoJSON:
+    '''
+    Lector incremental de un objeto JSON de primer nivel {clave: valor, ...}
+
+    Lee el archivo por bloques y decodifica un par clave/valor cada vez, de
+    modo que nunca se construye el arbol completo del archivo en memoria
+    '''
+
+    def __init__(self, archivo, tam_bloque: int = 1 << 16, tam_max_registro: int = 1 << 24):
+        '''
+        Args:
+        archivo : archivo abierto en modo binario
+        tam_bloque : bytes leidos en cada bloque
+        tam_max_registro : tamaño maximo de un registro antes de darlo por corrupto
+        '''
+
+        self.archivo = archivo
+        self.tam_bloque = tam_bloque
+        self.tam_max_registro = tam_max_registro
+        self.bytes_leidos = 0
+        self._decodificador = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._fin = False
+
+    def _leer_bloque(self) -> bool:
+        '''
+        Añade un bloque al buffer descartando lo ya consumido
+
+        returns:
+        False si se llego al final del archivo
+        '''
+
+        if self._fin:
+            return False
+
+        bloque = self.archivo.read(self.tam_bloque)
+        self.bytes_leidos += len(bloque)
+
+        if not bloque:
+            self._fin = True
+            self._buffer = self._buffer[self._pos:] + self._decodificador.decode(b"", final=True)
+        else:
+            self._buffer = self._buffer[self._pos:] + self._decodificador.decode(bloque)
+
+        self._pos = 0
+        return bool(bloque)
+
+    def _saltar_espacios(self) -> Optional[str]:
+        '''
+        Avanza hasta el siguiente caracter significativo y lo devuelve ( None al final )
+        '''
+
+        while True:
+            self._pos = _ESPACIOS.match(self._buffer, self._pos).end()
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+
+            if not self._leer_bloque():
+                return None
+
+    def _esperar(self, caracter: str):
+        '''
+        Consume el caracter indicado o lanza error de formato
+        '''
+
+        actual = self._saltar_espacios()
+        if actual != caracter:
+            raise ErrorFormatoJSON(f"se esperaba '{caracter}' y se encontro {actual!r}", self.bytes_leidos)
+        self._pos += 1
+
+    def _decodificar(self) -> Any:
+        '''
+        Decodifica el siguiente valor JSON leyendo mas bloques si esta incompleto
+        '''
+
+        self._saltar_espacios()
+
+        while True:
+            try:
+                valor, fin = self._json.raw_decode(self._buffer, self._pos)
+
+                #Un valor que acaba justo al final del buffer puede estar cortado ( p.ej. numeros )
+                if fin < len(self._buffer) or self._fin:
+                    self._pos = fin
+                    return valor
+
+            except json.JSONDecodeError as e:
+                if self._fin or len(self._buffer) - self._pos > self.tam_max_registro:
+                    raise ErrorFormatoJSON(e.msg, self.bytes_leidos) from None
+
+            self._leer_bloque()
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        '''
+        Recorre los pares (clave, valor) del objeto
+        '''
+
+        if self._saltar_espacios() is None:
+            return
+
+        self._esperar("{")
+
+        if self._saltar_espacios() == "}":
+            self._pos += 1
+            return
+
+        while True:
+            clave = self._decodificar()
+            if not isinstance(clave, str):
+                raise ErrorFormatoJSON("se esperaba una clave de texto", self.bytes_leidos)
+
+            self._esperar(":")
+            yield clave, self._decodificar()
+
+            siguiente = self._saltar_espacios()
+            self._pos += 1
+
+            if siguiente == "}":
+                return
+            if siguiente != ",":
+                raise ErrorFormatoJSON(f"se esperaba ',' o '}}' y se encontro {siguiente!r}", self.bytes_leidos)
+
+
+class ProgresoConsola:
+    '''
+    Muestra el avance de la carga en consola por saltos de porcentaje
+    '''
+
+    def __init__(self, paso: int = 10, tam_minimo: int = 1 << 20):
+        '''
+        Args:
+        paso : porcentaje entre cada aviso
+        tam_minimo : los archivos mas pequeños no muestran progreso
+        '''
+
+        self.paso = paso
+        self.tam_minimo = tam_minimo
+        self._ultimo = {}
+
+    def __call__(self, nombre: str, leidos: int, total: int, registros: int):
+        if total < self.tam_minimo:
+            return
+
+        porcentaje = min(100, leidos * 100 // total)
+        ultimo = self._ultimo.get(nombre, -self.paso)
+        if ultimo == 100 or (porcentaje - ultimo < self.paso and porcentaje < 100):
+            return
+
+        self._ultimo[nombre] = porcentaje
+        sys.stdout.write(f"\rCargando {nombre}: {porcentaje:3d}% ({registros} registros)")
+        if porcentaje == 100:
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+
+
+def cargar_registros(ruta: str, crear: Callable[[dict], Any], destino: dict, nombre: str = "",
+                     progreso: Callable = None) -> list:
+    '''
+    Carga un archivo {id: registro} en streaming creando cada objeto al vuelo
+
+    Los registros invalidos se informan uno a uno y se omiten; un error de
+    sintaxis detiene la lectura conservando lo cargado hasta ese punto
+
+    Args:
+    ruta : archivo JSON a leer
+    crear : constructor registro -> objeto ( p.ej. Cliente.from_dict )
+    destino : diccionario donde se guardan los objetos
+    nombre : nombre para los mensajes
+    progreso : funcion (nombre, bytes_leidos, bytes_totales, registros)
+
+    returns:
+    Lista de errores encontrados como tuplas (clave, mensaje)
+    '''
+
+    errores = []
+    total = os.path.getsize(ruta)
+    registros = 0
+    procesados = 0
+
+    with open(ruta, 'rb') as f:
+        lector = LectorObjetoJSON(f)
+
+        try:
+            for clave, data in lector:
+                try:
+                    if not isinstance(data, dict):
+                        raise ValueError("el registro no es un objeto")
+                    destino[clave] = crear(data)
+                    registros += 1
+
+                except (KeyError, TypeError, ValueError) as e:
+                    mensaje = f"campo {e} ausente" if isinstance(e, KeyError) else str(e)
+                    errores.append((clave, mensaje))
+                    print(f"Aviso: registro {clave} de {nombre} invalido: {mensaje}")
+
+                procesados += 1
+                if progreso and procesados % 1000 == 0:
+                    progreso(nombre, lector.bytes_leidos, total, registros)
+
+        except ErrorFormatoJSON as e:
+            errores.append((None, str(e)))
+            print(f"Error de formato en {ruta}: {e}. Se conservan {registros} registros leidos")
+
+    if progreso:
+        progreso(nombre, total, total, registros)
+
+    return errores
@@ -3,27 +3,319 @@ SISTEMA CRM - GESTION DE RELACIONES DE CLIENTES
 Archivo principal de ejecucion
 '''
 
+import argparse
 from crm_system import CRMSystem
+from errores import ErrorValidacion
+from almacenamiento import AlmacenamientoJSON
+from lector_json import ProgresoConsola
+from importador import ImportadorMasivo
+from consultas import AGRUPACIONES, FILTROS, predicados_desde_filtros
+from metricas import Metricas
+
+
+def crear_almacenamiento(args):
+    '''
+    Crea el backend de persistencia elegido en la linea de comandos
+    '''
+
+    almacenamiento = crear_backend(args)
+
+    if args.escritura_diferida:
+        from almacenamiento_diferido import AlmacenamientoDiferido
+        return AlmacenamientoDiferido(almacenamiento, args.intervalo_guardado, args.umbral_guardado)
+
+    return almacenamiento
+
+
+def crear_backend(args):
+    '''
+    Crea el backend que escribe en disco
+    '''
+
+    if args.almacenamiento == "sqlite":
+        from almacenamiento_sqlite import AlmacenamientoSQLite
+        return AlmacenamientoSQLite(args.bd)
+
+    if args.almacenamiento == "fragmentado":
+        from almacenamiento_fragmentado import AlmacenamientoFragmentado
+        return AlmacenamientoFragmentado(num_fragmentos=args.fragmentos, procesos=args.procesos,
+                                         progreso=ProgresoConsola(), columnar=args.columnar)
+
+    if args.almacenamiento == "mmap":
+        from almacenamiento_mapeado import AlmacenamientoMapeado
+        return AlmacenamientoMapeado(progreso=ProgresoConsola())
+
+    return AlmacenamientoJSON(progreso=ProgresoConsola(), columnar=args.columnar, formato=args.formato)
+
+
+def importar_datos(sistema_crm: CRMSystem, args):
+    '''
+    Importa un archivo de clientes o facturas sin pasar por el menu
+    '''
+
+    importador = ImportadorMasivo(sistema_crm, args.errores)
+
+    if args.tipo == "clientes":
+        resultado = importador.importar_clientes(args.archivo)
+    else:
+        resultado = importador.importar_facturas(args.archivo)
+
+    sistema_crm.almacenamiento.cerrar()
+    print(resultado)
+
+
+def listar_datos(sistema_crm: CRMSystem, args):
+    '''
+    Escribe el listado de clientes, de facturas de un cliente o de facturas por estado en un archivo
+    '''
+
+    if args.tipo == "clientes":
+        bloques = sistema_crm.formatear_clientes()
+    elif args.tipo == "estado":
+        try:
+            facturas = sistema_crm.facturas_por_estado(args.estado, args.orden, args.dias)
+        except ErrorValidacion as e:
+            print(f"Error: {e}")
+            return
+        bloques = sistema_crm.formatear_cola(facturas)
+    else:
+        id_cliente = (args.cliente or "").upper()
+        if id_cliente not in sistema_crm.clientes:
+            print("Cliente no encontrado")
+            return
+        bloques = sistema_crm.formatear_facturas(sistema_crm.clientes[id_cliente])
+
+    escritos = sistema_crm.paginador.exportar(bloques, args.salida)
+    print(f"{escritos} registros exportados a {args.salida}")
+
+
+def consultar_datos(sistema_crm: CRMSystem, args):
+    '''
+    Consulta facturas o clientes con filtros combinados y muestra, agrupa o exporta el resultado
+    '''
+
+    try:
+        filtros = {clave: getattr(args, clave) for clave in FILTROS}
+        consulta = sistema_crm.consultar(*predicados_desde_filtros(filtros), entidad=args.entidad)
+        if args.explicar:
+            print(consulta.explicar())
+
+        if args.agrupar:
+            grupos = consulta.agrupar(args.agrupar)
+            print(f"\n{'Grupo':<24}{'Facturas':>10}{'Total':>14}{'Pagado':>14}{'Pendiente':>14}")
+            for clave, totales in grupos.items():
+                print(f"{clave:<24}{totales.num_facturas:>10}{totales.total:>14.2f}"
+                      f"{totales.pagado:>14.2f}{totales.pendiente:>14.2f}")
+            return
+
+        registros = consulta.resultados()
+    except ErrorValidacion as e:
+        print(f"Error: {e}")
+        return
+
+    if args.entidad == "facturas":
+        bloques = sistema_crm.formatear_cola(registros)
+    else:
+        bloques = sistema_crm.formatear_clientes(registros)
+
+    if args.salida:
+        escritos = sistema_crm.paginador.exportar(bloques, args.salida)
+        print(f"{escritos} registros exportados a {args.salida}")
+    else:
+        for bloque in bloques:
+            print(bloque, end="")
+        print(f"\n{len(registros)} {args.entidad} en el resultado")
+
+
+def convertir_datos(sistema_crm: CRMSystem, args):
+    '''
+    Reescribe el snapshot en el formato indicado ( JSON o binario )
+    '''
+
+    almacenamiento = getattr(sistema_crm.almacenamiento, "interno", sistema_crm.almacenamiento)
+    if not isinstance(almacenamiento, AlmacenamientoJSON):
+        print("La conversion de snapshots solo esta disponible con el backend json")
+        return
+
+    #Compactar escribe el snapshot en el formato configurado y vacia el diario
+    almacenamiento.formato = args.formato_destino
+    sistema_crm.cerrar()
+
+    destino = almacenamiento.archivo_binario if args.formato_destino == "binario" else \
+        f"{almacenamiento.archivos_clientes} y {almacenamiento.archivos_facturas}"
+    print(f"{len(sistema_crm.clientes)} clientes y {len(sistema_crm.facturas)} facturas guardados en {destino}")
+
+
+def verificar_datos(sistema_crm: CRMSystem, args):
+    '''
+    Comprueba la relacion entre clientes y facturas y, si se pide, la repara
+    '''
+
+    informe = sistema_crm.verificar(args.reparar)
+    descripciones = {
+        'facturas_huerfanas': "Facturas cuyo cliente no existe",
+        'referencias_colgantes': "Referencias del indice sin factura o con otro cliente",
+        'facturas_sin_indexar': "Facturas que faltan en el indice",
+        'archivos_incorrectos': "Archivos que no coinciden con su manifiesto o checksum",
+    }
+
+    for clave, descripcion in descripciones.items():
+        problemas = informe[clave]
+        print(f"{descripcion}: {len(problemas)}")
+        for problema in problemas[:20]:
+            print(f"  {problema}")
+        if len(problemas) > 20:
+            print(f"  ... y {len(problemas) - 20} mas")
+
+    if args.reparar:
+        print("Indice reconstruido y snapshot reescrito con su manifiesto")
+        sistema_crm.almacenamiento.cerrar()
+    elif not any(informe.values()):
+        print("Sin problemas de integridad")
+
+
+def servir(sistema_crm: CRMSystem, args):
+    '''
+    Arranca el servidor JSON-RPC hasta que se pulse Ctrl+C
+    '''
+
+    import asyncio
+    from servidor import ServidorCRM
+
+    servidor = ServidorCRM(sistema_crm, args.host, args.puerto)
+    print(f"Servidor CRM escuchando en http://{args.host}:{args.puerto}/rpc ( Ctrl+C para salir )")
+
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sistema_crm.cerrar()
+        print("Servidor detenido")
+
 
 def main():
     '''
     Funcion principal del programa
     '''
-    
+
+    parser = argparse.ArgumentParser(description="Sistema CRM")
+    parser.add_argument("--almacenamiento", choices=["json", "sqlite", "mmap", "fragmentado"], default="json",
+                        help="backend de persistencia ( por defecto json; mmap lee el snapshot binario bajo demanda; "
+                             "fragmentado reparte los datos en varios archivos )")
+    parser.add_argument("--bd", default="crm.db", help="archivo de la base de datos SQLite")
+    parser.add_argument("--columnar", action="store_true",
+                        help="guarda las facturas en memoria por columnas ( backend json )")
+    parser.add_argument("--fragmentos", type=int, default=8,
+                        help="numero de fragmentos ( backend fragmentado )")
+    parser.add_argument("--procesos", type=int, help="procesos para cargar los fragmentos ( por defecto uno por CPU )")
+    parser.add_argument("--escritura-diferida", action="store_true",
+                        help="guarda los cambios en segundo plano por lotes ( un solo proceso escritor )")
+    parser.add_argument("--intervalo-guardado", type=float, default=1.0,
+                        help="segundos maximos entre volcados con escritura diferida")
+    parser.add_argument("--umbral-guardado", type=int, default=500,
+                        help="cambios pendientes que fuerzan un volcado con escritura diferida")
+    parser.add_argument("--formato", choices=["json", "binario"], default="json",
+                        help="formato de los snapshots que se guardan ( backend json )")
+
+    comandos = parser.add_subparsers(dest="comando")
+    importar = comandos.add_parser("importar", help="importa clientes o facturas desde CSV o JSONL")
+    importar.add_argument("tipo", choices=["clientes", "facturas"])
+    importar.add_argument("archivo", help="archivo .csv ( con cabecera ) o .jsonl")
+    importar.add_argument("--errores", default="errores_importacion.csv",
+                          help="archivo donde se guardan las filas rechazadas")
+
+    listar = comandos.add_parser("listar", help="exporta un listado a un archivo sin interaccion")
+    listar.add_argument("tipo", choices=["clientes", "facturas", "estado"])
+    listar.add_argument("--cliente", help="ID del cliente ( para facturas )")
+    listar.add_argument("--estado", default="Pendiente", help="estado de las facturas ( para estado )")
+    listar.add_argument("--orden", choices=["fecha", "monto"], default="fecha",
+                        help="orden de las facturas por estado")
+    listar.add_argument("--dias", type=int, default=0,
+                        help="solo facturas emitidas hace al menos estos dias ( para estado )")
+    listar.add_argument("--salida", required=True, help="archivo de destino")
+
+    servidor = comandos.add_parser("servidor", help="expone la API del CRM por JSON-RPC sobre HTTP")
+    servidor.add_argument("--host", default="127.0.0.1", help="direccion de escucha ( por defecto solo local )")
+    servidor.add_argument("--puerto", type=int, default=8080, help="puerto TCP")
+    verificar = comandos.add_parser("verificar", help="comprueba las referencias entre clientes y facturas")
+    verificar.add_argument("--reparar", action="store_true",
+                           help="reconstruye el indice y reescribe el snapshot y su manifiesto")
+    consultar = comandos.add_parser("consultar", help="consulta facturas o clientes con filtros combinados")
+    consultar.add_argument("entidad", choices=["facturas", "clientes"])
+    consultar.add_argument("--estado", nargs="+", help="estados de las facturas ( p.ej. Pendiente )")
+    consultar.add_argument("--monto-min", type=float, help="monto minimo de la factura")
+    consultar.add_argument("--monto-max", type=float, help="monto maximo de la factura")
+    consultar.add_argument("--desde", help="emitidas desde la fecha dd/mm/aaaa")
+    consultar.add_argument("--hasta", help="emitidas hasta la fecha dd/mm/aaaa")
+    consultar.add_argument("--registrado-desde", help="clientes dados de alta desde la fecha dd/mm/aaaa")
+    consultar.add_argument("--registrado-hasta", help="clientes dados de alta hasta la fecha dd/mm/aaaa")
+    consultar.add_argument("--dominio", nargs="+", help="dominios del email del cliente ( p.ej. empresa.es )")
+    consultar.add_argument("--id-cliente", help="ID del cliente")
+    consultar.add_argument("--email", help="email del cliente")
+    consultar.add_argument("--nombre", help="texto contenido en el nombre completo del cliente")
+    consultar.add_argument("--agrupar", choices=AGRUPACIONES, help="totales por grupo en vez de la lista ( facturas )")
+    consultar.add_argument("--explicar", action="store_true", help="muestra el plan elegido ( indice o recorrido )")
+    consultar.add_argument("--salida", help="archivo de destino ( por defecto se muestran en pantalla )")
+    convertir = comandos.add_parser("convertir", help="convierte el snapshot a JSON o a binario")
+    convertir.add_argument("formato_destino", choices=["json", "binario"])
+
+    parser.add_argument("--tam-pagina", type=int, default=20, help="registros por pagina en los listados")
+    parser.add_argument("--metricas", metavar="ARCHIVO",
+                        help="mide las operaciones y las guarda al salir ( .prom para Prometheus, si no JSON )")
+    parser.add_argument("--perfilar", metavar="OPERACION",
+                        help="captura con cProfile la primera llamada a la operacion ( p.ej. cargar_datos )")
+    args = parser.parse_args()
+
+    metricas = Metricas(activo=bool(args.metricas or args.perfilar))
+    if args.perfilar:
+        metricas.perfilar(args.perfilar)
+
     try:
         #Creamos instancia del programa
-        sistema_crm = CRMSystem()
-        
+        sistema_crm = CRMSystem(crear_almacenamiento(args), metricas)
+
+        sistema_crm.paginador.tam_pagina = max(1, args.tam_pagina)
+
+        if args.comando == "importar":
+            importar_datos(sistema_crm, args)
+            return
+
+        if args.comando == "listar":
+            listar_datos(sistema_crm, args)
+            return
+
+        if args.comando == "consultar":
+            consultar_datos(sistema_crm, args)
+            return
+
+        if args.comando == "convertir":
+            convertir_datos(sistema_crm, args)
+            return
+
+        if args.comando == "verificar":
+            verificar_datos(sistema_crm, args)
+            return
+
+        if args.comando == "servidor":
+            servir(sistema_crm, args)
+            return
+
         #Ejecutamos el programa
-        
+
         sistema_crm.ejecutar()
-        
-    
-    except Exception as e : 
+
+
+    except Exception as e :
         print(f"Error critico: {e}")
-    
-    
+
+    finally:
+        if args.metricas:
+            metricas.exportar(args.metricas)
+            print(f"Metricas guardadas en {args.metricas}")
+
+
 
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
+
@@ -0,0 +1,141 @@
+import json
+import os
+import zlib
+from typing import Dict, List, Optional
+
+
+#Version del esquema de los datos guardados:
+#1 = sin manifiesto, IDs de 3 cifras y lista de facturas en cada cliente
+#2 = manifiesto, IDs de CIFRAS_ID cifras y relacion cliente -> facturas derivada de las facturas
+VERSION_ESQUEMA = 2
+NOMBRE_MANIFIESTO = "manifiesto.json"
+
+
+def checksum_archivo(ruta: str, tam_bloque: int = 1 << 20) -> int:
+    '''
+    CRC32 del contenido de un archivo leido por bloques
+    '''
+
+    crc = 0
+    with open(ruta, 'rb') as f:
+        while True:
+            bloque = f.read(tam_bloque)
+            if not bloque:
+                return crc
+            crc = zlib.crc32(bloque, crc)
+
+
+class Manifiesto:
+    '''
+    Metadatos de un snapshot: version del esquema, contadores de IDs,
+    numero de registros y tamaño y checksum de cada archivo
+
+    Se escribe junto a los archivos del snapshot al guardarlo. Al cargar,
+    los contadores evitan recorrer todos los IDs, y comparar tamaños ( sin
+    leer los archivos ) detecta archivos incompletos o cambiados fuera del
+    CRM. Los checksums se comprueban bajo demanda ( verificar )
+    '''
+
+    def __init__(self, contador_clientes: int = 1, contador_facturas: int = 1, num_clientes: int = 0,
+                 num_facturas: int = 0, version_esquema: int = VERSION_ESQUEMA):
+        '''
+        Args:
+        contador_clientes, contador_facturas : siguientes contadores de IDs
+        num_clientes, num_facturas : registros del snapshot
+        version_esquema : version del formato de los datos
+        '''
+
+        self.version_esquema = version_esquema
+        self.contador_clientes = contador_clientes
+        self.contador_facturas = contador_facturas
+        self.num_clientes = num_clientes
+        self.num_facturas = num_facturas
+        self.archivos: Dict[str, dict] = {}     # Ruta relativa al manifiesto -> {tamano, crc32}
+
+    def describir_archivo(self, nombre: str, ruta: str):
+        '''
+        Añade ( o actualiza ) el tamaño y el checksum de un archivo
+
+        Args:
+        nombre : ruta relativa al directorio del manifiesto con la que se guarda
+        ruta : archivo del que se leen tamaño y checksum ( p.ej. su temporal )
+        '''
+
+        self.archivos[nombre] = {'tamano': os.path.getsize(ruta), 'crc32': checksum_archivo(ruta)}
+
+    def archivos_cambiados(self, directorio: str) -> List[str]:
+        '''
+        Archivos que faltan o cuyo tamaño no coincide ( solo consulta su tamaño )
+        '''
+
+        cambiados = []
+        for nombre, datos in self.archivos.items():
+            try:
+                tamano = os.path.getsize(os.path.join(directorio, nombre))
+            except OSError:
+                tamano = None
+            if tamano != datos['tamano']:
+                cambiados.append(nombre)
+        return cambiados
+
+    def archivos_corruptos(self, directorio: str) -> List[str]:
+        '''
+        Archivos que faltan o cuyo tamaño o checksum no coinciden ( los lee enteros )
+        '''
+
+        corruptos = self.archivos_cambiados(directorio)
+        for nombre, datos in self.archivos.items():
+            if nombre not in corruptos and checksum_archivo(os.path.join(directorio, nombre)) != datos['crc32']:
+                corruptos.append(nombre)
+        return corruptos
+
+    def to_dict(self) -> dict:
+        return {
+            'version_esquema': self.version_esquema,
+            'contador_clientes': self.contador_clientes,
+            'contador_facturas': self.contador_facturas,
+            'num_clientes': self.num_clientes,
+            'num_facturas': self.num_facturas,
+            'archivos': self.archivos
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Manifiesto':
+        manifiesto = cls(int(data['contador_clientes']), int(data['contador_facturas']),
+                         int(data['num_clientes']), int(data['num_facturas']), int(data['version_esquema']))
+        manifiesto.archivos = {nombre: {'tamano': int(datos['tamano']), 'crc32': int(datos['crc32'])}
+                               for nombre, datos in data.get('archivos', {}).items()}
+        return manifiesto
+
+    @classmethod
+    def leer(cls, ruta: str) -> Optional['Manifiesto']:
+        '''
+        Lee un manifiesto
+
+        returns:
+        El manifiesto, o None si no existe
+
+        Raises:
+        ValueError si el archivo no es un manifiesto valido
+        '''
+
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        try:
+            return cls.from_dict(data)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"manifiesto no valido: {e}") from None
+
+    def escribir(self, ruta: str):
+        '''
+        Escribe el manifiesto y lo fuerza a disco ( el renombrado lo hace quien lo guarda )
+        '''
+
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,210 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Optional
+
+
+#Limites superiores ( segundos ) de las cubetas del histograma de latencias
+LIMITES_HISTOGRAMA = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class EstadisticaOperacion:
+    '''
+    Contador, tiempo acumulado e histograma de latencias de una operacion
+    '''
+
+    __slots__ = ('llamadas', 'errores', 'tiempo_total', 'tiempo_maximo', 'cubetas')
+
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.tiempo_total = 0.0
+        self.tiempo_maximo = 0.0
+        self.cubetas = [0] * (len(LIMITES_HISTOGRAMA) + 1)   # La ultima es +Inf
+
+    def registrar(self, segundos: float):
+        self.llamadas += 1
+        self.tiempo_total += segundos
+        if segundos > self.tiempo_maximo:
+            self.tiempo_maximo = segundos
+        self.cubetas[bisect_left(LIMITES_HISTOGRAMA, segundos)] += 1
+
+    def percentil(self, p: float) -> float:
+        '''
+        Percentil aproximado ( limite superior de la cubeta que lo contiene )
+        '''
+
+        objetivo = self.llamadas * p / 100
+        acumulado = 0
+        for limite, cantidad in zip(LIMITES_HISTOGRAMA, self.cubetas):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return min(limite, self.tiempo_maximo)
+        return self.tiempo_maximo
+
+    def to_dict(self) -> dict:
+        return {
+            'llamadas': self.llamadas,
+            'errores': self.errores,
+            'tiempo_total': self.tiempo_total,
+            'tiempo_maximo': self.tiempo_maximo,
+            'histograma': {str(limite): cantidad for limite, cantidad
+                           in zip(LIMITES_HISTOGRAMA + ("+Inf",), self.cubetas)}
+        }
+
+
+class Metricas:
+    '''
+    Registro de metricas por operacion
+
+    Las operaciones se miden envolviendo los metodos de un objeto concreto
+    con instrumentar(); mientras no se instrumenta nada no hay ningun coste
+    en las llamadas. Opcionalmente la siguiente llamada a una operacion se
+    ejecuta bajo cProfile
+    '''
+
+    def __init__(self, activo: bool = False):
+        '''
+        Args:
+        activo : si es False instrumentar() no hace nada
+        '''
+
+        self.activo = activo
+        self.operaciones: Dict[str, EstadisticaOperacion] = {}
+        self._perfilar: Optional[str] = None
+        self.archivo_perfil: Optional[str] = None
+
+    def registrar(self, nombre: str, segundos: float):
+        '''
+        Anota una llamada a una operacion
+        '''
+
+        estadistica = self.operaciones.get(nombre)
+        if estadistica is None:
+            estadistica = self.operaciones[nombre] = EstadisticaOperacion()
+        estadistica.registrar(segundos)
+
+    def _envolver(self, nombre: str, funcion: Callable) -> Callable:
+        @functools.wraps(funcion)
+        def medida(*args, **kwargs):
+            if self._perfilar == nombre:
+                return self._ejecutar_perfil(nombre, funcion, args, kwargs)
+
+            inicio = perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            except BaseException:
+                self.operaciones.setdefault(nombre, EstadisticaOperacion()).errores += 1
+                raise
+            finally:
+                self.registrar(nombre, perf_counter() - inicio)
+
+        medida.__wrapped_metricas__ = True
+        return medida
+
+    def instrumentar(self, objeto, nombres: Iterable[str], prefijo: str = ""):
+        '''
+        Sustituye los metodos indicados del objeto por versiones medidas
+
+        Args:
+        objeto : instancia cuyos metodos se miden ( solo esa instancia )
+        nombres : nombres de los metodos
+        prefijo : prefijo del nombre de la operacion en las metricas
+        '''
+
+        if not self.activo:
+            return
+
+        for nombre in nombres:
+            metodo = getattr(objeto, nombre, None)
+            if metodo is None or getattr(metodo, '__wrapped_metricas__', False):
+                continue
+            setattr(objeto, nombre, self._envolver(prefijo + nombre, metodo))
+
+    def perfilar(self, nombre: str, archivo: str = None):
+        '''
+        Ejecuta la proxima llamada a la operacion bajo cProfile
+
+        Args:
+        nombre : nombre de la operacion ( con prefijo )
+        archivo : archivo donde guardar el perfil ( por defecto perfil_<operacion>.prof )
+        '''
+
+        self._perfilar = nombre
+        self.archivo_perfil = archivo or f"perfil_{nombre.replace('.', '_')}.prof"
+
+    def _ejecutar_perfil(self, nombre: str, funcion: Callable, args, kwargs):
+        self._perfilar = None
+        perfil = cProfile.Profile()
+        inicio = perf_counter()
+
+        try:
+            return perfil.runcall(funcion, *args, **kwargs)
+        finally:
+            self.registrar(nombre, perf_counter() - inicio)
+            perfil.dump_stats(self.archivo_perfil)
+
+            resumen = io.StringIO()
+            pstats.Stats(perfil, stream=resumen).sort_stats("cumulative").print_stats(15)
+            print(f"\nPerfil de {nombre} guardado en {self.archivo_perfil}")
+            print(resumen.getvalue())
+
+    def limpiar(self):
+        self.operaciones.clear()
+
+    def tabla(self) -> str:
+        '''
+        Texto con las metricas ordenadas por tiempo acumulado
+        '''
+
+        if not self.operaciones:
+            return "No hay metricas registradas\n"
+
+        lineas = [f"{'Operacion':<34}{'Llamadas':>9}{'Errores':>8}{'Total s':>10}{'Media ms':>10}"
+                  f"{'p50 ms':>9}{'p99 ms':>9}{'Max ms':>9}"]
+        for nombre, e in sorted(self.operaciones.items(), key=lambda par: -par[1].tiempo_total):
+            lineas.append(f"{nombre:<34}{e.llamadas:>9}{e.errores:>8}{e.tiempo_total:>10.3f}"
+                          f"{e.tiempo_total / e.llamadas * 1000:>10.3f}{e.percentil(50) * 1000:>9.2f}"
+                          f"{e.percentil(99) * 1000:>9.2f}{e.tiempo_maximo * 1000:>9.2f}")
+        return "\n".join(lineas) + "\n"
+
+    def to_dict(self) -> dict:
+        return {nombre: e.to_dict() for nombre, e in self.operaciones.items()}
+
+    def prometheus(self) -> str:
+        '''
+        Metricas en formato de texto de Prometheus
+        '''
+
+        lineas = ["# HELP crm_operacion_segundos Duracion de las operaciones del CRM",
+                  "# TYPE crm_operacion_segundos histogram"]
+        for nombre, e in self.operaciones.items():
+            etiqueta = f'operacion="{nombre}"'
+            acumulado = 0
+            for limite, cantidad in zip(LIMITES_HISTOGRAMA + ("+Inf",), e.cubetas):
+                acumulado += cantidad
+                lineas.append(f'crm_operacion_segundos_bucket{{{etiqueta},le="{limite}"}} {acumulado}')
+            lineas.append(f"crm_operacion_segundos_sum{{{etiqueta}}} {e.tiempo_total}")
+            lineas.append(f"crm_operacion_segundos_count{{{etiqueta}}} {e.llamadas}")
+
+        lineas += ["# HELP crm_operacion_errores_total Operaciones terminadas con excepcion",
+                   "# TYPE crm_operacion_errores_total counter"]
+        for nombre, e in self.operaciones.items():
+            lineas.append(f'crm_operacion_errores_total{{operacion="{nombre}"}} {e.errores}')
+
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta: str):
+        '''
+        Guarda las metricas en un archivo: Prometheus si termina en .prom o .txt, JSON si no
+        '''
+
+        with open(ruta, 'w', encoding='utf-8') as f:
+            if ruta.endswith((".prom", ".txt")):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
@@ -1,39 +1,188 @@
-from datetime import datetime
-from typing import List
+import sys
+from datetime import date, datetime
+from enum import IntEnum
+from functools import lru_cache
+from typing import Optional, Tuple
+from errores import ErrorValidacion
+
+
+FORMATO_FECHA = "%d/%m/%Y"
+
+#Texto por defecto de los campos opcionales ( una unica copia compartida )
+NO_ESPECIFICADO = sys.intern("No especificado")
+
+#Estados posibles de una factura
+ESTADOS_FACTURA = ("Pendiente", "Pagada", "Cancelada")
+
+#Prefijos de los IDs y cifras minimas de su parte numerica. Los IDs de 3 cifras
+#de versiones anteriores ( "USR001" ) siguen siendo validos; clave_id los ordena
+#junto a los nuevos por su numero
+PREFIJO_CLIENTE = "USR"
+PREFIJO_FACTURA = "FAC"
+CIFRAS_ID = 6
+
+
+def formatear_id(prefijo: str, numero: int) -> str:
+    '''
+    ID con el numero relleno a CIFRAS_ID cifras ( p.ej. "USR000042" )
+    '''
+    return f"{prefijo}{numero:0{CIFRAS_ID}d}"
+
+
+def numero_id(id_registro: str) -> int:
+    '''
+    Parte numerica de un ID de cliente o de factura ( "USR042" y "USR000042" -> 42 )
+
+    Raises:
+    ValueError si el ID no tiene el formato prefijo + numero
+    '''
+    return int(id_registro[len(PREFIJO_CLIENTE):])
+
+
+def clave_id(id_registro: str) -> tuple:
+    '''
+    Clave para ordenar IDs por prefijo y numero aunque tengan distinto numero de cifras
+    '''
+
+    try:
+        return id_registro[:len(PREFIJO_CLIENTE)], numero_id(id_registro)
+    except ValueError:
+        return id_registro[:len(PREFIJO_CLIENTE)], -1, id_registro
+
+
+class EstadoFactura(IntEnum):
+    '''
+    Codigo compacto del estado de una factura
+    '''
+
+    PENDIENTE = 0
+    PAGADA = 1
+    CANCELADA = 2
+
+    @property
+    def etiqueta(self) -> str:
+        '''
+        Texto del estado tal y como se muestra y se guarda en JSON
+        '''
+        return ESTADOS_FACTURA[self]
+
+    @classmethod
+    def desde_texto(cls, texto: str) -> 'EstadoFactura':
+        '''
+        Convierte el texto del estado en su codigo
+
+        Raises:
+        ValueError si el estado no es valido
+        '''
+
+        try:
+            return cls(ESTADOS_FACTURA.index(texto))
+        except ValueError:
+            raise ValueError(f"estado no valido: {texto}") from None
+
+
+@lru_cache(maxsize=4096)
+def fecha_a_ordinal(texto: str) -> int:
+    '''
+    Convierte una fecha "dd/mm/aaaa" ( se ignora la hora si la hay ) en su ordinal
+    '''
+    return datetime.strptime(texto[:10], FORMATO_FECHA).toordinal()
+
+
+def ordinal_consulta(fecha: Optional[str], nombre_campo: str) -> Optional[int]:
+    '''
+    Convierte una fecha "dd/mm/aaaa" de una consulta en ordinal ( None si esta vacia )
+
+    Raises:
+    ErrorValidacion si la fecha no es valida
+    '''
+
+    if fecha is None or not str(fecha).strip():
+        return None
+    try:
+        return fecha_a_ordinal(str(fecha).strip())
+    except ValueError:
+        raise ErrorValidacion(f"{nombre_campo} no es una fecha dd/mm/aaaa valida: {fecha}") from None
+
+
+def rango_ordinales(desde: Optional[str], hasta: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    '''
+    Ordinales de un rango de fechas de una consulta ( None = sin limite )
+
+    Raises:
+    ErrorValidacion si alguna fecha no es valida o el rango esta invertido
+    '''
+
+    inicio = ordinal_consulta(desde, "desde")
+    fin = ordinal_consulta(hasta, "hasta")
+    if inicio is not None and fin is not None and inicio > fin:
+        raise ErrorValidacion("la fecha inicial es posterior a la final")
+    return inicio, fin
+
+
+@lru_cache(maxsize=4096)
+def ordinal_a_fecha(ordinal: int) -> str:
+    '''
+    Convierte un ordinal en el texto "dd/mm/aaaa"
+    '''
+    return date.fromordinal(ordinal).strftime(FORMATO_FECHA)
+
+
+def _texto_opcional(valor: str) -> str:
+    '''
+    Devuelve el valor o el marcador compartido si esta vacio
+    '''
+
+    if not valor or valor == NO_ESPECIFICADO:
+        return NO_ESPECIFICADO
+    return valor
 
 
 class Cliente:
     '''
     Clase para representar a un cliente del sistema
     '''
-    
+
+    __slots__ = ('nombre', 'apellidos', 'email', 'telefono', 'direccion', 'id_cliente',
+                 'fecha_registro_ordinal')
+
     def __init__(self, nombre: str, apellidos: str, email: str, telefono: str = "", direccion: str = ""):
         '''
         Inicia un nuevo cliente
-        
-        Args: 
+
+        Args:
         nombre : nombre del cliente
         apellidos : apellidos del cliente
         email : email del cliente ( debe ser unico )
         telefono : telefono del cliente ( opcional )
-        direccion : direccion del cliente ( opcional )     
+        direccion : direccion del cliente ( opcional )
         '''
-        
+
         self.nombre = nombre
         self.apellidos = apellidos
         self.email = email
-        self.telefono = telefono if telefono else "No especificado"
-        self.direccion = direccion if direccion else "No especificado"
-        self.id_cliente = None  # Se asigna automaticamente 
-        self.fecha_registro = datetime.now().strftime("%d/%m/%Y")
-        self.facturas = []      # Lista de facturas asociadas 
-        
+        self.telefono = _texto_opcional(telefono)
+        self.direccion = _texto_opcional(direccion)
+        self.id_cliente = None  # Se asigna automaticamente
+        self.fecha_registro_ordinal = date.today().toordinal()
+
+    @property
+    def fecha_registro(self) -> str:
+        '''
+        Fecha de registro en formato "dd/mm/aaaa"
+        '''
+        return ordinal_a_fecha(self.fecha_registro_ordinal)
+
+    @fecha_registro.setter
+    def fecha_registro(self, texto: str):
+        self.fecha_registro_ordinal = fecha_a_ordinal(texto)
+
     def nombre_completo(self) -> str:
         '''
         Muestra el nombre completo
         '''
         return f"{self.nombre} {self.apellidos}"
-        
+
     def to_dict(self) -> dict:
         '''
         Convierte el cliente a diccionario JSON
@@ -45,58 +194,101 @@ class Cliente:
             'email': self.email,
             'telefono': self.telefono,
             'direccion': self.direccion,
-            'fecha_registro': self.fecha_registro,
-            'facturas': self.facturas
+            'fecha_registro': self.fecha_registro
         }
-            
+
     @classmethod
     def from_dict(cls, data: dict):
         '''
         Crea el cliente desde el diccionario
         '''
-        
+
         cliente = cls(
-            data['nombre'],  
+            data['nombre'],
             data['apellidos'],
             data['email'],
             data.get('telefono', ''),
             data.get('direccion', '')
         )
-        
+
         cliente.id_cliente = data['id_cliente']
-        cliente.fecha_registro = data.get('fecha_registro', cliente.fecha_registro)
-        cliente.facturas = data.get('facturas', [])
-        
+        if 'fecha_registro' in data:
+            cliente.fecha_registro = data['fecha_registro']
+        #Las listas 'facturas' de archivos antiguos se ignoran: la relacion sale de Factura.id_cliente
+
+        return cliente
+
+    @classmethod
+    def desde_valores(cls, id_cliente: str, nombre: str, apellidos: str, email: str, telefono: str,
+                      direccion: str, fecha_registro_ordinal: int) -> 'Cliente':
+        '''
+        Crea el cliente directamente desde sus campos ya validados ( sin pasar
+        por __init__ ni convertir fechas ), para cargas masivas
+        '''
+
+        cliente = cls.__new__(cls)
+        cliente.id_cliente = id_cliente
+        cliente.nombre = nombre
+        cliente.apellidos = apellidos
+        cliente.email = email
+        cliente.telefono = _texto_opcional(telefono)
+        cliente.direccion = _texto_opcional(direccion)
+        cliente.fecha_registro_ordinal = fecha_registro_ordinal
         return cliente
-    
-    
-class Factura: 
+
+
+class Factura:
     '''
-    Clase para representar la factura en el sistema 
+    Clase para representar la factura en el sistema
     '''
-    
+
+    __slots__ = ('id_cliente', 'descripcion', 'monto', 'numero_factura', 'fecha_emision_ordinal',
+                 'codigo_estado')
+
     def __init__(self, id_cliente: str, descripcion: str, monto: float):
         '''
         Inicializa una nueva factura
-    
-        Args: 
+
+        Args:
         id_cliente: ID del cliente al que pertenece la factura
         descripcion: Descripcion del servicio o producto
         monto: Monto total de la factura
         '''
-    
-        self.id_cliente = id_cliente
+
+        self.id_cliente = sys.intern(id_cliente)  # Compartido entre las facturas del cliente
         self.descripcion = descripcion
         self.monto = monto
         self.numero_factura = None  # Automatico por sistema
-        self.fecha_emision = datetime.now().strftime("%d/%m/%Y") 
-        self.estado = "Pendiente" 
-    
+        self.fecha_emision_ordinal = date.today().toordinal()
+        self.codigo_estado = EstadoFactura.PENDIENTE
+
+    @property
+    def estado(self) -> str:
+        '''
+        Texto del estado ( Pendiente, Pagada o Cancelada )
+        '''
+        return ESTADOS_FACTURA[self.codigo_estado]
+
+    @estado.setter
+    def estado(self, texto: str):
+        self.codigo_estado = EstadoFactura.desde_texto(texto)
+
+    @property
+    def fecha_emision(self) -> str:
+        '''
+        Fecha de emision en formato "dd/mm/aaaa"
+        '''
+        return ordinal_a_fecha(self.fecha_emision_ordinal)
+
+    @fecha_emision.setter
+    def fecha_emision(self, texto: str):
+        self.fecha_emision_ordinal = fecha_a_ordinal(texto)
+
     def to_dict(self) -> dict:
         '''
         Convierte la factura a diccionario JSON
         '''
-        
+
         return {
             'numero_factura': self.numero_factura,
             'id_cliente': self.id_cliente,
@@ -105,21 +297,39 @@ class Factura:
             'fecha_emision': self.fecha_emision,
             'estado': self.estado
         }
-        
+
     @classmethod
     def from_dict(cls, data: dict):
         '''
         Crea la factura desde el diccionario
         '''
-        
+
         factura = cls(
             data['id_cliente'],
             data['descripcion'],
             data['monto']
         )
-        
+
         factura.numero_factura = data['numero_factura']
-        factura.fecha_emision = data.get('fecha_emision', factura.fecha_emision)
+        if 'fecha_emision' in data:
+            factura.fecha_emision = data['fecha_emision']
         factura.estado = data.get('estado', 'Pendiente')
-        
-        return factura
\ No newline at end of file
+
+        return factura
+
+    @classmethod
+    def desde_valores(cls, numero_factura: str, id_cliente: str, descripcion: str, monto: float,
+                      fecha_emision_ordinal: int, codigo_estado: EstadoFactura) -> 'Factura':
+        '''
+        Crea la factura directamente desde sus campos ya validados ( sin pasar
+        por __init__ ni convertir fechas ), para cargas masivas
+        '''
+
+        factura = cls.__new__(cls)
+        factura.numero_factura = numero_factura
+        factura.id_cliente = sys.intern(id_cliente)
+        factura.descripcion = descripcion
+        factura.monto = monto
+        factura.fecha_emision_ordinal = fecha_emision_ordinal
+        factura.codigo_estado = codigo_estado
+        return factura
@@ -0,0 +1,120 @@
+import sys
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Optional
+
+
+class Paginador:
+    '''
+    Muestra listados por paginas escribiendo cada pagina de una sola vez
+
+    Los registros llegan como bloques de texto ya formateados ( con saltos
+    de linea ) y se agrupan en paginas de tam_pagina registros
+    '''
+
+    def __init__(self, tam_pagina: int = 20, salida=None):
+        '''
+        Args:
+        tam_pagina : registros por pagina
+        salida : flujo donde se escribe ( por defecto sys.stdout )
+        '''
+
+        self.tam_pagina = max(1, tam_pagina)
+        self.salida = salida
+
+    def _escribir(self, texto: str):
+        salida = self.salida if self.salida is not None else sys.stdout
+        salida.write(texto)
+        salida.flush()
+
+    def exportar(self, bloques: Iterable[str], ruta: str) -> int:
+        '''
+        Escribe todos los registros en un archivo, una pagina por escritura
+
+        returns:
+        Numero de registros escritos
+        '''
+
+        iterador = iter(bloques)
+        escritos = 0
+
+        with open(ruta, 'w', encoding='utf-8') as f:
+            while True:
+                pagina = list(islice(iterador, self.tam_pagina))
+                if not pagina:
+                    break
+                f.write("".join(pagina))
+                escritos += len(pagina)
+
+        return escritos
+
+    def mostrar(self, bloques: Iterable[str], total: Optional[int] = None):
+        '''
+        Muestra los registros pagina a pagina con navegacion
+
+        Ordenes: Enter/s siguiente, a anterior, numero ir a pagina,
+        e exportar a archivo, q salir. Si todo cabe en una pagina se
+        muestra sin preguntar
+
+        Args:
+        bloques : registros formateados
+        total : numero total de registros si se conoce ( para el pie )
+        '''
+
+        iterador: Iterator[str] = iter(bloques)
+        paginas: List[List[str]] = []
+
+        def pagina(num: int) -> Optional[List[str]]:
+            #Construye las paginas bajo demanda y guarda las ya vistas
+            while len(paginas) <= num:
+                nueva = list(islice(iterador, self.tam_pagina))
+                if not nueva:
+                    return None
+                paginas.append(nueva)
+            return paginas[num]
+
+        actual = 0
+        if pagina(0) is None:
+            return
+
+        while True:
+            hay_siguiente = pagina(actual + 1) is not None
+
+            pie = ""
+            if hay_siguiente or actual > 0:
+                de_total = f" de {-(-total // self.tam_pagina)}" if total else ""
+                pie = f"\n-- Pagina {actual + 1}{de_total} --\n"
+
+            self._escribir("".join(paginas[actual]) + pie)
+
+            if not hay_siguiente and actual == 0:
+                return
+
+            orden = input("[Enter] siguiente  [a] anterior  [nº] ir a pagina  [e] exportar  [q] salir: ").strip().lower()
+
+            if orden in ("", "s"):
+                if not hay_siguiente:
+                    return
+                actual += 1
+
+            elif orden == "a":
+                actual = max(0, actual - 1)
+
+            elif orden == "q":
+                return
+
+            elif orden == "e":
+                ruta = input("Archivo de destino: ").strip()
+                if ruta:
+                    vistos = chain.from_iterable(paginas)
+                    escritos = self.exportar(chain(vistos, iterador), ruta)
+                    self._escribir(f"{escritos} registros exportados a {ruta}\n")
+                return
+
+            elif orden.isdigit() and int(orden) >= 1:
+                if pagina(int(orden) - 1) is not None:
+                    actual = int(orden) - 1
+                else:
+                    self._escribir("Esa pagina no existe\n")
+
+            else:
+                self._escribir("Orden no valida\n")
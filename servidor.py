@@ -0,0 +1,357 @@
+import asyncio
+import inspect
+import json
+from typing import Callable, Dict, Optional, Tuple
+from crm_system import CRMSystem
+from errores import ErrorNoEncontrado, ErrorValidacion
+from consultas import predicados_desde_filtros
+
+
+#Codigos de error JSON-RPC 2.0
+ERROR_PARSEO = -32700
+ERROR_PETICION = -32600
+ERROR_METODO = -32601
+ERROR_PARAMETROS = -32602
+ERROR_INTERNO = -32603
+ERROR_VALIDACION = -32000
+ERROR_NO_ENCONTRADO = -32001
+
+TAM_MAX_CUERPO = 16 * 1024 * 1024
+
+RAZONES = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class ErrorParametros(TypeError):
+    '''
+    Los params de la peticion no encajan con el metodo ( faltan, sobran o tienen otro tipo )
+    '''
+
+
+class ServidorCRM:
+    '''
+    Servidor HTTP local que expone la API del CRM mediante JSON-RPC 2.0
+
+    Acepta peticiones POST /rpc con un objeto JSON-RPC o una lista de ellos
+    ( lote ), que se responden en una sola respuesta. Las conexiones se
+    atienden con asyncio, asi varios clientes pueden estar conectados a la
+    vez; las operaciones se ejecutan de una en una en el bucle de eventos
+    '''
+
+    def __init__(self, crm: CRMSystem, host: str = "127.0.0.1", puerto: int = 8080):
+        '''
+        Args:
+        crm : sistema sobre el que se ejecutan las operaciones
+        host : direccion donde se escucha ( por defecto solo local )
+        puerto : puerto TCP
+        '''
+
+        self.crm = crm
+        self.host = host
+        self.puerto = puerto
+        self.metodos: Dict[str, Callable] = {
+            'alta_cliente': self._alta_cliente,
+            'buscar_cliente_email': self._buscar_cliente_email,
+            'buscar_clientes_nombre': self._buscar_clientes_nombre,
+            'obtener_cliente': self._obtener_cliente,
+            'emitir_factura': self._emitir_factura,
+            'cambiar_estado_factura': self._cambiar_estado_factura,
+            'facturas_cliente': self._facturas_cliente,
+            'resumen_cliente': self._resumen_cliente,
+            'resumen': self._resumen,
+            'agrupar_facturas': self._agrupar_facturas,
+            'facturas_entre': self._facturas_entre,
+            'ingresos_periodo': self._ingresos_periodo,
+            'antiguedad_pendientes': self._antiguedad_pendientes,
+            'top_clientes': self._top_clientes,
+            'facturas_estado': self._facturas_estado,
+            'consultar': self._consultar,
+        }
+        self._firmas: Dict[Callable, inspect.Signature] = {}
+        self._servidor: Optional[asyncio.AbstractServer] = None
+
+    #Metodos expuestos ( reciben parametros con nombre y devuelven datos JSON )
+
+    def _alta_cliente(self, nombre, apellidos, email, telefono="", direccion=""):
+        return self.crm.alta_cliente(nombre, apellidos, email, telefono, direccion).to_dict()
+
+    def _buscar_cliente_email(self, email):
+        cliente = self.crm.buscar_por_email(email)
+        if cliente is None:
+            raise ErrorNoEncontrado(f"no hay ningun cliente con el email {email}")
+        return cliente.to_dict()
+
+    def _buscar_clientes_nombre(self, texto, limite=20):
+        return [cliente.to_dict() for cliente in self.crm.buscar_por_nombre(texto, limite)]
+
+    def _obtener_cliente(self, id_cliente):
+        return self.crm.obtener_cliente(id_cliente).to_dict()
+
+    def _emitir_factura(self, id_cliente, descripcion, monto, estado="Pendiente"):
+        return self.crm.emitir_factura(id_cliente, descripcion, monto, estado).to_dict()
+
+    def _cambiar_estado_factura(self, numero_factura, estado):
+        if not isinstance(numero_factura, str):
+            raise ErrorParametros("numero_factura debe ser un texto")
+        numero_factura = numero_factura.strip().upper()
+        self.crm.actualizar_estado_factura(numero_factura, estado)
+        return self.crm.facturas[numero_factura].to_dict()
+
+    def _facturas_cliente(self, id_cliente):
+        return [factura.to_dict() for factura in self.crm.facturas_de_cliente(id_cliente)]
+
+    def _resumen_cliente(self, id_cliente):
+        return self.crm.resumen_cliente(id_cliente).to_dict()
+
+    def _resumen(self):
+        return self.crm.resumen_sistema()
+
+    def _agrupar_facturas(self, por="cliente"):
+        try:
+            grupos = self.crm.agrupar_facturas(por)
+        except ValueError as e:
+            raise ErrorValidacion(str(e))
+        return {clave: totales.to_dict() for clave, totales in grupos.items()}
+
+    def _facturas_entre(self, desde=None, hasta=None):
+        return [factura.to_dict() for factura in self.crm.facturas_entre(desde, hasta)]
+
+    def _ingresos_periodo(self, periodo="mes", desde=None, hasta=None):
+        informe = self.crm.ingresos_por_periodo(periodo, desde, hasta)
+        return {clave: {estado: totales.to_dict() for estado, totales in por_estado.items()}
+                for clave, por_estado in informe.items()}
+
+    def _antiguedad_pendientes(self, fecha=None):
+        return {tramo: totales.to_dict() for tramo, totales in self.crm.antiguedad_pendientes(fecha).items()}
+
+    def _top_clientes(self, metrica="total", n=10):
+        return [dict(totales.to_dict(), id_cliente=cliente.id_cliente,
+                     nombre=f"{cliente.nombre} {cliente.apellidos}")
+                for cliente, totales in self.crm.top_clientes(metrica, n)]
+
+    def _facturas_estado(self, estado="Pendiente", orden="fecha", dias_minimos=0):
+        return [factura.to_dict() for factura in self.crm.facturas_por_estado(estado, orden, dias_minimos)]
+
+    def _consultar(self, entidad="facturas", filtros=None, agrupar=None, limite=None, explicar=False):
+        if filtros is not None and not isinstance(filtros, dict):
+            raise ErrorValidacion("filtros debe ser un objeto")
+        consulta = self.crm.consultar(*predicados_desde_filtros(filtros or {}), entidad=entidad)
+
+        if agrupar:
+            respuesta = {'grupos': {clave: totales.to_dict() for clave, totales in consulta.agrupar(agrupar).items()}}
+        else:
+            registros = consulta.resultados()
+            respuesta = {'total': len(registros),
+                         'resultados': [registro.to_dict() for registro in registros[:limite or None]]}
+        if explicar:
+            respuesta['plan'] = consulta.explicar()
+        return respuesta
+
+    #Protocolo JSON-RPC
+
+    @staticmethod
+    def _error(id_peticion, codigo: int, mensaje: str) -> dict:
+        return {'jsonrpc': "2.0", 'error': {'code': codigo, 'message': mensaje}, 'id': id_peticion}
+
+    def _enlazar(self, metodo: Callable, parametros) -> inspect.BoundArguments:
+        '''
+        Asocia los params de la peticion ( objeto o lista ) a los argumentos del metodo
+
+        Raises:
+        ErrorParametros si los params no encajan con la firma del metodo
+        '''
+
+        firma = self._firmas.get(metodo)
+        if firma is None:
+            firma = self._firmas[metodo] = inspect.signature(metodo)
+
+        try:
+            if isinstance(parametros, dict):
+                return firma.bind(**parametros)
+            if isinstance(parametros, list):
+                return firma.bind(*parametros)
+        except TypeError as e:
+            raise ErrorParametros(str(e)) from None
+        raise ErrorParametros("params debe ser un objeto o una lista")
+
+    def ejecutar_peticion(self, peticion) -> Optional[dict]:
+        '''
+        Ejecuta una peticion JSON-RPC individual
+
+        returns:
+        La respuesta, o None si la peticion es una notificacion ( sin id )
+        '''
+
+        if not isinstance(peticion, dict) or peticion.get('jsonrpc') != "2.0" \
+                or not isinstance(peticion.get('method'), str):
+            return self._error(None, ERROR_PETICION, "peticion no valida")
+
+        id_peticion = peticion.get('id')
+        notificacion = 'id' not in peticion
+        metodo = self.metodos.get(peticion['method'])
+        parametros = peticion.get('params', {})
+
+        if metodo is None:
+            respuesta = self._error(id_peticion, ERROR_METODO, f"metodo no encontrado: {peticion['method']}")
+        else:
+            try:
+                argumentos = self._enlazar(metodo, parametros)
+                resultado = metodo(*argumentos.args, **argumentos.kwargs)
+                respuesta = {'jsonrpc': "2.0", 'result': resultado, 'id': id_peticion}
+
+            except ErrorValidacion as e:
+                respuesta = self._error(id_peticion, ERROR_VALIDACION, str(e))
+            except ErrorNoEncontrado as e:
+                respuesta = self._error(id_peticion, ERROR_NO_ENCONTRADO, str(e))
+            except ErrorParametros as e:
+                respuesta = self._error(id_peticion, ERROR_PARAMETROS, f"parametros no validos: {e}")
+            except Exception as e:
+                respuesta = self._error(id_peticion, ERROR_INTERNO, f"error interno: {e}")
+
+        return None if notificacion else respuesta
+
+    def procesar(self, cuerpo: bytes) -> Optional[str]:
+        '''
+        Procesa el cuerpo de una peticion ( individual o en lote )
+
+        returns:
+        Texto JSON de la respuesta, o None si no hay nada que responder
+        '''
+
+        try:
+            peticion = json.loads(cuerpo)
+        except ValueError:
+            return json.dumps(self._error(None, ERROR_PARSEO, "JSON no valido"))
+
+        #Traemos lo que hayan guardado otros procesos ( solo si cambio algo )
+        try:
+            self.crm.sincronizar()
+        except Exception as e:
+            id_peticion = peticion.get('id') if isinstance(peticion, dict) else None
+            return json.dumps(self._error(id_peticion, ERROR_INTERNO, f"error al sincronizar los datos: {e}"),
+                              ensure_ascii=False)
+
+        if isinstance(peticion, list):
+            if not peticion:
+                return json.dumps(self._error(None, ERROR_PETICION, "lote vacio"))
+            respuestas = [r for r in map(self.ejecutar_peticion, peticion) if r is not None]
+            return json.dumps(respuestas, ensure_ascii=False) if respuestas else None
+
+        respuesta = self.ejecutar_peticion(peticion)
+        return json.dumps(respuesta, ensure_ascii=False) if respuesta is not None else None
+
+    #HTTP
+
+    @staticmethod
+    async def _leer_peticion(lector: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        '''
+        Lee una peticion HTTP/1.1
+
+        returns:
+        Tupla (metodo, ruta, cabeceras, cuerpo) o None si el cliente cerro la conexion
+        '''
+
+        linea = await lector.readline()
+        if not linea.strip():
+            return None
+
+        partes = linea.decode('latin-1').split()
+        if len(partes) != 3:
+            raise ValueError("linea de peticion no valida")
+        metodo, ruta, _ = partes
+
+        cabeceras: Dict[str, str] = {}
+        while True:
+            linea = await lector.readline()
+            if linea in (b"\r\n", b"\n", b""):
+                break
+            nombre, _, valor = linea.decode('latin-1').partition(":")
+            cabeceras[nombre.strip().lower()] = valor.strip()
+
+        longitud = int(cabeceras.get('content-length', 0))
+        if longitud > TAM_MAX_CUERPO:
+            raise OverflowError("cuerpo demasiado grande")
+        cuerpo = await lector.readexactly(longitud) if longitud else b""
+
+        return metodo, ruta, cabeceras, cuerpo
+
+    @staticmethod
+    def _respuesta_http(estado: int, cuerpo: str = "", cerrar: bool = False) -> bytes:
+        datos = cuerpo.encode('utf-8')
+        cabeceras = [f"HTTP/1.1 {estado} {RAZONES.get(estado, '')}",
+                     "Content-Type: application/json; charset=utf-8",
+                     f"Content-Length: {len(datos)}",
+                     f"Connection: {'close' if cerrar else 'keep-alive'}"]
+        return ("\r\n".join(cabeceras) + "\r\n\r\n").encode('latin-1') + datos
+
+    async def _atender(self, lector: asyncio.StreamReader, escritor: asyncio.StreamWriter):
+        '''
+        Atiende una conexion ( admite varias peticiones seguidas con keep-alive )
+        '''
+
+        try:
+            while True:
+                try:
+                    peticion = await self._leer_peticion(lector)
+                except OverflowError:
+                    escritor.write(self._respuesta_http(413, cerrar=True))
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    escritor.write(self._respuesta_http(400, cerrar=True))
+                    break
+
+                if peticion is None:
+                    break
+
+                metodo, ruta, cabeceras, cuerpo = peticion
+                cerrar = cabeceras.get('connection', "").lower() == "close"
+
+                if ruta == "/salud" and metodo == "GET":
+                    respuesta = self._respuesta_http(200, json.dumps({'estado': "ok"}), cerrar)
+                elif ruta != "/rpc":
+                    respuesta = self._respuesta_http(404, cerrar=cerrar)
+                elif metodo != "POST":
+                    respuesta = self._respuesta_http(405, cerrar=cerrar)
+                else:
+                    texto = self.procesar(cuerpo)
+                    respuesta = self._respuesta_http(200 if texto is not None else 204, texto or "", cerrar)
+
+                escritor.write(respuesta)
+                await escritor.drain()
+
+                if cerrar:
+                    break
+
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+    async def iniciar(self):
+        '''
+        Empieza a escuchar conexiones ( no bloquea )
+        '''
+
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+
+    async def servir(self):
+        '''
+        Escucha conexiones hasta que se cancele la tarea
+        '''
+
+        if self._servidor is None:
+            await self.iniciar()
+
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    async def detener(self):
+        '''
+        Deja de aceptar conexiones
+        '''
+
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
@@ -0,0 +1,484 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Iterator, List, MutableMapping, Optional, Tuple
+from models import Cliente, Factura, EstadoFactura
+from indices import IndiceEmail
+
+
+#Cabecera: magia, version, reservado, num_clientes, num_facturas,
+#contador_clientes, contador_facturas, crc32 del cuerpo
+MAGIA = b"CRMSNAP\0"
+VERSION = 1
+CABECERA = struct.Struct("<8sHHQQQQI")
+
+#Registro de cliente: longitud del resto del registro, fecha de registro ( ordinal )
+#y longitudes en caracteres de id, nombre, apellidos, email, telefono, direccion y
+#un ultimo campo reservado; despues el texto UTF-8 de todos los campos. El campo
+#reservado guardaba la lista de facturas del cliente: ahora se escribe vacio y se
+#ignora al leer, la relacion sale de las propias facturas
+REGISTRO_CLIENTE = struct.Struct("<IiIIIIIII")
+
+#Registro de factura: longitud del resto, fecha de emision ( ordinal ), monto,
+#codigo de estado y longitudes de numero, id de cliente y descripcion; despues el texto
+REGISTRO_FACTURA = struct.Struct("<IidBIII")
+
+_LONGITUD = struct.Struct("<I")
+_ESTADOS = tuple(EstadoFactura)
+
+#Indice de desplazamientos ( archivo .idx junto al snapshot ): cabecera con el crc
+#del snapshot al que corresponde y tres tablas de claves ( clientes, facturas y
+#emails ). Cada tabla: numero de entradas, entradas (valor, inicio, longitud de la
+#clave) en orden de archivo, posiciones de las entradas ordenadas por clave y el
+#texto UTF-8 de las claves
+MAGIA_INDICE = b"CRMIDX\0\0"
+CABECERA_INDICE = struct.Struct("<8sHHI")
+ENTRADA = struct.Struct("<QII")
+_CONTADOR = struct.Struct("<Q")
+_POSICION = struct.Struct("<I")
+
+
+class ErrorSnapshot(ValueError):
+    '''
+    El archivo no es un snapshot valido ( formato, version o checksum )
+    '''
+
+
+def _registro(estructura: struct.Struct, campos: tuple, textos: tuple) -> bytes:
+    '''
+    Codifica un registro: cabecera fija con las longitudes de los textos y el texto unido
+    '''
+
+    texto = "".join(textos).encode('utf-8')
+    longitud = estructura.size - _LONGITUD.size + len(texto)
+    return estructura.pack(longitud, *campos, *map(len, textos)) + texto
+
+
+def _codificar_cliente(cliente: Cliente) -> bytes:
+    textos = (cliente.id_cliente, cliente.nombre, cliente.apellidos, cliente.email,
+              cliente.telefono, cliente.direccion, "")
+    return _registro(REGISTRO_CLIENTE, (cliente.fecha_registro_ordinal,), textos)
+
+
+def _codificar_factura(factura: Factura) -> bytes:
+    textos = (factura.numero_factura, factura.id_cliente, factura.descripcion)
+    return _registro(REGISTRO_FACTURA, (factura.fecha_emision_ordinal, factura.monto,
+                                        int(factura.codigo_estado)), textos)
+
+
+def guardar_snapshot(ruta: str, clientes, facturas, contador_clientes: int, contador_facturas: int):
+    '''
+    Escribe el snapshot binario y su indice de desplazamientos de forma
+    atomica ( temporal y renombrado )
+
+    Args:
+    ruta : archivo de destino ( el indice se guarda en ruta + ".idx" )
+    clientes, facturas : mapeos ID -> objeto
+    contador_clientes, contador_facturas : siguientes contadores de IDs
+    '''
+
+    temporal = ruta + ".tmp"
+    crc = 0
+    posicion = CABECERA.size
+
+    #Desplazamientos de cada registro y claves para el indice
+    claves: List[List[str]] = [[], []]
+    desplazamientos = [array('Q'), array('Q')]
+    emails: List[str] = []
+
+    with open(temporal, 'wb') as f:
+        #La cabecera se reescribe al final con el checksum
+        f.write(CABECERA.pack(MAGIA, VERSION, 0, len(clientes), len(facturas),
+                              contador_clientes, contador_facturas, 0))
+
+        for tabla, codificar, registros in ((0, _codificar_cliente, clientes), (1, _codificar_factura, facturas)):
+            bloque = []
+            for clave, objeto in registros.items():
+                registro = codificar(objeto)
+                bloque.append(registro)
+                claves[tabla].append(clave)
+                desplazamientos[tabla].append(posicion)
+                posicion += len(registro)
+                if tabla == 0:
+                    emails.append(IndiceEmail.normalizar(objeto.email))
+
+                if len(bloque) >= 4096:
+                    datos = b"".join(bloque)
+                    crc = zlib.crc32(datos, crc)
+                    f.write(datos)
+                    bloque = []
+            datos = b"".join(bloque)
+            crc = zlib.crc32(datos, crc)
+            f.write(datos)
+
+        f.seek(0)
+        f.write(CABECERA.pack(MAGIA, VERSION, 0, len(clientes), len(facturas),
+                              contador_clientes, contador_facturas, crc))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporal, ruta)
+    guardar_indice(ruta + ".idx", crc, claves[0], desplazamientos[0], claves[1], desplazamientos[1], emails)
+
+
+def _tabla_claves(claves: List[str], valores) -> bytes:
+    '''
+    Codifica una tabla de claves del indice ( ver MAGIA_INDICE )
+    '''
+
+    codificadas = [clave.encode('utf-8') for clave in claves]
+    partes = [_CONTADOR.pack(len(claves))]
+    inicio = 0
+    for codificada, valor in zip(codificadas, valores):
+        partes.append(ENTRADA.pack(valor, inicio, len(codificada)))
+        inicio += len(codificada)
+
+    orden = array('I', sorted(range(len(codificadas)), key=codificadas.__getitem__))
+    if sys.byteorder == "big":
+        orden.byteswap()
+    partes.append(orden.tobytes())
+    partes += codificadas
+    return b"".join(partes)
+
+
+def guardar_indice(ruta: str, crc: int, ids_clientes: List[str], desplazamientos_clientes,
+                   numeros_facturas: List[str], desplazamientos_facturas, emails: List[str]):
+    '''
+    Escribe el indice de desplazamientos de un snapshot
+
+    Args:
+    ruta : archivo del indice
+    crc : checksum del snapshot al que corresponde
+    ids_clientes, numeros_facturas : claves en orden de archivo
+    desplazamientos_clientes, desplazamientos_facturas : byte de inicio de cada registro
+    emails : email normalizado de cada cliente ( en el mismo orden )
+    '''
+
+    temporal = ruta + ".tmp"
+    with open(temporal, 'wb') as f:
+        f.write(CABECERA_INDICE.pack(MAGIA_INDICE, VERSION, 0, crc))
+        f.write(_tabla_claves(ids_clientes, desplazamientos_clientes))
+        f.write(_tabla_claves(numeros_facturas, desplazamientos_facturas))
+        #En la tabla de emails el valor es la posicion del cliente en su tabla
+        f.write(_tabla_claves(emails, range(len(emails))))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporal, ruta)
+
+
+def leer_cabecera(ruta: str) -> Tuple[int, int, int, int]:
+    '''
+    Lee solo la cabecera del snapshot
+
+    returns:
+    Tupla (num_clientes, num_facturas, contador_clientes, contador_facturas)
+
+    Raises:
+    ErrorSnapshot si no es un snapshot de una version conocida
+    '''
+
+    with open(ruta, 'rb') as f:
+        return _validar_cabecera(f.read(CABECERA.size))[:4]
+
+
+def _validar_cabecera(datos: bytes) -> Tuple[int, int, int, int, int]:
+    if len(datos) < CABECERA.size:
+        raise ErrorSnapshot("snapshot incompleto")
+
+    magia, version, _, num_clientes, num_facturas, contador_clientes, contador_facturas, crc = \
+        CABECERA.unpack_from(datos)
+
+    if magia != MAGIA:
+        raise ErrorSnapshot("no es un snapshot del CRM")
+    if version != VERSION:
+        raise ErrorSnapshot(f"version de snapshot no soportada: {version}")
+
+    return num_clientes, num_facturas, contador_clientes, contador_facturas, crc
+
+
+def _decodificar_cliente(datos, posicion: int) -> Tuple[Cliente, int]:
+    '''
+    Decodifica el registro de cliente que empieza en la posicion
+
+    returns:
+    Tupla (cliente, posicion del siguiente registro)
+    '''
+
+    longitud, fecha, l_id, l_nom, l_ape, l_ema, l_tel, l_dir, _ = REGISTRO_CLIENTE.unpack_from(datos, posicion)
+    siguiente = posicion + _LONGITUD.size + longitud
+    texto = str(datos[posicion + REGISTRO_CLIENTE.size:siguiente], 'utf-8')
+
+    a = l_id
+    b = a + l_nom
+    c = b + l_ape
+    d = c + l_ema
+    e = d + l_tel
+    g = e + l_dir
+
+    cliente = Cliente.desde_valores(texto[:a], texto[a:b], texto[b:c], texto[c:d], texto[d:e], texto[e:g], fecha)
+    return cliente, siguiente
+
+
+def _decodificar_factura(datos, posicion: int) -> Tuple[Factura, int]:
+    '''
+    Decodifica el registro de factura que empieza en la posicion
+
+    returns:
+    Tupla (factura, posicion del siguiente registro)
+    '''
+
+    longitud, fecha, monto, estado, l_num, l_cli, l_des = REGISTRO_FACTURA.unpack_from(datos, posicion)
+    siguiente = posicion + _LONGITUD.size + longitud
+    texto = str(datos[posicion + REGISTRO_FACTURA.size:siguiente], 'utf-8')
+
+    b = l_num + l_cli
+    factura = Factura.desde_valores(texto[:l_num], texto[l_num:b], texto[b:b + l_des], monto, fecha,
+                                    _ESTADOS[estado])
+    return factura, siguiente
+
+
+def _leer_snapshot(ruta: str) -> Tuple[memoryview, tuple]:
+    '''
+    Lee el snapshot completo comprobando cabecera y checksum
+
+    returns:
+    Tupla (vista de los datos, campos de la cabecera)
+    '''
+
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+
+    cabecera = _validar_cabecera(datos)
+    vista = memoryview(datos)
+
+    if zlib.crc32(vista[CABECERA.size:]) != cabecera[4]:
+        vista.release()
+        raise ErrorSnapshot("checksum incorrecto, el snapshot esta dañado")
+
+    return vista, cabecera
+
+
+def comprobar_snapshot(ruta: str):
+    '''
+    Comprueba la cabecera y el checksum de un snapshot sin decodificar sus registros
+
+    Raises:
+    ErrorSnapshot si el archivo esta dañado o es de otra version
+    '''
+
+    vista, _ = _leer_snapshot(ruta)
+    vista.release()
+
+
+def cargar_snapshot(ruta: str, clientes: MutableMapping[str, Cliente],
+                    facturas: MutableMapping[str, Factura]) -> Tuple[int, int]:
+    '''
+    Carga un snapshot binario en los mapeos indicados
+
+    Cada registro se decodifica con una sola lectura de su cabecera y una
+    sola decodificacion UTF-8; los objetos se crean sin convertir fechas
+
+    returns:
+    Tupla (contador_clientes, contador_facturas) guardada en la cabecera
+
+    Raises:
+    ErrorSnapshot si el archivo esta dañado o es de otra version
+    '''
+
+    vista, (num_clientes, num_facturas, contador_clientes, contador_facturas, _) = _leer_snapshot(ruta)
+    posicion = CABECERA.size
+
+    try:
+        for _ in range(num_clientes):
+            cliente, posicion = _decodificar_cliente(vista, posicion)
+            clientes[cliente.id_cliente] = cliente
+
+        for _ in range(num_facturas):
+            factura, posicion = _decodificar_factura(vista, posicion)
+            facturas[factura.numero_factura] = factura
+
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ErrorSnapshot(f"registro dañado en el byte {posicion}: {e}") from None
+
+    finally:
+        vista.release()
+
+    return contador_clientes, contador_facturas
+
+
+def construir_indice(ruta: str):
+    '''
+    Regenera el indice de desplazamientos recorriendo un snapshot existente
+
+    Raises:
+    ErrorSnapshot si el snapshot esta dañado
+    '''
+
+    vista, (num_clientes, num_facturas, _, _, crc) = _leer_snapshot(ruta)
+    posicion = CABECERA.size
+    ids, desplazamientos_clientes, emails = [], array('Q'), []
+    numeros, desplazamientos_facturas = [], array('Q')
+
+    try:
+        for _ in range(num_clientes):
+            desplazamientos_clientes.append(posicion)
+            cliente, posicion = _decodificar_cliente(vista, posicion)
+            ids.append(cliente.id_cliente)
+            emails.append(IndiceEmail.normalizar(cliente.email))
+
+        for _ in range(num_facturas):
+            desplazamientos_facturas.append(posicion)
+            factura, posicion = _decodificar_factura(vista, posicion)
+            numeros.append(factura.numero_factura)
+
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ErrorSnapshot(f"registro dañado en el byte {posicion}: {e}") from None
+
+    finally:
+        vista.release()
+
+    guardar_indice(ruta + ".idx", crc, ids, desplazamientos_clientes, numeros, desplazamientos_facturas, emails)
+
+
+class TablaClaves:
+    '''
+    Tabla de claves del indice leida directamente del archivo mapeado
+
+    Las busquedas son binarias sobre las posiciones ordenadas, asi que no
+    hace falta crear ningun diccionario con todas las claves
+    '''
+
+    def __init__(self, datos, inicio: int):
+        '''
+        Args:
+        datos : contenido mapeado del indice
+        inicio : byte donde empieza la tabla
+        '''
+
+        self.datos = datos
+        (self.total,) = _CONTADOR.unpack_from(datos, inicio)
+        self.entradas = inicio + _CONTADOR.size
+        self.orden = self.entradas + self.total * ENTRADA.size
+        self.claves = self.orden + self.total * _POSICION.size
+
+        #Fin de la tabla: inicio de la ultima clave mas su longitud
+        self.fin = self.claves
+        if self.total:
+            _, ultima, longitud = ENTRADA.unpack_from(datos, self.entradas + (self.total - 1) * ENTRADA.size)
+            self.fin += ultima + longitud
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _clave_bytes(self, i: int) -> bytes:
+        _, inicio, longitud = ENTRADA.unpack_from(self.datos, self.entradas + i * ENTRADA.size)
+        return self.datos[self.claves + inicio:self.claves + inicio + longitud]
+
+    def clave(self, i: int) -> str:
+        return self._clave_bytes(i).decode('utf-8')
+
+    def valor(self, i: int) -> int:
+        return ENTRADA.unpack_from(self.datos, self.entradas + i * ENTRADA.size)[0]
+
+    def buscar(self, clave: str) -> Optional[int]:
+        '''
+        Posicion de la entrada con esa clave ( en orden de archivo ) o None
+        '''
+
+        buscada = clave.encode('utf-8')
+        bajo, alto = 0, self.total
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            (i,) = _POSICION.unpack_from(self.datos, self.orden + medio * _POSICION.size)
+            actual = self._clave_bytes(i)
+            if actual == buscada:
+                return i
+            if actual < buscada:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return None
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.total):
+            yield self.clave(i)
+
+
+class SnapshotMapeado:
+    '''
+    Snapshot binario mapeado en memoria con su indice de desplazamientos
+
+    Abrirlo solo lee las cabeceras: los registros se decodifican cuando se
+    piden, por lo que el coste no depende del tamaño de los datos
+    '''
+
+    def __init__(self, ruta: str):
+        '''
+        Args:
+        ruta : snapshot binario ( el indice es ruta + ".idx" )
+
+        Raises:
+        ErrorSnapshot si falta el indice o no corresponde al snapshot
+        '''
+
+        self.ruta = ruta
+        self._archivos = []
+
+        try:
+            self.datos = self._mapear(ruta)
+            self.num_clientes, self.num_facturas, self.contador_clientes, self.contador_facturas, crc = \
+                _validar_cabecera(self.datos)
+
+            try:
+                indice = self._mapear(ruta + ".idx")
+            except (OSError, ValueError) as e:
+                raise ErrorSnapshot(f"no se puede abrir el indice: {e}") from None
+
+            magia, version, _, crc_indice = CABECERA_INDICE.unpack_from(indice) \
+                if len(indice) >= CABECERA_INDICE.size else (None, None, None, None)
+            if magia != MAGIA_INDICE or version != VERSION:
+                raise ErrorSnapshot("el indice no es valido")
+            if crc_indice != crc:
+                raise ErrorSnapshot("el indice no corresponde al snapshot")
+
+            self.clientes = TablaClaves(indice, CABECERA_INDICE.size)
+            self.facturas = TablaClaves(indice, self.clientes.fin)
+            self.emails = TablaClaves(indice, self.facturas.fin)
+
+            if len(self.clientes) != self.num_clientes or len(self.facturas) != self.num_facturas:
+                raise ErrorSnapshot("el indice no corresponde al snapshot")
+
+        except BaseException:
+            self.cerrar()
+            raise
+
+    def _mapear(self, ruta: str) -> mmap.mmap:
+        with open(ruta, 'rb') as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._archivos.append(mapa)
+        return mapa
+
+    def cliente(self, i: int) -> Cliente:
+        '''
+        Decodifica el cliente de la entrada i del indice
+        '''
+        return _decodificar_cliente(self.datos, self.clientes.valor(i))[0]
+
+    def factura(self, i: int) -> Factura:
+        '''
+        Decodifica la factura de la entrada i del indice
+        '''
+        return _decodificar_factura(self.datos, self.facturas.valor(i))[0]
+
+    def cerrar(self):
+        for mapa in self._archivos:
+            try:
+                mapa.close()
+            except BufferError:
+                #Aun hay vistas del mapa en uso; se libera al recolectarlas
+                pass
+        self._archivos = []
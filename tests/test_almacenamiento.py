@@ -0,0 +1,165 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from almacenamiento import AlmacenamientoJSON
+from almacenamiento_diferido import AlmacenamientoDiferido
+from almacenamiento_fragmentado import AlmacenamientoFragmentado
+from almacenamiento_mapeado import AlmacenamientoMapeado
+from almacenamiento_sqlite import AlmacenamientoSQLite
+from crm_system import CRMSystem
+
+
+def volcar_datos(crm: CRMSystem) -> tuple:
+    '''
+    Clientes y facturas del CRM como diccionarios comparables
+    '''
+
+    return ({id_cliente: cliente.to_dict() for id_cliente, cliente in crm.clientes.items()},
+            {numero: factura.to_dict() for numero, factura in crm.facturas.items()})
+
+
+class RecargaAlmacenamiento:
+    '''
+    Guardar -> volver a abrir -> comparar, comun a todos los backends
+
+    Cada backend hereda de esta clase y de unittest.TestCase e implementa crear_almacenamiento
+    '''
+
+    def crear_almacenamiento(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+
+    def ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def abrir(self) -> CRMSystem:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return CRMSystem(self.crear_almacenamiento())
+
+    def cerrar(self, crm: CRMSystem, compactar: bool = True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if compactar:
+                crm.cerrar()
+            else:
+                crm.almacenamiento.cerrar()
+
+    @staticmethod
+    def poblar(crm: CRMSystem):
+        ana = crm.alta_cliente("Ana", "Diaz", "ana@correo.com", "600123123", "Calle Mayor 1")
+        luis = crm.alta_cliente("Luis", "Paz", "luis@correo.com")
+        crm.emitir_factura(ana.id_cliente, "Consultoria", 1200.5)
+        factura = crm.emitir_factura(luis.id_cliente, "Soporte", 300)
+        crm.actualizar_estado_factura(factura.numero_factura, "Pagada")
+        crm.actualizar_email_cliente(luis.id_cliente, "luis.paz@correo.com")
+
+    def comprobar_recarga(self, compactar: bool):
+        crm = self.abrir()
+        self.poblar(crm)
+        esperado = volcar_datos(crm)
+        self.cerrar(crm, compactar)
+
+        crm = self.abrir()
+        self.addCleanup(self.cerrar, crm)
+        self.assertIsNone(crm.error_carga)
+        self.assertEqual(volcar_datos(crm), esperado)
+
+        #Los indices y contadores se reconstruyen con los datos recargados
+        self.assertIsNone(crm.buscar_por_email("luis@correo.com"))
+        self.assertEqual(crm.buscar_por_email("luis.paz@correo.com").nombre, "Luis")
+        self.assertEqual(crm.resumen_sistema()['total'], 1500.5)
+        nuevo = crm.alta_cliente("Eva", "Sol", "eva@correo.com")
+        self.assertNotIn(nuevo.id_cliente, esperado[0])
+
+    def test_recarga_tras_cerrar(self):
+        self.comprobar_recarga(compactar=True)
+
+    def test_recarga_sin_compactar(self):
+        self.comprobar_recarga(compactar=False)
+
+
+class PruebaAlmacenamientoJSON(RecargaAlmacenamiento, unittest.TestCase):
+
+    def crear_almacenamiento(self):
+        return AlmacenamientoJSON(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                  self.ruta("diario.jsonl"), fsync=False)
+
+
+class PruebaAlmacenamientoSQLite(RecargaAlmacenamiento, unittest.TestCase):
+
+    def crear_almacenamiento(self):
+        return AlmacenamientoSQLite(self.ruta("crm.db"))
+
+
+class PruebaSnapshotBinario(RecargaAlmacenamiento, unittest.TestCase):
+
+    def crear_almacenamiento(self):
+        return AlmacenamientoJSON(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                  self.ruta("diario.jsonl"), fsync=False, formato="binario")
+
+    def test_recarga_tras_cerrar(self):
+        super().test_recarga_tras_cerrar()
+        self.assertTrue(os.path.exists(self.ruta("crm.snap")))
+        self.assertFalse(os.path.exists(self.ruta("clientes.json")))
+
+
+
+class PruebaAlmacenamientoMapeado(RecargaAlmacenamiento, unittest.TestCase):
+
+    def crear_almacenamiento(self):
+        return AlmacenamientoMapeado(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                     self.ruta("diario.jsonl"), fsync=False)
+
+    def test_genera_el_snapshot_desde_json(self):
+        #Datos guardados con el backend JSON: el mapeado genera crm.snap la primera vez
+        crm = CRMSystem(AlmacenamientoJSON(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                           self.ruta("diario.jsonl"), fsync=False))
+        self.poblar(crm)
+        esperado = volcar_datos(crm)
+        self.cerrar(crm)
+
+        crm = self.abrir()
+        self.addCleanup(self.cerrar, crm)
+        self.assertTrue(os.path.exists(self.ruta("crm.snap")))
+        self.assertEqual(volcar_datos(crm), esperado)
+
+
+
+class PruebaAlmacenamientoFragmentado(RecargaAlmacenamiento, unittest.TestCase):
+
+    procesos = 1
+
+    def crear_almacenamiento(self):
+        return AlmacenamientoFragmentado(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                         self.ruta("diario.jsonl"), num_fragmentos=4, procesos=self.procesos,
+                                         fsync=False)
+
+    def test_recarga_tras_cerrar(self):
+        super().test_recarga_tras_cerrar()
+        self.assertTrue(os.listdir(self.ruta("fragmentos")))
+        self.assertFalse(os.path.exists(self.ruta("clientes.json")))
+
+
+class PruebaAlmacenamientoFragmentadoParalelo(PruebaAlmacenamientoFragmentado):
+
+    #Carga los fragmentos con el pool de procesos
+    procesos = 2
+
+
+
+class PruebaAlmacenamientoDiferido(RecargaAlmacenamiento, unittest.TestCase):
+
+    def crear_almacenamiento(self):
+        #Intervalo largo: solo se escribe al cerrar ( o al compactar )
+        interno = AlmacenamientoJSON(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                     self.ruta("diario.jsonl"), fsync=False)
+        return AlmacenamientoDiferido(interno, intervalo=60)
+
+
+if __name__ == "__main__":
+    unittest.main()
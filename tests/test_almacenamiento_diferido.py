@@ -0,0 +1,93 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from almacenamiento import AlmacenamientoJSON
+from almacenamiento_diferido import AlmacenamientoDiferido
+from crm_system import CRMSystem
+
+
+def esperar(condicion, limite: float = 5.0) -> bool:
+    '''
+    Espera hasta que se cumpla la condicion o pase el limite ( segundos )
+    '''
+
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class PruebaVolcadoFallido(unittest.TestCase):
+    '''
+    Un volcado que falla conserva los cambios y se reintenta con espera creciente
+    '''
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+        #Los avisos de volcado fallido no ensucian la salida de las pruebas
+        silencio = mock.patch('sys.stdout', new_callable=io.StringIO)
+        silencio.start()
+        self.addCleanup(silencio.stop)
+
+    def crear_interno(self) -> AlmacenamientoJSON:
+        return AlmacenamientoJSON(os.path.join(self.directorio, "clientes.json"),
+                                  os.path.join(self.directorio, "facturas.json"),
+                                  os.path.join(self.directorio, "diario.jsonl"), fsync=False)
+
+    def test_reintenta_con_espera_y_recupera(self):
+        interno = self.crear_interno()
+        fallos = mock.Mock(side_effect=OSError("disco lleno"))
+        guardar_lote = interno.guardar_lote
+        interno.guardar_lote = fallos
+
+        diferido = AlmacenamientoDiferido(interno, intervalo=0.05, umbral=1)
+        crm = CRMSystem(diferido)
+        self.addCleanup(diferido.cerrar)
+        cliente = crm.alta_cliente("Ana", "Diaz", "ana@correo.com")
+
+        #Con el umbral superado no se reintenta sin parar: 0.05 + 0.1 + 0.2 + 0.4 s
+        time.sleep(0.6)
+        self.assertGreaterEqual(fallos.call_count, 2)
+        self.assertLessEqual(fallos.call_count, 6)
+        self.assertEqual(diferido.pendientes, 1)
+        self.assertIsInstance(diferido.ultimo_error, OSError)
+
+        #Cuando el disco se recupera los cambios pendientes se escriben
+        interno.guardar_lote = guardar_lote
+        self.assertTrue(esperar(lambda: diferido.pendientes == 0))
+        diferido.cerrar()
+
+        crm = CRMSystem(self.crear_interno())
+        self.assertEqual(crm.clientes[cliente.id_cliente].email, "ana@correo.com")
+        crm.almacenamiento.cerrar()
+
+    def test_volcar_fallido_conserva_los_cambios_recientes(self):
+        interno = self.crear_interno()
+        diferido = AlmacenamientoDiferido(interno, intervalo=60, umbral=1000)
+        self.addCleanup(diferido.cerrar)
+        crm = CRMSystem(diferido)
+        cliente = crm.alta_cliente("Ana", "Diaz", "ana@correo.com")
+
+        with mock.patch.object(interno, "guardar_lote", side_effect=OSError("sin permisos")):
+            self.assertFalse(diferido.volcar())
+        self.assertEqual(diferido.pendientes, 1)
+
+        crm.actualizar_email_cliente(cliente.id_cliente, "ana.diaz@correo.com")
+        self.assertTrue(diferido.volcar())
+        self.assertEqual(diferido.pendientes, 0)
+        diferido.cerrar()
+
+        crm = CRMSystem(self.crear_interno())
+        self.assertEqual(crm.clientes[cliente.id_cliente].email, "ana.diaz@correo.com")
+        crm.almacenamiento.cerrar()
+
+
+if __name__ == "__main__":
+    unittest.main()
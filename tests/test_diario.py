@@ -0,0 +1,116 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from almacenamiento import AlmacenamientoJSON
+from crm_system import CRMSystem
+from diario import DiarioOperaciones
+from models import Cliente
+
+
+class PruebaDiarioCorrupto(unittest.TestCase):
+    '''
+    El diario descarta lineas corruptas y una carga fallida nunca sobrescribe los datos
+    '''
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+        self.ruta_diario = self.ruta("diario.jsonl")
+
+    def ruta(self, nombre: str) -> str:
+        return os.path.join(self.directorio, nombre)
+
+    def abrir(self, **opciones) -> CRMSystem:
+        almacenamiento = AlmacenamientoJSON(self.ruta("clientes.json"), self.ruta("facturas.json"),
+                                            self.ruta_diario, fsync=False, **opciones)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return CRMSystem(almacenamiento)
+
+    def escribir_en_diario(self, texto: str):
+        with open(self.ruta_diario, 'a', encoding='utf-8') as f:
+            f.write(texto)
+
+    def test_lineas_no_validas_se_descartan(self):
+        diario = DiarioOperaciones(self.ruta_diario, fsync=False)
+        diario.registrar("cliente", {'id_cliente': "USR000001"})
+        diario.cerrar()
+        self.escribir_en_diario('no es json\n[1, 2]\n"texto"\n{"op": "cliente"}\n{"op": 1, "datos": {}}\n')
+        diario.registrar("factura", {'numero_factura': "FAC000001"})
+        diario.cerrar()
+        self.escribir_en_diario('{"op": "cliente", "datos"')
+
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            operaciones = list(diario.leer())
+
+        self.assertEqual(operaciones, [("cliente", {'id_cliente': "USR000001"}),
+                                       ("factura", {'numero_factura': "FAC000001"})])
+        self.assertEqual(len(diario), 2)
+        self.assertEqual(salida.getvalue().count("se descarta"), 5)
+        #La ultima linea incompleta no se cuenta: la leera quien la termine
+        self.assertEqual(diario.posicion, os.path.getsize(self.ruta_diario) - len('{"op": "cliente", "datos"'))
+
+    def test_linea_no_valida_no_borra_los_datos_al_cerrar(self):
+        crm = self.abrir()
+        crm.alta_cliente("Ana", "Diaz", "ana@correo.com")
+        with contextlib.redirect_stdout(io.StringIO()):
+            crm.cerrar()
+
+        crm = self.abrir()
+        crm.alta_cliente("Luis", "Paz", "luis@correo.com")
+        crm.almacenamiento.cerrar()
+        self.escribir_en_diario("[1, 2]\n")
+
+        crm = self.abrir()
+        self.assertIsNone(crm.error_carga)
+        self.assertEqual(len(crm.clientes), 2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            crm.cerrar()
+
+        with open(self.ruta("clientes.json"), encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)), 2)
+        self.assertEqual(os.path.getsize(self.ruta_diario), 0)
+
+    def test_carga_fallida_no_compacta(self):
+        crm = self.abrir()
+        crm.alta_cliente("Ana", "Diaz", "ana@correo.com")
+        with contextlib.redirect_stdout(io.StringIO()):
+            crm.cerrar()
+        crm = self.abrir()
+        crm.alta_cliente("Luis", "Paz", "luis@correo.com")
+        crm.almacenamiento.cerrar()
+
+        with open(self.ruta("clientes.json"), 'rb') as f:
+            snapshot = f.read()
+        with open(self.ruta_diario, 'rb') as f:
+            diario = f.read()
+
+        with mock.patch.object(AlmacenamientoJSON, "_aplicar_diario", side_effect=RuntimeError("fallo simulado")):
+            crm = self.abrir(limite_diario=1)
+        self.assertEqual(crm.error_carga, "fallo simulado")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            #Ni la compactacion automatica del diario, ni guardar todo, ni cerrar tocan el snapshot
+            cliente = Cliente("Eva", "Sol", "eva@correo.com")
+            cliente.id_cliente = "USR000099"
+            crm.almacenamiento.guardar_cliente(cliente)
+            self.assertFalse(crm.guardar_datos())
+            crm.cerrar()
+
+        with open(self.ruta("clientes.json"), 'rb') as f:
+            self.assertEqual(f.read(), snapshot)
+        with open(self.ruta_diario, 'rb') as f:
+            self.assertTrue(f.read().startswith(diario))
+
+        crm = self.abrir()
+        self.assertEqual(sorted(crm.clientes), ["USR000001", "USR000002", "USR000099"])
+        crm.almacenamiento.cerrar()
+
+
+if __name__ == "__main__":
+    unittest.main()
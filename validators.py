@@ -1,4 +1,55 @@
+import math
 import re
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+from models import ESTADOS_FACTURA, fecha_a_ordinal
+
+
+#Patrones compilados una sola vez al importar el modulo
+PATRON_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$') #Con {2,} valida que la extension tenga 2 caracteres despues del correo (.com, .es ,etc)
+
+CAMPOS_CLIENTE = ("nombre", "apellidos", "email")
+CAMPOS_FACTURA = ("descripcion", "monto")
+
+
+class ResultadoLote:
+    '''
+    Resultado de validar un lote de registros
+    
+    validos : lista de (posicion en el lote, valores limpios)
+    errores : posicion en el lote -> {campo: motivo}
+    '''
+    
+    __slots__ = ('validos', 'errores')
+    
+    def __init__(self):
+        self.validos: List[Tuple[int, dict]] = []
+        self.errores: Dict[int, Dict[str, str]] = {}
+        
+    def motivo(self, posicion: int) -> str:
+        '''
+        Texto con todos los errores de un registro
+        '''
+        return "; ".join(f"{campo}: {mensaje}" for campo, mensaje in self.errores[posicion].items())
+
+
+def _texto(registro: dict, campo: str) -> str:
+    valor = registro.get(campo)
+    return str(valor).strip() if valor is not None else ""
+
+
+def _fecha(registro: dict, campo: str, limpio: dict, errores: dict):
+    '''
+    Valida una fecha opcional "dd/mm/aaaa" y guarda su ordinal ( o None ) en limpio
+    '''
+
+    texto = _texto(registro, campo)
+    limpio[campo] = None
+    if texto:
+        try:
+            limpio[campo] = fecha_a_ordinal(texto)
+        except ValueError:
+            errores[campo] = f"fecha no valida: {texto}"
+
 
 class Validador:
     '''
@@ -18,9 +69,7 @@ class Validador:
         True si el email es valido, false si no lo es 
         '''
         
-        patron = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$' #Con {2,} valida que la extension tenga 2 caracteres despues del correo (.com, .es ,etc)
-        
-        return re.match(patron,email) is not None
+        return PATRON_EMAIL.match(email) is not None
     
     @staticmethod
     
@@ -38,9 +87,9 @@ class Validador:
         
         try:
             monto = float(monto_str)
-            return monto > 0, monto
+            return monto > 0 and math.isfinite(monto), monto
         
-        except ValueError:
+        except (TypeError, ValueError):
             return False, 0.0  
         
         
@@ -59,8 +108,106 @@ class Validador:
         true si es valido, false si no
         '''
         
-        if not valor or valor.strip() == "":
+        if Validador.campo_vacio(valor):
             print(f"Error: {nombre_campo} no puede estar vacio")
             return False
         return True
+    
+    @staticmethod
+    
+    def campo_vacio(valor) -> bool:
+        '''
+        Comprueba sin mostrar nada si un campo obligatorio esta vacio
+        '''
+        
+        return valor is None or str(valor).strip() == ""
+    
+    @staticmethod
+    
+    def validar_lote_clientes(registros: Iterable[dict], email_existe: Callable[[str], bool] = None,
+                              emails_lote: Set[str] = None) -> ResultadoLote:
+        '''
+        Valida un lote de clientes sin imprimir nada
+        
+        Los campos obligatorios, el formato del email y los duplicados ( con
+        los clientes existentes y dentro del propio lote ) se comprueban en
+        una sola pasada
+        
+        Args:
+        registros : diccionarios con nombre, apellidos, email, telefono, direccion
+                    y fecha_registro ( opcional )
+        email_existe : funcion email -> bool que consulta los clientes existentes
+        emails_lote : emails normalizados ya aceptados; se actualiza con los nuevos
+                      ( pasar el mismo conjunto en todos los lotes de una importacion )
+        
+        returns:
+        ResultadoLote con los valores sin espacios de los registros validos
+        ( fecha_registro como ordinal o None )
+        '''
+        
+        resultado = ResultadoLote()
+        vistos = emails_lote if emails_lote is not None else set()
+        coincide = PATRON_EMAIL.match
+        
+        for posicion, registro in enumerate(registros):
+            limpio = {campo: _texto(registro, campo) for campo in CAMPOS_CLIENTE + ("telefono", "direccion")}
+            errores = {campo: "no puede estar vacio" for campo in CAMPOS_CLIENTE if not limpio[campo]}
+            _fecha(registro, "fecha_registro", limpio, errores)
+            
+            email = limpio["email"]
+            if email:
+                if coincide(email) is None:
+                    errores["email"] = "email no valido"
+                elif email.lower() in vistos:
+                    errores["email"] = "email repetido en el lote"
+                elif email_existe is not None and email_existe(email):
+                    errores["email"] = "el email ya existe"
+                    
+            if errores:
+                resultado.errores[posicion] = errores
+            else:
+                vistos.add(email.lower())
+                resultado.validos.append((posicion, limpio))
+                
+        return resultado
+    
+    @staticmethod
+    
+    def validar_lote_facturas(registros: Iterable[dict], estado_defecto: str = "Pendiente") -> ResultadoLote:
+        '''
+        Valida los campos de un lote de facturas sin imprimir nada
+        
+        Args:
+        registros : diccionarios con descripcion, monto, estado y fecha_emision ( opcionales )
+        estado_defecto : estado de las facturas que no lo indican
+        
+        returns:
+        ResultadoLote con descripcion, monto ( float ), estado y fecha_emision
+        ( ordinal o None ) de los registros validos
+        '''
+        
+        resultado = ResultadoLote()
+        estados = frozenset(ESTADOS_FACTURA)
+        
+        for posicion, registro in enumerate(registros):
+            descripcion = _texto(registro, "descripcion")
+            es_valido, monto = Validador.validar_monto(_texto(registro, "monto"))
+            estado = _texto(registro, "estado") or estado_defecto
+            
+            limpio = {'descripcion': descripcion, 'monto': monto, 'estado': estado}
+            errores = {}
+            if not descripcion:
+                errores["descripcion"] = "no puede estar vacio"
+            if not es_valido:
+                errores["monto"] = "monto no valido"
+            if estado not in estados:
+                errores["estado"] = f"estado no valido: {estado}"
+            _fecha(registro, "fecha_emision", limpio, errores)
+                
+            if errores:
+                resultado.errores[posicion] = errores
+            else:
+                resultado.validos.append((posicion, limpio))
+                
+        return resultado
     
\ No newline at end of file